@@ -1,5 +1,9 @@
-from pyrocko import autopick_ext
+from pyrocko import autopick_ext, trace, util
+import logging, math, bisect
 import numpy as num
+from scipy import signal
+
+logger = logging.getLogger('pyrocko.autopick')
 
 class AutopickError(Exception):
     pass
@@ -25,3 +29,593 @@ def recursive_stalta(tshort, tlong, kshort, klong, kderivative, energytrace, tem
     else:
         return energytrace, temp
 
+
+class Trigger(object):
+    '''Detection from a STA/LTA trigger.
+
+    :param nslc_id: network, station, location and channel code of the trace
+    :param tmin: trigger on time
+    :param tmax: trigger off time
+    :param tpeak: time of the maximum STA/LTA ratio during the trigger
+    :param apeak: maximum STA/LTA ratio during the trigger
+    :param truncated: ``True`` if the trigger was still on when the data
+        ended or was interrupted by a gap, *tmax* is then the time of the last
+        output sample before the end or gap
+    '''
+
+    def __init__(self, nslc_id, tmin, tmax, tpeak, apeak, truncated=False):
+        self.nslc_id = nslc_id
+        self.tmin = tmin
+        self.tmax = tmax
+        self.tpeak = tpeak
+        self.apeak = apeak
+        self.truncated = truncated
+
+    def __str__(self):
+        return '%s %s - %s%s, peak %g at %s' % ('.'.join(self.nslc_id),
+            util.time_to_str(self.tmin), util.time_to_str(self.tmax),
+            ('', ' (truncated)')[self.truncated],
+            self.apeak, util.time_to_str(self.tpeak))
+
+class _STALTAState(object):
+    def __init__(self, deltat, ns, nl, method):
+        self.deltat = deltat
+        self.ns = ns
+        self.nl = nl
+        self.method = method
+        self.tstart = None  # time of first sample of the stream
+        self.nseen = 0      # number of samples consumed so far
+        self.nout = 0       # number of output samples produced so far
+        self.buffer = num.zeros(0, dtype=num.float)
+        self.zi_short = num.zeros(1)
+        self.zi_long = num.zeros(1)
+        self.triggered = False
+        self.ton = None
+        self.tpeak = None
+        self.apeak = None
+
+    def sample_time(self, i):
+        return self.tstart + i*self.deltat
+
+    def flush(self, nslc_id):
+        if not self.triggered:
+            return None
+
+        self.triggered = False
+        return Trigger(nslc_id, self.ton, self.sample_time(self.nout-1),
+                       self.tpeak, self.apeak, truncated=True)
+
+class STALTADetector(object):
+    '''Streaming STA/LTA detector for successive, non-overlapping windows.
+
+    :param tshort: length of short time window in [s]
+    :param tlong: length of long time window in [s]
+    :param on_level: STA/LTA ratio at which a trigger is turned on
+    :param off_level: STA/LTA ratio at which a trigger is turned off
+        (defaults to *on_level*, must not be larger than *on_level*)
+    :param method: ``'classic'``, ``'recursive'`` or ``'centered'``
+    :param quad: whether to square the data prior to applying the STA/LTA filter
+
+    Feed successive windows of each channel to :py:meth:`process`. The
+    detector keeps the necessary history per network, station, location and
+    channel code, so no padding or overlap between the windows is required.
+    Samples which have already been processed (e.g. when the windows are
+    overlapping) are skipped. When a gap or a change in sampling rate is
+    encountered, the state of the channel is reset and a trigger which is
+    still on is returned as truncated (see :py:class:`Trigger`).
+
+    =============== =========================================================
+    Method          Implementation
+    =============== =========================================================
+    ``classic``     Mean energy over trailing short and long windows
+    ``recursive``   Exponentially weighted averages with time constants
+                    *tshort* and *tlong*
+    ``centered``    Short and long windows centered on each sample, as in
+                    :py:meth:`pyrocko.trace.Trace.sta_lta_centered`, output
+                    is delayed by half of the long window
+    =============== =========================================================
+
+    Output is produced once the first long window is filled.
+    '''
+
+    def __init__(self, tshort, tlong, on_level, off_level=None,
+                 method='classic', quad=True):
+
+        if method not in ('classic', 'recursive', 'centered'):
+            raise AutopickError('invalid STA/LTA method: %s' % method)
+
+        if tshort >= tlong:
+            raise AutopickError('tshort must be smaller than tlong')
+
+        if off_level is None:
+            off_level = on_level
+
+        if off_level > on_level:
+            raise AutopickError('off_level must not be larger than on_level')
+
+        self.tshort = tshort
+        self.tlong = tlong
+        self.on_level = on_level
+        self.off_level = off_level
+        self.method = method
+        self.quad = quad
+        self._states = {}
+
+    def clone(self):
+        '''Get a new detector with the same settings and an empty history.'''
+
+        return STALTADetector(self.tshort, self.tlong, self.on_level,
+                              self.off_level, self.method, self.quad)
+
+    def reset(self, nslc_id=None):
+        '''Forget the history of one or all channels.'''
+
+        if nslc_id is None:
+            self._states = {}
+        elif nslc_id in self._states:
+            del self._states[nslc_id]
+
+    def _get_state(self, tr, triggers):
+        state = self._states.get(tr.nslc_id, None)
+        if state is not None:
+            texpect = state.sample_time(state.nseen)
+            if abs(state.deltat - tr.deltat) > 1e-6*tr.deltat or \
+                    tr.tmin > texpect + 0.5*tr.deltat or \
+                    tr.tmax < state.sample_time(0) - 0.5*tr.deltat:
+
+                logger.debug('resetting STA/LTA state of %s' % 
+                             '.'.join(tr.nslc_id))
+
+                trig = state.flush(tr.nslc_id)
+                if trig is not None:
+                    logger.info('truncated trigger at gap: %s' % trig)
+                    triggers.append(trig)
+
+                state = None
+
+        if state is None:
+            ns = max(1, int(round(self.tshort/tr.deltat)))
+            nl = max(ns+1, int(round(self.tlong/tr.deltat)))
+            state = _STALTAState(tr.deltat, ns, nl, self.method)
+            state.tstart = tr.tmin
+            self._states[tr.nslc_id] = state
+
+        return state
+
+    def process(self, tr):
+        '''Run detector on next window of a channel.
+
+        :param tr: :py:class:`pyrocko.trace.Trace` object with the data
+        :returns: tuple ``(cf, triggers)``, where ``cf`` is a trace with the
+            STA/LTA ratio computed from the new samples (``None`` if there is
+            no new output yet) and ``triggers`` is a list of
+            :py:class:`Trigger` objects which have been completed.
+        '''
+
+        triggers = []
+        state = self._get_state(tr, triggers)
+        iskip = int(round((state.sample_time(state.nseen) - tr.tmin) / 
+                          tr.deltat))
+
+        y = tr.get_ydata()[max(0, iskip):].astype(num.float)
+        if y.size == 0:
+            return None, triggers
+
+        if self.quad:
+            y = y**2
+
+        ratio = self._ratio(state, y)
+        state.nseen += y.size
+        if ratio.size == 0:
+            return None, triggers
+
+        tmin_cf = state.sample_time(state.nout)
+        state.nout += ratio.size
+        cf = trace.Trace(tr.network, tr.station, tr.location, tr.channel,
+                         tmin=tmin_cf, deltat=tr.deltat, ydata=ratio)
+
+        triggers.extend(self._triggers(state, tr.nslc_id, tmin_cf, ratio))
+        return cf, triggers
+
+    def process_traces(self, traces):
+        '''Run detector on next windows of several channels.
+
+        :param traces: list of :py:class:`pyrocko.trace.Trace` objects
+        :returns: tuple ``(cfs, triggers)`` with the lists of the
+            characteristic function traces and the completed triggers
+        '''
+
+        cfs, triggers = [], []
+        for tr in traces:
+            cf, trigs = self.process(tr)
+            if cf is not None:
+                cfs.append(cf)
+
+            triggers.extend(trigs)
+
+        return cfs, triggers
+
+    def flush(self):
+        '''Close and return any triggers which are still open.
+
+        The returned triggers are marked as truncated.
+        '''
+
+        triggers = []
+        for nslc_id, state in self._states.iteritems():
+            trig = state.flush(nslc_id)
+            if trig is not None:
+                triggers.append(trig)
+
+        return triggers
+
+    def get_tcomplete(self):
+        '''Get time before which no further triggers can be turned on.
+
+        :returns: the earliest on time of the open triggers or the time of
+            the next output sample, minimum over all channels (``None`` if no
+            data has been processed yet)
+
+        The value is only meaningful after the current window of every channel
+        has been processed.
+        '''
+
+        tcomplete = None
+        for state in self._states.itervalues():
+            if state.triggered:
+                t = state.ton
+            else:
+                t = state.sample_time(state.nout)
+
+            if tcomplete is None or t < tcomplete:
+                tcomplete = t
+
+        return tcomplete
+
+    def _ratio(self, state, y):
+        ns, nl = state.ns, state.nl
+        if state.method == 'recursive':
+            ks, kl = 1.0/ns, 1.0/nl
+            if state.nseen == 0:
+                state.zi_short[0] = (1.-ks)*y[0]
+                state.zi_long[0] = (1.-kl)*y[0]
+
+            sta, state.zi_short = signal.lfilter([ks], [1., ks-1.], y, 
+                                                 zi=state.zi_short)
+            lta, state.zi_long = signal.lfilter([kl], [1., kl-1.], y,
+                                                zi=state.zi_long)
+            
+            # skip output until the long window is filled
+            iwarm = max(0, nl - state.nseen)
+            sta, lta = sta[iwarm:], lta[iwarm:]
+            state.nout = max(state.nout, nl)
+
+        else:
+            if state.method == 'classic':
+                ashort, along = ns-1, nl-1
+            else:
+                # same alignment as trace.moving_avg
+                ashort, along = ns/2-1, nl/2-1
+
+            # buffer holds samples starting at global index ibuf
+            ibuf = state.nseen - state.buffer.size
+            e = num.concatenate((state.buffer, y))
+            c = num.zeros(e.size+1)
+            c[1:] = num.cumsum(e)
+
+            # first output sample needs a full long window before it
+            state.nout = max(state.nout, along)
+            ilast = state.nseen + y.size - 1 - \
+                    max(ns-1-ashort, nl-1-along)
+
+            iout = num.arange(state.nout, ilast+1) - ibuf
+            if iout.size == 0:
+                sta = lta = num.zeros(0)
+            else:
+                sta = (c[iout-ashort+ns] - c[iout-ashort]) / ns
+                lta = (c[iout-along+nl] - c[iout-along]) / nl
+
+            ikeep = state.nout + iout.size - along - ibuf
+            state.buffer = e[ikeep:]
+
+        ratio = num.zeros(sta.size)
+        mask = lta > 0.
+        ratio[mask] = sta[mask] / lta[mask]
+        return ratio
+
+    def _triggers(self, state, nslc_id, tmin, ratio):
+        ion = num.nonzero(ratio > self.on_level)[0]
+        ioff = num.nonzero(ratio < self.off_level)[0]
+
+        def t(i):
+            return tmin + i*state.deltat
+
+        triggers = []
+        i = 0
+        while True:
+            if not state.triggered:
+                j = num.searchsorted(ion, i)
+                if j == ion.size:
+                    break
+
+                i = ion[j]
+                state.triggered = True
+                state.ton = t(i)
+                state.apeak = None
+
+            j = num.searchsorted(ioff, i)
+            iend = ratio.size
+            if j != ioff.size:
+                iend = ioff[j]
+
+            if iend > i:
+                ipeak = i + num.argmax(ratio[i:iend])
+                if state.apeak is None or ratio[ipeak] > state.apeak:
+                    state.apeak = ratio[ipeak]
+                    state.tpeak = t(ipeak)
+
+            if j == ioff.size:
+                break
+                
+            triggers.append(Trigger(nslc_id, state.ton, t(iend), state.tpeak,
+                                    state.apeak))
+
+            state.triggered = False
+            i = iend
+
+        return triggers
+
+
+class Detection(object):
+    '''Network detection formed by coincident triggers.
+
+    :param triggers: list of :py:class:`Trigger` objects contributing to the
+        detection
+    :param weight: summed weight of the contributing stations
+    '''
+
+    def __init__(self, triggers, weight):
+        self.triggers = triggers
+        self.weight = weight
+        self.tmin = min([ trig.tmin for trig in triggers ])
+        self.tmax = max([ trig.tmax for trig in triggers ])
+
+    def get_nslc_ids(self):
+        return sorted(set([ trig.nslc_id for trig in self.triggers ]))
+
+    def get_marker(self, kind=0):
+        '''Get :py:class:`pyrocko.gui_util.Marker` spanning the detection.'''
+
+        from pyrocko import gui_util
+        return gui_util.Marker(self.get_nslc_ids(), self.tmin, self.tmax, 
+                               kind=kind)
+
+    def get_event(self, name=''):
+        '''Get :py:class:`pyrocko.model.Event` at the time of the detection.
+
+        The event has no location, only its time is set.
+        '''
+
+        from pyrocko import model
+        return model.Event(time=self.tmin, name=name)
+
+    def get_event_marker(self, kind=0, name=''):
+        '''Get :py:class:`pyrocko.gui_util.EventMarker` for the detection.'''
+
+        from pyrocko import gui_util
+        return gui_util.EventMarker(self.get_event(name=name), kind=kind)
+
+    def __str__(self):
+        return '%s - %s, weight %g, %i triggers' % (
+            util.time_to_str(self.tmin), util.time_to_str(self.tmax), 
+            self.weight, len(self.triggers))
+
+def _station_key(nslc_id):
+    return nslc_id[:3]
+
+class CoincidenceTrigger(object):
+    '''Combine single station triggers into network detections.
+
+    :param tcoincidence: length of coincidence window in [s]
+    :param threshold: minimum summed station weight needed for a detection
+    :param weights: dict with station weights, keyed by
+        ``(network, station, location)``
+    :param default_weight: weight of stations not contained in *weights*
+    :param station_key: function to get the key into *weights* from a
+        trigger's ``nslc_id``
+
+    Triggers are grouped by their on times: starting with the earliest
+    pending trigger, all triggers turned on within *tcoincidence* are
+    collected and the weights of the involved stations are summed up, each
+    station counting once. If the sum reaches *threshold*, a
+    :py:class:`Detection` is emitted and its triggers are consumed,
+    otherwise the earliest trigger is discarded.
+    '''
+
+    def __init__(self, tcoincidence, threshold, weights=None, 
+                 default_weight=1.0, station_key=_station_key):
+
+        if weights is None:
+            weights = {}
+
+        self.tcoincidence = tcoincidence
+        self.threshold = threshold
+        self.weights = weights
+        self.default_weight = default_weight
+        self.station_key = station_key
+        self._pending = []
+
+    def clone(self):
+        '''Get a new instance with the same settings and no pending triggers.'''
+
+        return CoincidenceTrigger(self.tcoincidence, self.threshold,
+                                  self.weights, self.default_weight,
+                                  self.station_key)
+
+    def process(self, triggers, tcomplete=None):
+        '''Add triggers and get detections which can be decided.
+
+        :param triggers: list of :py:class:`Trigger` objects
+        :param tcomplete: time before which no further triggers will be turned
+            on, as given by :py:meth:`STALTADetector.get_tcomplete` (if
+            ``None``, the triggers are only queued)
+        :returns: list of :py:class:`Detection` objects
+        '''
+
+        self._pending.extend(triggers)
+        if tcomplete is None:
+            return []
+
+        return self._detect(tcomplete)
+
+    def flush(self):
+        '''Decide about all pending triggers.'''
+
+        return self._detect(None)
+
+    def _weight(self, trigs):
+        weights = {}
+        for trig in trigs:
+            k = self.station_key(trig.nslc_id)
+            weights[k] = self.weights.get(k, self.default_weight)
+
+        return sum(weights.values())
+
+    def _detect(self, tcomplete):
+        pending = sorted(self._pending, key=lambda trig: trig.tmin)
+        tmins = [ trig.tmin for trig in pending ]
+        detections = []
+        i = 0
+        while i < len(pending):
+            tend = tmins[i] + self.tcoincidence
+            if tcomplete is not None and tend >= tcomplete:
+                break
+
+            j = bisect.bisect_right(tmins, tend, i)
+            weight = self._weight(pending[i:j])
+            if weight >= self.threshold:
+                detections.append(Detection(pending[i:j], weight))
+                i = j
+            else:
+                i += 1
+
+        self._pending = pending[i:]
+        return detections
+
+def _preprocess_padded(traces, preprocess):
+    '''Apply *preprocess* to padded traces and cut off the padding.'''
+
+    processed = []
+    for tr in traces:
+        if preprocess is not None:
+            preprocess(tr)
+
+        try:
+            tr.chop(tr.wmin, tr.wmax)
+        except trace.NoData:
+            continue
+
+        processed.append(tr)
+
+    return processed
+
+def _detect_block(args):
+    p, stalta, coincidence, tmin, tmax, tinc, tpad, tpad_preprocess, kwargs, \
+        preprocess = args
+
+    stalta = stalta.clone()
+    coincidence = coincidence.clone()
+    detections = []
+    for traces in p.chopper(tmin=tmin-tpad, tmax=tmax+tpad, tinc=tinc, 
+                            tpad=tpad_preprocess, **kwargs):
+
+        traces = _preprocess_padded(traces, preprocess)
+        cfs, triggers = stalta.process_traces(traces)
+        detections.extend(coincidence.process(triggers, 
+                                              stalta.get_tcomplete()))
+
+    coincidence.process(stalta.flush())
+    detections.extend(coincidence.flush())
+
+    return [ det for det in detections if tmin <= det.tmin < tmax ]
+
+_detect_block_args = None
+
+def _detect_block_forked(iblock):
+    return _detect_block(_detect_block_args[iblock])
+
+def detect_pile(p, stalta, coincidence, tmin=None, tmax=None, tblock=86400.,
+                tinc=3600., nprocs=1, preprocess=None, tpad_preprocess=0.,
+                **kwargs):
+    '''Run coincidence trigger on the contents of a pile.
+
+    :param p: :py:class:`pyrocko.pile.Pile` object
+    :param stalta: :py:class:`STALTADetector` used as template for the
+        single station triggers
+    :param coincidence: :py:class:`CoincidenceTrigger` used as template to
+        combine the triggers
+    :param tmin: start time (defaults to start of pile)
+    :param tmax: end time (defaults to end of pile)
+    :param tblock: length of independently processed time blocks in [s]
+    :param tinc: length of data windows to be read at once in [s]
+    :param nprocs: number of processes to use
+    :param preprocess: function to be applied to each trace prior to the
+        STA/LTA (e.g. for filtering), it should modify the trace in place
+    :param tpad_preprocess: padding in [s] added on either side of each data
+        window given to *preprocess*, it should cover the transient of the
+        filter applied there
+    :returns: list of :py:class:`Detection` objects, sorted by time
+
+    Additional keyword arguments are passed to
+    :py:meth:`pyrocko.pile.Pile.chopper`. The blocks are padded with two
+    long windows and the coincidence window on either side, so that results
+    do not depend on the block boundaries, except for triggers being
+    distributed differently among overlapping coincidence windows. Each
+    detection is reported by the block in which it is starting. When *nprocs*
+    is larger than one, the blocks are processed in forked worker processes.
+
+    Each window of length *tinc* is preprocessed separately. The padding given
+    with *tpad_preprocess* is cut off again before the STA/LTA is applied, so
+    that the filter transients at the window edges do not cause false
+    triggers. Without padding, *preprocess* gets the bare windows.
+    '''
+
+    global _detect_block_args
+
+    if tmin is None:
+        tmin = p.get_tmin()
+
+    if tmax is None:
+        tmax = p.get_tmax()
+
+    tpad = 2.*stalta.tlong + coincidence.tcoincidence
+    nblocks = max(1, int(math.ceil((tmax - tmin) / tblock)))
+    args = []
+    for iblock in xrange(nblocks):
+        btmin = tmin + iblock*tblock
+        btmax = min(tmax, btmin + tblock)
+        args.append((p, stalta, coincidence, btmin, btmax, min(tinc, tblock),
+                     tpad, tpad_preprocess, kwargs, preprocess))
+
+    if nprocs > 1 and nblocks > 1:
+        import multiprocessing
+        # workers get their arguments through fork, so that the pile need not
+        # be pickled
+        _detect_block_args = args
+        pool = multiprocessing.Pool(min(nprocs, nblocks))
+        try:
+            results = pool.map(_detect_block_forked, range(nblocks))
+        finally:
+            pool.close()
+            pool.join()
+            _detect_block_args = None
+
+    else:
+        results = map(_detect_block, args)
+
+    detections = []
+    for dets in results:
+        detections.extend(dets)
+
+    detections.sort(key=lambda det: det.tmin)
+    return detections
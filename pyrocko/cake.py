@@ -28,15 +28,21 @@ The main classes defined in this module are:
 
    * :py:class:`Straight` - A ray segment representing propagation through one :py:class:`Layer`.
    * :py:class:`Kink` - An interaction of a ray with a :py:class:`Discontinuity`.
+
+* :py:class:`TravelTimeTable` - Precomputed traveltimes for fast interpolation.
 '''
 
 
-import sys, copy, inspect, math, cmath, operator, StringIO
-from pyrocko import util
+import sys, os, copy, inspect, math, cmath, operator, StringIO, hashlib, logging
+import tempfile
+import cPickle as pickle
+from pyrocko import util, config
 from scipy.optimize import bisect
 from scipy.interpolate import fitpack
 import numpy as num
 
+logger = logging.getLogger('pyrocko.cake')
+
 ZEPS = 0.01
 P = 1
 S = 2
@@ -1655,6 +1661,7 @@ class RayPath:
         self._pmax = None
         self._pmin = None
         self._p = None
+        self._arrays = None
     
     def copy(self):
         '''Get a copy of it.'''
@@ -1820,6 +1827,29 @@ class RayPath:
         lasts = self.last_straight()
         return num.logical_and(firsts.test(p, zstart), lasts.test(p, zstop))
 
+    def _straights_xt(self, p, straights):
+        # distance and traveltime for each straight, for arrays of p computed
+        # at once for all layers of the path, when the path belongs to a model
+        if self._arrays is None or not isinstance(p, num.ndarray) or p.ndim != 1:
+            return [ s.xt(p) for s in straights ]
+
+        a = self._arrays
+        layer_modes = {}
+        for s in straights:
+            layer_modes.setdefault((a.index[id(s.layer)], s.mode), len(layer_modes))
+
+        ielements, modes = zip(*sorted(layer_modes, key=layer_modes.get))
+        x, t = a.xt(p, ielements, modes)
+        xts = []
+        for s in straights:
+            i = layer_modes[a.index[id(s.layer)], s.mode]
+            if s._direction_in != s._direction_out:
+                xts.append((x[i]*2., t[i]*2.))
+            else:
+                xts.append((x[i], t[i]))
+
+        return xts
+
     def xt(self, p, endgaps):
         '''Calculate distance and traveltime for given ray parameter.'''
 
@@ -1830,8 +1860,7 @@ class RayPath:
             sx = 0.0
             st = 0.0
 
-        for s in self.straights():
-            x,t = s.xt(p)
+        for x,t in self._straights_xt(p, list(self.straights())):
             sx += x
             st += t
 
@@ -1859,9 +1888,11 @@ class RayPath:
         sfirst = self.first_straight()
         slast = self.last_straight()
 
-        for s in self.straights():
+        straights = list(self.straights())
+        xts = dict(zip(map(id, straights), self._straights_xt(p, straights)))
+        for s in straights:
             if s is not sfirst and s is not slast:
-                x,t = s.xt(p)
+                x,t = xts[id(s)]
                 sx += x
                 st += t
 
@@ -1870,7 +1901,7 @@ class RayPath:
             sends.append(slast)
 
         for s in sends:
-            x,t = s.xt(p)
+            x,t = xts[id(s)]
             sxe += x
             ste += t
 
@@ -2020,7 +2051,111 @@ class RayPath:
         xt = interp( x, self._x - dx, self._t - dt, 0)
         return [ (x,p,t) for ((x,p), (_,t)) in zip(xp, xt)  ] 
 
-    
+    def interpolate_x2pt_linear_array(self, x, endgaps):
+        '''Get approximate ray parameters and traveltimes for distances.
+
+        Vectorized variant of :py:meth:`interpolate_x2pt_linear`, returning a
+        tuple of arrays ``(x, p, t)`` with one entry per possible arrival.
+        '''
+
+        self._analyse()
+        dx, dt = self.xt_endgaps(self._p, endgaps)
+        xp, tp = self._x - dx, self._t - dt
+
+        x = num.asarray(x, dtype=num.float)
+        isort = num.argsort(x)
+        xs = x[isort]
+
+        # for each segment of the tabulated x(p), find the range of sorted
+        # distances it covers, with the same interval ends as interp()
+        xa, xb = xp[:-1], xp[1:]
+        up = xa <= xb
+        j0 = num.where(up, num.searchsorted(xs, xa, 'left'), 
+                           num.searchsorted(xs, xb, 'right'))
+        j1 = num.where(up, num.searchsorted(xs, xb, 'left'), 
+                           num.searchsorted(xs, xa, 'right'))
+
+        counts = num.where(num.isfinite(xa) & num.isfinite(xb), 
+                           num.maximum(j1 - j0, 0), 0)
+
+        iseg = num.repeat(num.arange(counts.size), counts)
+        offsets = num.arange(iseg.size) - num.repeat(num.cumsum(counts) - counts,
+                                                     counts)
+
+        xv = xs[j0[iseg] + offsets]
+        xr = (xv - xa[iseg]) / (xb[iseg] - xa[iseg])
+        pv = (1.-xr)*self._p[iseg] + xr*self._p[iseg+1]
+        tv = (1.-xr)*tp[iseg] + xr*tp[iseg+1]
+        return xv, pv, tv
+
+    def refine_array(self, x, p, t, endgaps, eps=0.0001):
+        '''Improve ray parameter estimates for many rays at once.
+
+        :param x: array of distances [deg]
+        :param p: array of approximate ray parameters, as given by
+            :py:meth:`interpolate_x2pt_linear_array`
+        :param t: array of approximate traveltimes [s]
+        :param endgaps: as given by :py:meth:`endgaps`
+        :param eps: relative tolerance in distance
+        :returns: tuple of arrays ``(p, t, ok)``, where ``ok`` indicates
+            successful refinement
+
+        This does the same as :py:meth:`Ray.refine` followed by the ray
+        parameter test at the end points, but runs the bisections of all rays
+        together, evaluating :py:meth:`xt` on arrays of ray parameters.
+        '''
+
+        x = num.asarray(x, dtype=num.float)
+        p = num.array(p, dtype=num.float)
+        t = num.array(t, dtype=num.float)
+        xeps = x*eps
+
+        def f(p, x, xeps):
+            dx = x - self.xt(p, endgaps)[0]
+            return num.where(num.abs(dx) < xeps, 0.0, dx)
+
+        ok = num.ones(x.size, dtype=num.bool)
+        todo = num.where(num.abs(x - self.xt(p, endgaps)[0]) > xeps)[0]
+        if todo.size:
+            ip = num.searchsorted(self._p, p[todo])
+            inside = (0 < ip) & (ip < self._p.size)
+            ok[todo[~inside]] = False
+            todo, ip = todo[inside], ip[inside]
+
+            xt, xepst = x[todo], xeps[todo]
+            pl, ph = self._p[ip-1], self._p[ip]
+            fl, fh = f(pl, xt, xepst), f(ph, xt, xepst)
+            pr = num.where(fl == 0., pl, num.where(fh == 0., ph, num.nan))
+
+            # bisect where the root is not found at the interval ends
+            active = num.where((fl*fh < 0.) & num.isnan(pr))[0]
+            for i in xrange(100):
+                if active.size == 0:
+                    break
+
+                pm = 0.5*(pl[active] + ph[active])
+                fm = f(pm, xt[active], xepst[active])
+                done = (fm == 0.) | (ph[active] - pl[active] < 
+                                     2e-12 + 8.88e-16*num.abs(pm))
+
+                pr[active[done]] = pm[done]
+                left = ~done & (num.sign(fm) == num.sign(fl[active]))
+                right = ~done & ~left
+                pl[active[left]] = pm[left]
+                fl[active[left]] = fm[left]
+                ph[active[right]] = pm[right]
+                active = active[~done]
+
+            found = num.isfinite(pr)
+            ok[todo[~found]] = False
+            todo = todo[found]
+            p[todo] = pr[found]
+            xr, t[todo] = self.xt(p[todo], endgaps)
+            ok[todo] &= num.abs(x[todo] - xr) <= xeps[todo]
+
+        ok &= self.xt_endgaps_ptest(p, endgaps)
+        return p, t, ok
+
     def __eq__(self, other):
         if len(self.elements) != len(other.elements):
             return False
@@ -2261,6 +2396,348 @@ class DiscontinuityNotFound(Exception):
         return 'Cannot find discontinuity from given depth or name: %s' % self.depth_or_name
 
 
+class _NotVectorizable(Exception):
+    pass
+
+def _value_or_nan(f, *args):
+    try:
+        return f(*args)
+    except ZeroDivisionError:
+        return num.nan
+
+class _ModelArrays(object):
+    '''Compact array representation of the elements of a layered model.
+
+    Depths, slownesses, critical ray parameters and potential interpolation
+    coefficients of all layers and discontinuities are held in arrays indexed
+    by ``(element index, mode)``, where mode is :py:const:`P` or
+    :py:const:`S`. All values are taken from the :py:class:`Layer` and
+    :py:class:`Discontinuity` objects, so that computations based on these
+    arrays give the same results as the object based ones.
+    '''
+
+    def __init__(self, elements):
+        n = len(elements)
+        self.n = n
+        self.elements = elements
+        self.index = dict((id(el), i) for (i, el) in enumerate(elements))
+
+        def flags():
+            return num.zeros(n, dtype=num.bool)
+
+        def values():
+            return num.zeros(n, dtype=num.float)
+
+        def mode_values():
+            return num.zeros((n, 3), dtype=num.float)
+
+        self.is_layer = flags()
+        self.is_interface = flags()
+        self.potint = flags()
+        self.gradient = flags()
+        self.ztop, self.zbot, self.zmid, self.lr = values(), values(), values(), values()
+        self.utop, self.ubot = mode_values(), mode_values()
+        self.pc_top, self.pc_bot = mode_values(), mode_values()
+        self.pcs_top, self.pcs_bot = mode_values(), mode_values()
+        self.pc_above, self.pc_below = mode_values(), mode_values()
+        self.pia, self.pib = mode_values(), mode_values()
+
+        for i, el in enumerate(elements):
+            self.ztop[i], self.zbot[i] = el.ztop, el.zbot
+            if isinstance(el, Layer):
+                self.is_layer[i] = True
+                self.zmid[i] = el.zmid
+                self.potint[i] = el._use_potential_interpolation
+                self.gradient[i] = isinstance(el, GradientLayer)
+                if self.potint[i]:
+                    self.lr[i] = _value_or_nan(
+                            lambda: math.log(radius(el.ztop)/radius(el.zbot)))
+
+                for mode in (P, S):
+                    # as in Layer.test
+                    for z, pc in ((el.ztop, self.pc_top), (el.zbot, self.pc_bot)):
+                        pc[i, mode] = _value_or_nan(
+                                lambda: el.u(mode, z)*radius(z))
+
+                    # as in Layer.tests
+                    us = _value_or_nan(el.us, mode)
+                    if isinstance(us, tuple):
+                        self.utop[i, mode], self.ubot[i, mode] = us
+                    else:
+                        self.utop[i, mode] = self.ubot[i, mode] = us
+
+                    self.pcs_top[i, mode] = self.utop[i, mode] * radius(el.ztop)
+                    self.pcs_bot[i, mode] = self.ubot[i, mode] * radius(el.zbot)
+
+                    if self.potint[i]:
+                        self.pia[i, mode], self.pib[i, mode] = el.potint_coefs(mode)
+
+            elif isinstance(el, Interface):
+                self.is_interface[i] = True
+                # as in Interface.propagate, -inf where there is no wave
+                for mode in (P, S):
+                    uabove, ubelow = el.us(mode)
+                    for u, pc in ((uabove, self.pc_above), (ubelow, self.pc_below)):
+                        if u is None:
+                            pc[i, mode] = -num.inf
+                        else:
+                            pc[i, mode] = u*radius(el.z)
+
+    def xt(self, p, ielements, modes):
+        '''Get distances and traveltimes for full traversals of layers.
+
+        :param p: 1D array of ray parameters (spherical) [s/rad]
+        :param ielements: indices of the layers
+        :param modes: propagation modes in the layers
+        :returns: arrays ``(x,t)`` of shape ``(len(ielements), p.size)``
+
+        Gives the same results as :py:meth:`Layer.xt` without *zpart*.
+        '''
+
+        e = num.asarray(ielements, dtype=num.int)
+        m = num.asarray(modes, dtype=num.int)
+        x = num.zeros((e.size, p.size))
+        t = num.zeros((e.size, p.size))
+        pp = p[num.newaxis,:]
+
+        potint = self.potint[e]
+        potint_b1 = potint & (self.pib[e, m] == 1.)
+        for sel, xt_func in (
+                (potint & ~potint_b1, self._xt_potint),
+                (potint_b1, self._xt_potint_b1),
+                (~potint & self.gradient[e], self._xt_gradient),
+                (~potint & ~self.gradient[e], self._xt_homogeneous)):
+
+            if num.any(sel):
+                x[sel], t[sel] = xt_func(pp, e[sel], m[sel])
+
+        return x, t
+
+    def _xt_potint(self, p, e, m):
+        # as in Layer.xt_potint, b != 1
+        b = self.pib[e, m][:,num.newaxis]
+        eta1 = (radius(self.zbot[e]) * self.ubot[e, m])[:,num.newaxis]
+        eta2 = (radius(self.ztop[e]) * self.utop[e, m])[:,num.newaxis]
+
+        def cpe(eta):
+            return num.arccos(num.minimum(p/num.maximum(eta,p/2),1.0))
+        def sep(eta):
+            return num.sqrt(num.maximum(eta**2 - p**2, 0.0))
+
+        x = (cpe(eta2)-cpe(eta1))/(1-b)
+        t = (sep(eta2)-sep(eta1))/(1-b)
+        x *= r2d
+        return x, t
+
+    def _xt_potint_b1(self, p, e, m):
+        # as in Layer.xt_potint, b == 1
+        a = self.pia[e, m][:,num.newaxis]
+        lr = self.lr[e][:,num.newaxis]
+        sap = num.sqrt(1/a**2 - p**2)
+        x = p/sap * lr
+        t = 1./(a**2 * sap)
+        x *= r2d
+        return x, t
+
+    def _xt_gradient(self, p, e, m):
+        # as in GradientLayer.xt
+        utop = self.utop[e, m][:,num.newaxis]
+        ubot = self.ubot[e, m][:,num.newaxis]
+        zbot = self.zbot[e][:,num.newaxis]
+        b = (1./ubot - 1./utop)/(zbot - self.ztop[e][:,num.newaxis])
+        pflat = p / (earthradius-zbot)
+
+        peps = 1e-16
+        pdp = pflat + peps
+        def func(u):
+            eta = num.sqrt(num.maximum(u**2 - pflat**2, 0.0))
+            xx = eta/u
+            tt = num.where( pflat<=u, num.log(u+eta) - num.log(pdp) - eta/u, 0.0 )
+            return xx, tt
+
+        xxtop, tttop = func(utop)
+        xxbot, ttbot = func(ubot)
+
+        x =  (xxtop - xxbot)/(b*pdp)
+        t =  (tttop - ttbot)/b + pflat*x
+        x *= r2d/(earthradius - self.zmid[e][:,num.newaxis])
+        return x, t
+
+    def _xt_homogeneous(self, p, e, m):
+        # as in HomogeneousLayer.xt
+        u = self.utop[e, m][:,num.newaxis]
+        zbot = self.zbot[e][:,num.newaxis]
+        pflat = p / (earthradius-zbot)
+        dz = zbot - self.ztop[e][:,num.newaxis]
+        eps = u*0.001
+        denom = num.sqrt(u**2 - pflat**2) + eps
+
+        x = r2d*pflat/(earthradius-self.zmid[e][:,num.newaxis]) * dz / denom
+        t = u**2 * dz / denom
+        return x, t
+
+class _PathWalker(object):
+    '''Array based equivalent of :py:meth:`LayeredModel.path`.
+
+    :param arrays: :py:class:`_ModelArrays` of the model
+    :param phase: phase definition, adapted to the model
+    :param layer_start: layer with source
+    :param layer_stop: layer with receiver
+
+    Raises :py:exc:`_NotVectorizable` if the phase definition cannot be
+    handled.
+    '''
+
+    def __init__(self, arrays, phase, layer_start, layer_stop):
+        self.arrays = arrays
+        knees = list(phase.knees())
+        legs = list(phase.legs())
+        self.nknees = nk = len(knees)
+
+        # knee_match[iknee, ielement, direction == DOWN, mode]
+        self.knee_match = num.zeros((nk+1, arrays.n, 2, 3), dtype=num.bool)
+        for iknee, knee in enumerate(knees):
+            for i, el in enumerate(arrays.elements):
+                if isinstance(el, Discontinuity):
+                    for idirection, direction in enumerate((UP, DOWN)):
+                        for mode in (P, S):
+                            self.knee_match[iknee, i, idirection, mode] = \
+                                    knee.matches(el, mode, direction)
+
+        self.knee_out_direction = num.array(
+                [ knee.out_direction() for knee in knees ] + [ 0 ], dtype=num.int)
+        self.knee_out_mode = num.array(
+                [ knee.out_mode for knee in knees ] + [ 0 ], dtype=num.int)
+
+        def limit(z):
+            if z is None:
+                return num.nan
+            if not isinstance(z, (int, float)):
+                raise _NotVectorizable()
+            return float(z)
+
+        self.leg_zmin = num.array([ limit(leg.depthmin) for leg in legs ])
+        self.leg_zmax = num.array([ limit(leg.depthmax) for leg in legs ])
+        self.have_limits = not num.all(num.isnan(self.leg_zmin)) or \
+                not num.all(num.isnan(self.leg_zmax))
+
+        self.departure = legs[0].departure
+        self.mode_start = legs[0].mode
+        self.mode_stop = phase.last_leg().mode
+        self.direction_stop = phase.direction_stop()
+        self.istart = arrays.index[id(layer_start)]
+        self.istop = arrays.index[id(layer_stop)]
+
+        # a path with more steps must have been trapped
+        self.nsteps_max = (nk+1) * arrays.n * 2 * 2
+
+    def keys(self, p):
+        '''Get keys identifying the ray paths for given ray parameters.
+
+        :param p: 1D array of ray parameters (spherical) [s/rad]
+        :returns: list with a string for each ray parameter, which is equal
+            for equal sequences of ray elements, or ``None`` where no path
+            exists
+        '''
+
+        a = self.arrays
+        n = p.size
+
+        ielement = filled(self.istart, n, dtype=num.int)
+        mode = filled(self.mode_start, n, dtype=num.int)
+        direction = filled(self.departure, n, dtype=num.int)
+        iknee = num.zeros(n, dtype=num.int)
+        failed = num.zeros(n, dtype=num.bool)
+
+        ttop = (a.pcs_top[self.istart, self.mode_start] - p) > 0.
+        tbot = (a.pcs_bot[self.istart, self.mode_start] - p) > 0.
+        failed[~ttop & ~tbot] = True
+        flip = ((direction == DOWN) & ~ttop) | ((direction == UP) & ~tbot)
+        direction[flip] *= -1
+
+        steps = []
+        active = num.where(~failed)[0]
+        for istep in xrange(self.nsteps_max):
+            if active.size == 0:
+                break
+
+            e = ielement[active]
+            d_in = direction[active]
+            m_in = mode[active]
+            k = iknee[active]
+            pa = p[active]
+            d_out = d_in.copy()
+            m_out = m_in.copy()
+            down = d_in == DOWN
+            at_layer = a.is_layer[e]
+            fail = num.zeros(active.size, dtype=num.bool)
+            stop = num.zeros(active.size, dtype=num.bool)
+
+            if not num.all(at_layer):
+                knee = ~at_layer & self.knee_match[k, e, down.astype(num.int), m_in]
+                d_out[knee] = self.knee_out_direction[k[knee]]
+                m_out[knee] = self.knee_out_mode[k[knee]]
+                k = k + knee
+
+                pc = num.where(down, a.pc_below[e, m_in], a.pc_above[e, m_in])
+                reflect = ~knee & a.is_interface[e] & ~(pc - pa >= 0.)
+                d_out[reflect] *= -1
+
+            if num.any(at_layer):
+                pc_in = num.where(down, a.pc_top[e, m_in], a.pc_bot[e, m_in])
+                pc_out = num.where(down, a.pc_bot[e, m_in], a.pc_top[e, m_in])
+                if num.any(num.isnan(pc_in[at_layer])):
+                    raise _NotVectorizable()
+
+                fail |= at_layer & ~((pc_in - pa) > 0.)
+                turn = at_layer & ~fail & ~((pc_out - pa) > 0.)
+                d_out[turn] *= -1
+                if num.any(turn & ~a.potint[e] & ~a.gradient[e]):
+                    # Layer.zturn raises DoesNotTurn
+                    raise _NotVectorizable()
+
+                if self.have_limits:
+                    fail |= self._limits_exceeded(pa, e, m_in, k, at_layer & ~fail, turn)
+
+                stop = at_layer & ~fail & (k == self.nknees) & \
+                        (m_in == self.mode_stop) & (e == self.istop) & \
+                        (turn | (d_out == self.direction_stop))
+
+            steps.append((active, e*16 + down*8 + (d_out == DOWN)*4 + (m_in-1)*2 + (m_out-1)))
+            direction[active] = d_out
+            mode[active] = m_out
+            iknee[active] = k
+            failed[active[fail]] = True
+
+            active = active[~fail & ~stop]
+            ielement[active] += num.where(direction[active] == DOWN, 1, -1)
+            outside = (ielement[active] < 0) | (ielement[active] >= a.n)
+            failed[active[outside]] = True
+            active = active[~outside]
+
+        failed[active] = True
+
+        codes = num.zeros((n, len(steps)), dtype=num.int)
+        nsteps = num.zeros(n, dtype=num.int)
+        for istep, (indices, c) in enumerate(steps):
+            codes[indices, istep] = c
+            nsteps[indices] += 1
+
+        return [ (codes[i,:nsteps[i]].tostring(), None)[failed[i]]
+                 for i in xrange(n) ]
+
+    def _limits_exceeded(self, p, e, m, k, straight, turn):
+        a = self.arrays
+        zmin = self.leg_zmin[k]
+        zmax = self.leg_zmax[k]
+        exceeded = straight & ~turn & ((a.ztop[e] < zmin) | (a.zbot[e] > zmax))
+        for i in num.where(straight & turn & ~(num.isnan(zmin) & num.isnan(zmax)))[0]:
+            zturn = a.elements[e[i]].zturn(p[i], m[i])
+            if zturn < zmin[i] or zturn > zmax[i]:
+                exceeded[i] = True
+
+        return exceeded
+
 class LayeredModel:
     '''Representation of a layer cake model.
     
@@ -2279,7 +2756,8 @@ class LayeredModel:
     Ray objects share common ray paths if they have the same
     conversion/reflection/propagation history. Creating the ray path objects is
     relatively expensive (this is done in :py:meth:`gather_paths`), but they are cached for reuse in successive
-    invocations.
+    invocations. The cache can be saved to disk with :py:meth:`dump_pathcache`
+    and restored with :py:meth:`load_pathcache`.
     '''
 
     def __init__(self):
@@ -2289,6 +2767,31 @@ class LayeredModel:
         self._np = 10000
         self._pdepth = 18
         self._pathcache = {}
+        self._pathcache_modified = False
+        self._arrays = None
+
+    def get_hash(self):
+        '''Get hash of the model content.
+
+        The hash is computed from the depths, materials and names of all
+        layers and discontinuities. Two models with identical content have the
+        same hash.
+        '''
+
+        h = hashlib.sha1()
+        for element in self._elements:
+            if isinstance(element, Layer):
+                t = (element.ztop, element.zbot, element.mtop.astuple(), 
+                     element.mbot.astuple())
+            elif isinstance(element, Interface):
+                t = (element.z, element.mabove.astuple(), 
+                     element.mbelow.astuple())
+            else:
+                t = (element.z, element.mbelow.astuple())
+
+            h.update(repr((element.__class__.__name__, element.name) + t))
+
+        return h.hexdigest()
 
     def copy_with_elevation(self, elevation):
         '''Get a copy of the model with surface layer stretched to given elevation.
@@ -2300,6 +2803,8 @@ class LayeredModel:
 
         c = copy.deepcopy(self)
         c._pathcache = {}
+        c._pathcache_modified = False
+        c._arrays = None
         surface = c._elements[0]
         toplayer = c._elements[1]
 
@@ -2324,6 +2829,13 @@ class LayeredModel:
             self.nlayers += 1
 
         self._elements.append(element)
+        self._arrays = None
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            self._arrays = _ModelArrays(self._elements)
+
+        return self._arrays
 
     def elements(self, direction=DOWN):
         '''Iterate over all elements of the model.
@@ -2434,7 +2946,10 @@ class LayeredModel:
         :py:exc:`BottomReached` or :py:exc:`SurfaceReached` is raised.
         '''
        
-        phase = self.adapt_phase(phase)
+        return self._path(p, self.adapt_phase(phase), layer_start, layer_stop)
+
+    def _path(self, p, phase, layer_start, layer_stop):
+        # like path(), but for a phase definition already adapted to the model
         knees = phase.knees()
         legs = phase.legs()
         next_knee = next_or_none(knees)
@@ -2459,6 +2974,7 @@ class LayeredModel:
 
         mode_layers = []
         path = RayPath(phase)
+        path._arrays = self._get_arrays()
         trapdetect = set()
         while True:
             at_layer = isinstance(current, Layer)
@@ -2525,84 +3041,217 @@ class LayeredModel:
        
         return path
 
-    def gather_paths(self, phases=PhaseDef('P'), zstart=0.0, zstop=0.0):
+    def gather_paths(self, phases=PhaseDef('P'), zstart=0.0, zstop=0.0, nprocs=1):
         '''Get all possible ray paths for given source and receiver depths for one or more phase definitions.
         
         :param phases: a :py:class:`PhaseDef` object or a list of such objects
         :param zstart: source depth [m]
         :param zstop: receiver depth [m]
+        :param nprocs: number of processes to use for the path search
         :returns: a list of :py:class:`RayPath` objects
 
         Results of this method are cached internally. Cached results are
         returned, when a given combination of source layer, receiver layer and
         phase definition has been used before.  
+
+        If *nprocs* is larger than one, the searches for the different phase
+        definitions, which are not in the cache yet, are run in forked worker
+        processes.
         '''
         
         if isinstance(phases, PhaseDef):
             phases = [ phases ]
         
         paths = [] 
-        for phase in phases:
-            
-            layer_start = self.layer(zstart, -phase.direction_start())
-            layer_stop = self.layer(zstop, phase.direction_stop())
+        for pathcachekey in self._discover_paths(phases, [ zstart ], zstop, nprocs)[0]:
+            paths.extend(self._pathcache[pathcachekey])
 
-            pathcachekey = (phase.definition(), layer_start, layer_stop)
+        paths.sort(key=lambda x: x.pmin)
+        return paths
 
-            if pathcachekey in self._pathcache:
-                phase_paths = self._pathcache[pathcachekey]
-            else:
+    def _discover_paths(self, phases, zstarts, zstop, nprocs):
+        # get path cache keys for all source depths, search missing paths
+        keys = []
+        missing = {}
+        for zstart in zstarts:
+            zkeys = []
+            for phase in phases:
+                layer_start = self.layer(zstart, -phase.direction_start())
+                layer_stop = self.layer(zstop, phase.direction_stop())
+                pathcachekey = (phase.definition(), layer_start, layer_stop)
+                if pathcachekey not in self._pathcache:
+                    missing[pathcachekey] = (phase, layer_start, layer_stop)
+
+                zkeys.append(pathcachekey)
+
+            keys.append(zkeys)
+
+        if nprocs > 1 and len(missing) > 1:
+            import multiprocessing
+            global _discover_tasks
+
+            tasks = missing.values()
+            # workers get the model through fork, only the found paths are
+            # sent back
+            _discover_tasks = self, tasks
+            pool = multiprocessing.Pool(min(nprocs, len(tasks)))
+            try:
+                results = pool.map(_discover_paths_forked, range(len(tasks)))
+            finally:
+                pool.close()
+                pool.join()
+                _discover_tasks = None
 
-                pmax_start = max( [ radius(z)/layer_start.v(phase.first_leg().mode, z) for z in (layer_start.ztop, layer_start.zbot) ] )
-                pmax_stop = max( [ radius(z)/layer_stop.v(phase.last_leg().mode, z) for z in (layer_stop.ztop, layer_stop.zbot) ] )
-                pmax = min(pmax_start, pmax_stop)
-
-                phase_paths = {}
-                cached = {}
-                counter = [ 0 ]
-                def p_to_path(p):
-                    if p in cached:
-                        return cached[p]
-
-                    try:
-                        counter[0] += 1
-                        path = self.path(p, phase, layer_start, layer_stop)
-                        if path not in phase_paths:
-                            phase_paths[path] = []
-                        phase_paths[path].append(p)
-
-                    except PathFailed:
-                        path = None
-                    
-                    cached[p] = path
-                    return path
-                
-                def recurse(pmin, pmax, i=0):
-                    if i > self._pdepth:
-                        return
-                    path1 = p_to_path(pmin)
-                    path2 = p_to_path(pmax)
-                    if path1 is None and path2 is None and i > 8:
-                        return
-                    if path1 is None or path2 is None or hash(path1) != hash(path2):
-                        recurse(pmin, (pmin+pmax)/2., i+1)
-                        recurse((pmin+pmax)/2., pmax, i+1)
-
-                recurse(0., pmax)
-
-                for path, ps in phase_paths.iteritems():
-                    path.set_prange(min(ps), max(ps), pmax/(self._np-1))
-           
-                phase_paths = phase_paths.keys()
+            for (phase, layer_start, layer_stop), epaths in zip(tasks, results):
+                self._pathcache[phase.definition(), layer_start, layer_stop] = \
+                        self._decode_paths(self.adapt_phase(phase), epaths)
 
-                self._pathcache[pathcachekey] = phase_paths
+        else:
+            for pathcachekey, (phase, layer_start, layer_stop) in missing.iteritems():
+                self._pathcache[pathcachekey] = self._find_paths(phase, layer_start, layer_stop)
+
+        if missing:
+            self._pathcache_modified = True
+
+        return keys
+
+    def _find_paths(self, phase, layer_start, layer_stop):
+        pmax_start = max( [ radius(z)/layer_start.v(phase.first_leg().mode, z) for z in (layer_start.ztop, layer_start.zbot) ] )
+        pmax_stop = max( [ radius(z)/layer_stop.v(phase.last_leg().mode, z) for z in (layer_stop.ztop, layer_stop.zbot) ] )
+        pmax = min(pmax_start, pmax_stop)
+
+        phase = self.adapt_phase(phase)
+        try:
+            phase_paths = self._find_paths_array(phase, layer_start, layer_stop, pmax)
+        except _NotVectorizable:
+            phase_paths = self._find_paths_recursive(phase, layer_start, layer_stop, pmax)
+
+        for path, ps in phase_paths.iteritems():
+            path.set_prange(min(ps), max(ps), pmax/(self._np-1))
+   
+        return phase_paths.keys()
+
+    def _find_paths_array(self, phase, layer_start, layer_stop, pmax):
+        # Bisect the ray parameter range like _find_paths_recursive, visiting
+        # the same ray parameters, but evaluate the ray parameters of several
+        # bisection levels at once.
+
+        walker = _PathWalker(self._get_arrays(), phase, layer_start, layer_stop)
+        nspeculate = 4
+        keys = {}
+        key_ps = {}
+        intervals = [ (0., pmax) ]
+        for i in xrange(self._pdepth+1):
+            if not intervals:
+                break
+
+            if any(pa not in keys or pb not in keys for (pa, pb) in intervals):
+                candidates = set()
+                subintervals = intervals
+                for j in xrange(min(nspeculate, self._pdepth-i)+1):
+                    for (pa, pb) in subintervals:
+                        candidates.add(pa)
+                        candidates.add(pb)
+
+                    subintervals = [ x for (pa, pb) in subintervals
+                                     for x in ((pa, (pa+pb)/2.), ((pa+pb)/2., pb)) ]
+
+                ps = sorted(p for p in candidates if p not in keys)
+                keys.update(zip(ps, walker.keys(num.array(ps, dtype=num.float))))
+
+            subintervals = []
+            for (pa, pb) in intervals:
+                for p in (pa, pb):
+                    if keys[p] is not None:
+                        key_ps.setdefault(keys[p], set()).add(p)
+
+                key1, key2 = keys[pa], keys[pb]
+                if key1 is None and key2 is None and i > 8:
+                    continue
+                if key1 is None or key2 is None or key1 != key2:
+                    subintervals.append((pa, (pa+pb)/2.))
+                    subintervals.append(((pa+pb)/2., pb))
+
+            intervals = subintervals
+
+        phase_paths = {}
+        for ps in key_ps.itervalues():
+            phase_paths[self._path(min(ps), phase, layer_start, layer_stop)] = list(ps)
+
+        return phase_paths
+
+    def _find_paths_recursive(self, phase, layer_start, layer_stop, pmax):
+        phase_paths = {}
+        cached = {}
+        counter = [ 0 ]
+        def p_to_path(p):
+            if p in cached:
+                return cached[p]
+
+            try:
+                counter[0] += 1
+                path = self._path(p, phase, layer_start, layer_stop)
+                if path not in phase_paths:
+                    phase_paths[path] = []
+                phase_paths[path].append(p)
+
+            except PathFailed:
+                path = None
+            
+            cached[p] = path
+            return path
+        
+        def recurse(pmin, pmax, i=0):
+            if i > self._pdepth:
+                return
+            path1 = p_to_path(pmin)
+            path2 = p_to_path(pmax)
+            if path1 is None and path2 is None and i > 8:
+                return
+            if path1 is None or path2 is None or hash(path1) != hash(path2):
+                recurse(pmin, (pmin+pmax)/2., i+1)
+                recurse((pmin+pmax)/2., pmax, i+1)
+
+        recurse(0., pmax)
+
+        return phase_paths
+
+    def _encode_paths(self, paths):
+        # replace layer and discontinuity references by indices
+        index = dict((id(element), i) for (i, element) in enumerate(self._elements))
+        epaths = []
+        for path in paths:
+            elements = []
+            for el in path.elements:
+                if isinstance(el, Straight):
+                    elements.append(('straight', el._direction_in, 
+                        el._direction_out, el.mode, index[id(el.layer)]))
+                else:
+                    elements.append(('kink', el.in_direction, 
+                        el.out_direction, el.in_mode, el.out_mode, 
+                        index[id(el.discontinuity)]))
+
+            epaths.append((elements, path._pmin, path._pmax, path._prange_dp))
+
+        return epaths
+
+    def _decode_paths(self, phase, epaths):
+        paths = []
+        for elements, pmin, pmax, dp in epaths:
+            path = RayPath(phase)
+            path._arrays = self._get_arrays()
+            for el in elements:
+                if el[0] == 'straight':
+                    path.append(Straight(el[1], el[2], el[3], self._elements[el[4]]))
+                else:
+                    path.append(Kink(el[1], el[2], el[3], el[4], self._elements[el[5]]))
+
+            path.set_prange(pmin, pmax, dp)
+            paths.append(path)
 
-            paths.extend(phase_paths)
-        
-        paths.sort(key=lambda x: x.pmin)
         return paths
     
-    def arrivals(self, distances=[], phases=PhaseDef('P'), zstart=0.0, zstop=0.0, refine=True):
+    def arrivals(self, distances=[], phases=PhaseDef('P'), zstart=0.0, zstop=0.0, refine=True, nprocs=1):
         '''Compute rays and traveltimes for given distances.
 
         :param distances: list or array of distances [deg]
@@ -2610,13 +3259,14 @@ class LayeredModel:
         :param zstart: source depth [m]
         :param zstop: receiver depth [m]
         :param refine: bool flag, whether to use bisectioning to improve (p,x,t) estimated from interpolation
+        :param nprocs: number of processes to use in :py:meth:`gather_paths`
         :returns: a list of :py:class:`Ray` objects, sorted by (distance, arrival time)
         '''
         
         distances = num.asarray(distances, dtype=num.float)
    
         arrivals = []
-        for path in self.gather_paths( phases, zstart=zstart, zstop=zstop):
+        for path in self.gather_paths( phases, zstart=zstart, zstop=zstop, nprocs=nprocs):
             endgaps = path.endgaps(zstart, zstop)
             for x,p,t in path.interpolate_x2pt_linear(distances, endgaps):
                 arrivals.append(Ray(path, p, x, t, endgaps))
@@ -2637,6 +3287,148 @@ class LayeredModel:
         arrivals.sort(key=lambda x: (x.x, x.t))
         return arrivals
 
+    def pathcache_filename(self, cachedir=None):
+        '''Get default filename for the on-disk ray path cache of this model.
+
+        :param cachedir: directory for the cache files (defaults to
+            ``'cake'`` subdirectory of :py:data:`pyrocko.config.cache_dir`)
+
+        The filename is derived from the hash of the model content, see
+        :py:meth:`get_hash`.
+        '''
+
+        if cachedir is None:
+            cachedir = os.path.join(config.cache_dir, 'cake')
+
+        return os.path.join(cachedir, 'paths-%s.pickle' % self.get_hash())
+
+    def dump_pathcache(self, filename=None, force=False):
+        '''Save ray paths found by :py:meth:`gather_paths` to a file.
+
+        :param filename: name of the file (defaults to
+            :py:meth:`pathcache_filename`)
+        :param force: write the file even if no new paths have been found
+            since the last :py:meth:`load_pathcache` or
+            :py:meth:`dump_pathcache`
+
+        Layers and discontinuities are stored by their index in the model, so
+        the file can only be used with models of identical content.
+        '''
+
+        if filename is None:
+            filename = self.pathcache_filename()
+
+        if not (force or self._pathcache_modified):
+            return
+
+        index = dict((id(element), i) for (i, element) in enumerate(self._elements))
+        entries = []
+        for (definition, layer_start, layer_stop), paths in self._pathcache.iteritems():
+            entries.append((definition, index[id(layer_start)], 
+                            index[id(layer_stop)], self._encode_paths(paths)))
+
+        data = dict(version=1, hash=self.get_hash(), np=self._np, 
+                    pdepth=self._pdepth, entries=entries)
+
+        util.ensuredirs(filename)
+        tempfn = _mktemp(filename)
+        try:
+            f = open(tempfn, 'wb')
+            pickle.dump(data, f, protocol=2)
+            f.close()
+            os.rename(tempfn, filename)
+        except:
+            _remove_quietly(tempfn)
+            raise
+
+        self._pathcache_modified = False
+
+    def load_pathcache(self, filename=None):
+        '''Load ray paths from a file written by :py:meth:`dump_pathcache`.
+
+        :param filename: name of the file (defaults to
+            :py:meth:`pathcache_filename`)
+        :returns: number of (phase, source layer, receiver layer)
+            combinations added to the in-memory cache
+
+        Nothing is loaded if the file does not exist or if it has been
+        written for a different model or with different path search settings.
+        '''
+
+        if filename is None:
+            filename = self.pathcache_filename()
+
+        if not os.path.exists(filename):
+            return 0
+
+        f = open(filename, 'rb')
+        try:
+            data = pickle.load(f)
+        finally:
+            f.close()
+
+        if (data.get('version') != 1 or data['hash'] != self.get_hash() or
+                data['np'] != self._np or data['pdepth'] != self._pdepth):
+            logger.debug('ignoring incompatible path cache file: %s' % filename)
+            return 0
+
+        nloaded = 0
+        for definition, istart, istop, epaths in data['entries']:
+            pathcachekey = (definition, self._elements[istart], self._elements[istop])
+            if pathcachekey in self._pathcache:
+                continue
+
+            phase = self.adapt_phase(PhaseDef(definition))
+            phase_paths = self._decode_paths(phase, epaths)
+            self._pathcache[pathcachekey] = phase_paths
+            nloaded += 1
+
+        return nloaded
+
+    def arrivals_grid(self, distances=[], zstarts=[0.0], phases=PhaseDef('P'), zstop=0.0, refine=True, nprocs=1):
+        '''Compute rays and traveltimes for given distances and source depths.
+
+        :param distances: list or array of distances [deg]
+        :param zstarts: list or array of source depths [m]
+        :param phases: a :py:class:`PhaseDef` object or a list of such objects
+        :param zstop: receiver depth [m]
+        :param refine: bool flag, whether to use bisectioning to improve (p,x,t) estimated from interpolation
+        :param nprocs: number of processes to use for the path search, see
+            :py:meth:`gather_paths`
+        :returns: a list with one list of :py:class:`Ray` objects for each
+            source depth, sorted by (distance, arrival time)
+
+        Gives the same rays as calling :py:meth:`arrivals` for each source
+        depth, but the interpolation and refinement of all distances for a
+        path are done with array operations. Ray paths are gathered once for
+        all source depths falling into the same layer.
+        '''
+
+        distances = num.asarray(distances, dtype=num.float)
+        if isinstance(phases, PhaseDef):
+            phases = [ phases ]
+
+        # search paths for all source layers at once
+        self._discover_paths(phases, zstarts, zstop, nprocs)
+
+        results = []
+        for zstart in zstarts:
+            arrivals = []
+            for path in self.gather_paths( phases, zstart=zstart, zstop=zstop):
+                endgaps = path.endgaps(zstart, zstop)
+                xs, ps, ts = path.interpolate_x2pt_linear_array(distances, endgaps)
+                if refine:
+                    ps, ts, ok = path.refine_array(xs, ps, ts, endgaps)
+                    xs, ps, ts = xs[ok], ps[ok], ts[ok]
+
+                for x,p,t in zip(xs.tolist(), ps.tolist(), ts.tolist()):
+                    arrivals.append(Ray(path, p, x, t, endgaps))
+
+            arrivals.sort(key=lambda x: (x.x, x.t))
+            results.append(arrivals)
+
+        return results
+
     @classmethod
     def from_scanlines(cls, producer):
         '''Create layer cake model from sequence of materials at depths.
@@ -2709,6 +3501,301 @@ class LayeredModel:
     def __str__(self):
         return '\n'.join( str(element) for element in self._elements )
                 
+_discover_tasks = None
+
+def _discover_paths_forked(itask):
+    mod, tasks = _discover_tasks
+    return mod._encode_paths(mod._find_paths(*tasks[itask]))
+
+def _mktemp(filename):
+    # unique name in the target directory, so that concurrent writers do not
+    # clobber each other's files and the final rename is atomic
+    fd, tempfn = tempfile.mkstemp(prefix=os.path.basename(filename) + '.',
+                                  suffix='.tmp', dir=os.path.dirname(filename))
+    os.close(fd)
+    return tempfn
+
+def _remove_quietly(filename):
+    try:
+        os.unlink(filename)
+    except OSError:
+        pass
+
+class TravelTimeTable(object):
+    '''Precomputed first arrival traveltimes on a (source depth, distance) grid.
+
+    :param distances: increasing grid distances [deg]
+    :param depths: increasing grid source depths [m]
+    :param phases: list of :py:class:`PhaseDef` objects
+    :param times: array of shape ``(len(phases), len(depths),
+        len(distances))`` with the traveltimes [s] (``nan`` where a phase has
+        no arrival)
+    :param zstop: receiver depth [m]
+    :param model_hash: hash of the model used to compute the table, as given
+        by :py:meth:`LayeredModel.get_hash`
+
+    Use :py:meth:`build` to compute a table for a given model, or
+    :py:func:`get_traveltime_table` to have it cached on disk. Queries are
+    answered by bilinear interpolation in :py:meth:`interpolate`.
+    '''
+
+    def __init__(self, distances, depths, phases, times, zstop=0.0, 
+                 model_hash=None):
+
+        self.distances = num.asarray(distances, dtype=num.float)
+        self.depths = num.asarray(depths, dtype=num.float)
+        self.phases = phases
+        self.times = num.asarray(times, dtype=num.float)
+        self.zstop = zstop
+        self.model_hash = model_hash
+        self._errors = None
+
+        if self.distances.size < 2 or self.depths.size < 2:
+            raise InvalidArguments('traveltime table needs at least two grid '
+                                   'nodes in distance and depth')
+
+        if self.times.shape != (len(phases), self.depths.size, 
+                                self.distances.size):
+            raise InvalidArguments('shape of traveltime array does not match '
+                                   'grid')
+
+    @classmethod
+    def build(cls, model, phases, distances, depths, zstop=0.0, refine=True,
+              nprocs=1):
+        '''Compute traveltime table with :py:meth:`LayeredModel.arrivals_grid`.
+
+        :param model: :py:class:`LayeredModel` object
+        :param phases: a :py:class:`PhaseDef` object or a list of such objects
+        :param distances: increasing grid distances [deg]
+        :param depths: increasing grid source depths [m]
+        :param zstop: receiver depth [m]
+        :param refine: passed to :py:meth:`LayeredModel.arrivals_grid`
+        :param nprocs: passed to :py:meth:`LayeredModel.arrivals_grid`
+        :returns: :py:class:`TravelTimeTable` object
+
+        For each phase definition and grid node, the earliest arrival is
+        stored.
+        '''
+
+        if isinstance(phases, PhaseDef):
+            phases = [ phases ]
+
+        distances = num.asarray(distances, dtype=num.float)
+        depths = num.asarray(depths, dtype=num.float)
+        times = filled(num.nan, (len(phases), depths.size, distances.size))
+        for iphase, phase in enumerate(phases):
+            rays_by_depth = model.arrivals_grid(distances, depths, 
+                                                phases=phase, zstop=zstop,
+                                                refine=refine, nprocs=nprocs)
+
+            for idepth, rays in enumerate(rays_by_depth):
+                t = times[iphase, idepth]
+                for ray in rays:
+                    idist = num.searchsorted(distances, ray.x)
+                    if not (ray.t >= t[idist]):
+                        t[idist] = ray.t
+
+        return cls(distances, depths, phases, times, zstop=zstop,
+                   model_hash=model.get_hash())
+
+    def key(self):
+        '''Get key identifying model, phases, grid and receiver depth.'''
+
+        return traveltime_table_key(self.model_hash, self.phases, 
+                                    self.distances, self.depths, self.zstop)
+
+    def _phase_indices(self, phases):
+        if phases is None:
+            return range(len(self.phases))
+
+        if isinstance(phases, PhaseDef):
+            phases = [ phases ]
+
+        definitions = [ phase.definition() for phase in self.phases ]
+        try:
+            return [ definitions.index(phase.definition()) for phase in phases ]
+        except ValueError:
+            raise InvalidArguments('phase not contained in traveltime table')
+
+    def errors(self):
+        '''Get estimated interpolation error bounds of the grid cells.
+
+        :returns: array of shape ``(len(phases), len(depths)-1,
+            len(distances)-1)`` with error bounds [s]
+
+        For bilinear interpolation, the error within a cell is bounded by
+        ``(dx**2*max|t_xx| + dz**2*max|t_zz|) / 8``, where the second
+        derivatives are estimated from finite differences of the tabulated
+        times in the cell and its neighbours.
+        '''
+
+        if self._errors is None:
+            t = self.times
+            cx = _cell_curvature_bound(t, self.distances, axis=2)
+            cz = _cell_curvature_bound(t, self.depths, axis=1)
+            dx = num.diff(self.distances)[num.newaxis, num.newaxis, :]
+            dz = num.diff(self.depths)[num.newaxis, :, num.newaxis]
+            self._errors = (dx**2 * cx + dz**2 * cz) / 8.
+
+        return self._errors
+
+    def interpolate(self, distances, depths, phases=None, want_errors=False):
+        '''Get first arrival times by bilinear interpolation.
+
+        :param distances: array of distances [deg]
+        :param depths: array of source depths [m], same shape as *distances*
+            or scalar
+        :param phases: phase or list of phases to consider (defaults to all
+            phases of the table)
+        :param want_errors: whether to also return error estimates
+        :returns: array with the earliest arrival times [s] among the
+            selected phases, ``nan`` where no arrival is available or the
+            query point is outside of the grid; if *want_errors* is ``True``,
+            a tuple ``(times, errors)`` is returned, see :py:meth:`errors`.
+        '''
+
+        x = num.asarray(distances, dtype=num.float)
+        z = num.asarray(depths, dtype=num.float)
+        x, z = num.broadcast_arrays(x, z)
+        shape = x.shape
+        x, z = x.ravel(), z.ravel()
+
+        ix, wx, xok = _grid_weights(self.distances, x)
+        iz, wz, zok = _grid_weights(self.depths, z)
+        ok = xok & zok
+
+        tmin = filled(num.nan, x.size)
+        emin = filled(num.nan, x.size)
+        for iphase in self._phase_indices(phases):
+            t = self.times[iphase]
+            tint = (t[iz, ix] * (1.-wz) * (1.-wx) +
+                    t[iz, ix+1] * (1.-wz) * wx +
+                    t[iz+1, ix] * wz * (1.-wx) +
+                    t[iz+1, ix+1] * wz * wx)
+
+            tint[~ok] = num.nan
+            tnew = num.fmin(tmin, tint)
+            if want_errors:
+                better = num.isfinite(tint) & (tnew == tint)
+                emin[better] = self.errors()[iphase, iz, ix][better]
+
+            tmin = tnew
+
+        if want_errors:
+            return tmin.reshape(shape), emin.reshape(shape)
+        else:
+            return tmin.reshape(shape)
+
+    def dump(self, filename):
+        '''Save table to a (compressed) NumPy ``.npz`` file.'''
+
+        f = open(filename, 'wb')
+        try:
+            num.savez_compressed(f,
+                distances=self.distances,
+                depths=self.depths,
+                phases=num.array([ phase.definition() for phase in self.phases ]),
+                times=self.times,
+                zstop=num.array(self.zstop, dtype=num.float),
+                model_hash=num.array(self.model_hash or ''))
+        finally:
+            f.close()
+
+    @classmethod
+    def load(cls, filename):
+        '''Load table from file written by :py:meth:`dump`.'''
+
+        f = open(filename, 'rb')
+        try:
+            data = num.load(f)
+            return cls(data['distances'], data['depths'], 
+                       [ PhaseDef(str(s)) for s in data['phases'] ],
+                       data['times'], zstop=float(data['zstop']),
+                       model_hash=str(data['model_hash']) or None)
+        finally:
+            f.close()
+
+def _grid_weights(grid, x):
+    i = num.clip(num.searchsorted(grid, x) - 1, 0, grid.size-2)
+    w = (x - grid[i]) / (grid[i+1] - grid[i])
+    ok = (grid[0] <= x) & (x <= grid[-1])
+    return i, w, ok
+
+def _cell_curvature_bound(t, grid, axis):
+    # estimate of max |d^2t/dgrid^2| in each cell of the table
+    t = num.swapaxes(t, axis, -1)
+    n = grid.size
+    if n < 3:
+        c = num.zeros(t.shape[:-1] + (n-1,))
+    else:
+        h = num.diff(grid)
+        d = num.diff(t, axis=-1) / h
+        dd = num.abs(2. * num.diff(d, axis=-1) / (h[1:] + h[:-1]))
+        # values at the outermost nodes are taken from their neighbours
+        node = num.concatenate((dd[...,:1], dd, dd[...,-1:]), axis=-1)
+        c = num.fmax(node[...,:-1], node[...,1:])
+
+    # max of the two grid lines bounding each cell
+    c = num.fmax(c[...,:-1,:], c[...,1:,:])
+    return num.swapaxes(c, axis, -1)
+
+def traveltime_table_key(model_hash, phases, distances, depths, zstop):
+    '''Get key for a traveltime table, used as filename in the disk cache.'''
+
+    h = hashlib.sha1()
+    h.update(model_hash or '')
+    for phase in phases:
+        h.update('\0' + phase.definition())
+
+    h.update(num.asarray(distances, dtype=num.float).tostring())
+    h.update(num.asarray(depths, dtype=num.float).tostring())
+    h.update(repr(float(zstop)))
+    return h.hexdigest()
+
+def get_traveltime_table(model, phases, distances, depths, zstop=0.0,
+                         cachedir=None, nprocs=1):
+    '''Get traveltime table, reading it from disk cache when available.
+
+    :param model: :py:class:`LayeredModel` object
+    :param phases: a :py:class:`PhaseDef` object or a list of such objects
+    :param distances: increasing grid distances [deg]
+    :param depths: increasing grid source depths [m]
+    :param zstop: receiver depth [m]
+    :param cachedir: directory for table files (defaults to ``'cake'``
+        subdirectory of :py:data:`pyrocko.config.cache_dir`)
+    :param nprocs: number of processes to use when the table has to be built
+    :returns: :py:class:`TravelTimeTable` object
+
+    Tables are stored in files named after the hash of the model content,
+    the phase definitions, the grid and the receiver depth.
+    '''
+
+    if isinstance(phases, PhaseDef):
+        phases = [ phases ]
+
+    if cachedir is None:
+        cachedir = os.path.join(config.cache_dir, 'cake')
+
+    key = traveltime_table_key(model.get_hash(), phases, distances, depths, 
+                               zstop)
+    fn = os.path.join(cachedir, 'ttt-%s.npz' % key)
+    if os.path.exists(fn):
+        return TravelTimeTable.load(fn)
+
+    table = TravelTimeTable.build(model, phases, distances, depths, 
+                                  zstop=zstop, nprocs=nprocs)
+
+    util.ensuredirs(fn)
+    tempfn = _mktemp(fn)
+    try:
+        table.dump(tempfn)
+        os.rename(tempfn, fn)
+    except:
+        _remove_quietly(tempfn)
+        raise
+
+    return table
+
 def read_hyposat_model(fn):
     '''Reader for HYPOSAT earth model files.
 
@@ -2930,7 +4017,7 @@ def interp(x, xp, fp, monoton):
             fvs = []
             for i in indices:
                 xr = (xv - xp[i])/(xp[i+1]-xp[i])
-                fv = xr*fp[i] + (1.-xr)*fp[i+1]
+                fv = (1.-xr)*fp[i] + xr*fp[i+1]
                 fs.append((xv,fv))
                 
         return fs
@@ -464,7 +464,7 @@ class USGS(EarthquakeCatalog):
                 yield ev.name
 
     def _parse_events_page(self, page):
-        events = []
+        rows = []
         for line in page.splitlines():
             toks = line.strip().split(',')
             if len(toks) != 9:
@@ -475,13 +475,22 @@ class USGS(EarthquakeCatalog):
             except:
                 continue
 
-            t = util.str_to_time(','.join(toks[:4]).strip(), format='%Y,%m,%d,%H%M%S.OPTFRAC')
+            rows.append(toks)
+
+        times = util.str_to_time_array(
+                [ ','.join(toks[:4]).strip() for toks in rows ], 
+                format='%Y,%m,%d,%H%M%S.OPTFRAC')
+
+        snames = util.time_to_str_array(times, format='%Y-%m-%d_%H-%M-%S.3FRAC')
+
+        events = []
+        for toks, t, sname in zip(rows, times.tolist(), snames):
             lat = float(toks[4])
             lon = float(toks[5])
             mag = float(toks[6])
             depth = float(toks[7])
             catalog = toks[8]
-            name = 'USGS-%s-' % catalog + util.time_to_str(t, format='%Y-%m-%d_%H-%M-%S.3FRAC')
+            name = 'USGS-%s-' % catalog + sname
             ev = model.Event(
                     lat=lat,
                     lon=lon, 
@@ -1,4 +1,5 @@
-
+import os
 
 show_progress = True
 earthradius = 6371.*1000.
+cache_dir = os.path.join(os.path.expanduser('~'), '.pyrocko', 'cache')
@@ -63,8 +63,7 @@ Contents
 '''
 
 import numpy as num
-import os, sys
-import copy
+import os, sys, math
 from StringIO import StringIO
 
 LICE, LWATER, LSOFTSED, LHARDSED, LUPPERCRUST, LMIDDLECRUST, LLOWERCRUST, LBELOWCRUST = range(8)
@@ -194,7 +193,12 @@ class Crust2:
         
         :param directory: Directory with the data files which contain the 
             CRUST2.0 model data. If this is set to `None`, builtin CRUST2.0 files 
-            are used.''' 
+            are used.
+
+    The model is held in arrays: a map of profile type indices and a map of
+    elevations on the 2x2 degree grid and the layer parameters for each
+    profile type. :py:class:`Crust2Profile` objects are only created when
+    requested.''' 
             
     fn_keys      = 'CNtype2_key.txt'
     fn_elevation = 'CNelevatio2.txt'
@@ -208,7 +212,7 @@ class Crust2:
     def __init__(self, directory=None):
     
         self._directory = directory
-        self._typemap = None
+        self._profiles = {}
         self._load_crustal_model()
         
     def get_profile(self, lat, lon):
@@ -219,7 +223,97 @@ class Crust2:
         :rtype: instance of :py:class:`Crust2Profile`
         '''
         
-        return self._typemap[self._indices(float(lat),float(lon))]
+        return self._get_profile(*self._indices(float(lat),float(lon)))
+
+    def get_profiles(self, lats, lons):
+        '''Get crustal profiles for many locations.
+
+        :param lats: latitudes (sequence or NumPy array)
+        :param lons: longitudes (sequence or NumPy array)
+        :returns: list of :py:class:`Crust2Profile` objects
+        '''
+
+        ilats, ilons = self._indices_array(lats, lons)
+        return [ self._get_profile(ila, ilo) for (ila, ilo) in zip(ilats, ilons) ]
+
+    def get_elevation(self, lats, lons):
+        '''Get elevations for many locations.
+
+        :param lats: latitudes (sequence or NumPy array)
+        :param lons: longitudes (sequence or NumPy array)
+        :returns: NumPy array with elevations
+        '''
+
+        return self._elevation[self._indices_array(lats, lons)]
+
+    def get_layers(self, ilayer, lats, lons):
+        '''Get parameters of a layer for many locations.
+
+        :param ilayer: id of layer
+        :param lats: latitudes (sequence or NumPy array)
+        :param lons: longitudes (sequence or NumPy array)
+        :returns: NumPy arrays with thickness, vp, vs, density
+
+        Gives the same values as :py:meth:`Crust2Profile.get_layer` on the
+        profiles of the given locations.
+        '''
+
+        indices = self._indices_array(lats, lons)
+        itypes = self._type_map[indices]
+        if ilayer == LBELOWCRUST:
+            thickness = num.empty(itypes.shape)
+            thickness.fill(num.Inf)
+        elif ilayer == LWATER:
+            elevation = self._elevation[indices]
+            thickness = num.where(elevation < 0., -elevation, 
+                                  self._type_thickness[itypes, ilayer])
+        else:
+            thickness = self._type_thickness[itypes, ilayer]
+
+        return (thickness, self._type_vp[itypes, ilayer], 
+                self._type_vs[itypes, ilayer], self._type_rho[itypes, ilayer])
+
+    def get_crustal_thickness(self, lats, lons):
+        '''Get crustal thicknesses for many locations.
+
+        :param lats: latitudes (sequence or NumPy array)
+        :param lons: longitudes (sequence or NumPy array)
+        :returns: NumPy array with crustal thicknesses
+
+        See :py:meth:`Crust2Profile.crustal_thickness`.
+        '''
+
+        return self.get_averages(lats, lons)[3]
+
+    def get_averages(self, lats, lons):
+        '''Get crustal averages for many locations.
+
+        :param lats: latitudes (sequence or NumPy array)
+        :param lons: longitudes (sequence or NumPy array)
+        :returns: NumPy arrays with average vp, vs, density and total crustal
+            thickness
+
+        See :py:meth:`Crust2Profile.averages`.
+        '''
+
+        itypes = self._type_map[self._indices_array(lats, lons)]
+        return tuple( x[itypes] for x in self._type_averages )
+
+    def _get_profile(self, ila, ilo):
+        k = ila, ilo
+        if k not in self._profiles:
+            itype = self._type_map[k]
+            elevation = float(self._elevation[k])
+            thickness = self._type_thickness[itype].copy()
+            if elevation < 0.:
+                thickness[LWATER] = -elevation
+
+            self._profiles[k] = Crust2Profile(
+                self._type_idents[itype], self._type_names[itype],
+                self._type_vp[itype].copy(), self._type_vs[itype].copy(),
+                self._type_rho[itype].copy(), thickness, elevation)
+
+        return self._profiles[k]
         
     def _indices(self, lat,lon):
         lat = _clip(lat, -90., 90.)
@@ -230,6 +324,18 @@ class Crust2:
         ilat = _clip(int(cola/dla), 0, Crust2.nla-1)
         ilon = int((lon+180.)/dlo)%Crust2.nlo
         return ilat, ilon
+
+    def _indices_array(self, lats, lons):
+        lat = num.clip(num.asarray(lats, dtype=num.float), -90., 90.)
+        lon = num.asarray(lons, dtype=num.float)
+        outside = num.logical_or(lon < -180., lon > 180.)
+        lon = num.where(outside, lon - num.floor((lon+180.)/360.)*360., lon)
+        dlo = 360./Crust2.nlo
+        dla = 180./Crust2.nla
+        cola = 90.-lat
+        ilat = num.clip((cola/dla).astype(num.int), 0, Crust2.nla-1)
+        ilon = ((lon+180.)/dlo).astype(num.int) % Crust2.nlo
+        return ilat, ilon
         
     def _load_crustal_model(self):
 
@@ -244,25 +350,38 @@ class Crust2:
         for i in range(5):
             f.readline()
                     
-        profiles = {}
+        idents, names, vps, vss, rhos, thicknesses = [], [], [], [], [], []
         while True:
             line = f.readline()
             if not line:
                 break
             ident, name = line.split(None, 1)
+            idents.append(ident.strip())
+            names.append(name.strip())
             line = f.readline()
-            vp = _sa2arr(line.split()) * 1000.
+            vps.append(_sa2arr(line.split()) * 1000.)
             line = f.readline()
-            vs = _sa2arr(line.split()) * 1000.
+            vss.append(_sa2arr(line.split()) * 1000.)
             line = f.readline()
-            rho = _sa2arr(line.split()) * 1000.
+            rhos.append(_sa2arr(line.split()) * 1000.)
             line = f.readline()
             toks = line.split()
-            thickness = _sa2arr(toks[:-2]) * 1000.
-            
-            profiles[ident] = Crust2Profile(ident.strip(), name.strip(), vp, vs, rho, thickness, 0.0)
+            thicknesses.append(_sa2arr(toks[:-2]) * 1000.)
             
         f.close()
+
+        self._type_idents = idents
+        self._type_names = names
+        self._type_vp = num.array(vps)
+        self._type_vs = num.array(vss)
+        self._type_rho = num.array(rhos)
+        self._type_thickness = num.array(thicknesses)
+
+        # averages do not depend on the water layer, so they can be computed
+        # per profile type
+        self._type_averages = tuple(num.array(x) for x in zip(*[
+            Crust2Profile(None, None, vp, vs, rho, thickness, 0.).averages() 
+            for (vp, vs, rho, thickness) in zip(vps, vss, rhos, thicknesses) ]))
         
         if self._directory is not None:
             path_map = os.path.join(self._directory, Crust2.fn_map)
@@ -272,11 +391,10 @@ class Crust2:
 
         f.readline() # header
             
-        amap = {}
+        itypes = dict((ident, i) for (i, ident) in enumerate(idents))
+        type_map = num.zeros((Crust2.nla, Crust2.nlo), dtype=num.int)
         for ila, line in enumerate(f):
-            keys = line.split()[1:]
-            for ilo, key in enumerate(keys):
-                amap[ila,ilo] = copy.deepcopy(profiles[key])
+            type_map[ila,:] = [ itypes[key] for key in line.split()[1:] ]
             
         f.close()
         
@@ -288,16 +406,14 @@ class Crust2:
             f = StringIO(decode(elevation))
            
         f.readline()
+        elevation_map = num.zeros((Crust2.nla, Crust2.nlo), dtype=num.float)
         for ila, line in enumerate(f):
-            for ilo, s in enumerate(line.split()[1:]):
-                p = amap[ila,ilo]
-                p.set_elevation(float(s))
-                if p.elevation() < 0.:
-                    p.set_layer_thickness(LWATER, -p.elevation())
+            elevation_map[ila,:] = _sa2arr(line.split()[1:])
         
         f.close()
         
-        self._typemap = amap
+        self._type_map = type_map
+        self._elevation = elevation_map
 
     @staticmethod
     def instance():
@@ -321,10 +437,7 @@ def plot_crustal_thickness(crust2=None, filename='crustal_thickness.pdf'):
     if crust2 is None:
         crust2 = Crust2.instance()
    
-    def func(lat,lon):
-        return crust2.get_profile(lat,lon).crustal_thickness(), 
-    
-    plot(func, filename, zscaled_unit='km', zscaled_unit_factor=0.001)
+    plot(crust2.get_crustal_thickness, filename, zscaled_unit='km', zscaled_unit_factor=0.001)
     
 def plot_vp_belowcrust(crust2=None, filename='vp_below_crust.pdf'):
     '''Create a quick and dirty plot of vp below the crust, as defined in CRUST2.0.'''
@@ -332,20 +445,21 @@ def plot_vp_belowcrust(crust2=None, filename='vp_below_crust.pdf'):
     if crust2 is None:
         crust2 = Crust2.instance()
         
-    def func(lat,lon):
-        return crust2.get_profile(lat,lon).get_layer(LBELOWCRUST)[1]
+    def func(lats, lons):
+        return crust2.get_layers(LBELOWCRUST, lats, lons)[1]
     
     plot(func, filename, zscaled_unit='km/s', zscaled_unit_factor=0.001)
     
     
 def plot(func, filename, **kwargs):
+    '''Plot map of values given by func(lats, lons) for arrays of locations.'''
+
     nlats, nlons = 91, 181
     lats = num.linspace(-90., 90., nlats)
     lons = num.linspace(-180.,180., nlons)
         
-    vecfunc = num.vectorize( func, [ num.float ] )
     latss, lonss = num.meshgrid(lats, lons)         
-    thickness = vecfunc(latss, lonss)
+    thickness = func(latss, lonss)
     
     import gmtpy
     cm = gmtpy.cm
@@ -93,8 +93,8 @@ class EventDataAccess:
         stations = copy.deepcopy(self._stations)
         
         if relative_event is not None:
-            for s in stations.values():
-                s.set_event_relative_data(relative_event)
+            model.set_stations_event_relative_data(
+                stations.values(), relative_event)
                 
         return stations
     
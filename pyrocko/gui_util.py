@@ -1,4 +1,4 @@
-import math, calendar, time
+import math, calendar, time, logging
 import numpy as num
 
 import pyrocko.util, pyrocko.plot, pyrocko.model, pyrocko.trace, pyrocko.plot
@@ -8,6 +8,8 @@ from pyrocko.nano import Nano
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
+logger = logging.getLogger('pyrocko.gui_util')
+
 def gmtime_x(timestamp):
     if isinstance(timestamp, Nano):
         etimestamp = int(timestamp)
@@ -286,6 +288,10 @@ class LinValControl(ValControl):
             return 0
         return int(round((value-self.mi)/(self.ma-self.mi) * 10000.))
 
+_binary_markers_magic = 'PK\x03\x04'
+_binary_markers_str_columns = ('nslc_ids', 'event_hash', 'phasename',
+        'polarity', 'catalog', 'name', 'region')
+
 class MarkerParseError(Exception):
     pass
 
@@ -337,7 +343,19 @@ class Marker(object):
         return Marker(nslc_ids, tmin, tmax, kind=kind)
 
     @staticmethod
-    def save_markers(markers, fn):
+    def save_markers(markers, fn, format='text'):
+        '''Save markers to file.
+
+        :param markers: list of :py:class:`Marker` objects
+        :param fn: filename
+        :param format: ``'text'`` for the Snuffler markers table format or
+            ``'binary'`` for a compact columnar format, which is much faster
+            to read and write for large numbers of markers
+        '''
+
+        if format == 'binary':
+            Marker._save_markers_binary(markers, fn)
+            return
 
         f = open(fn,'w')
         f.write('# Snuffler Markers File Version 0.2\n')
@@ -358,8 +376,23 @@ class Marker(object):
 
     @staticmethod
     def load_markers(fn):
+        '''Load markers from file.
+
+        :param fn: filename
+        :returns: list of :py:class:`Marker` objects
+
+        The file format (text or binary) is detected automatically.
+        '''
+
         markers = []
-        f = open(fn, 'r')
+        f = open(fn, 'rb')
+        magic = f.read(len(_binary_markers_magic))
+        f.seek(0)
+        if magic == _binary_markers_magic:
+            markers = Marker._load_markers_binary(f)
+            f.close()
+            return markers
+
         line  = f.readline()
         if not line.startswith('# Snuffler Markers File Version'):
             f.seek(0)
@@ -378,33 +411,165 @@ class Marker(object):
         
         elif line.startswith('# Snuffler Markers File Version 0.2'):
             reader = TableReader(f)
+            rows = []
             while not reader.eof:
                 row = reader.readrow()
                 if not row:
                     continue
+
+                rows.append(row)
+
+            f.close()
+
+            # convert all time columns in one go, this is the expensive part
+            dates, times, itmaxs = [], [], []
+            for row in rows:
+                i = int(row[0] in ('event:', 'phase:'))
+                dates.append(row[i])
+                times.append(row[i+1])
+
+            for irow, row in enumerate(rows):
+                i = int(row[0] in ('event:', 'phase:'))
+                if Marker._has_tmax(row[i:]):
+                    dates.append(row[i+2])
+                    times.append(row[i+3])
+                    itmaxs.append(irow)
+
+            ts = pyrocko.util.str_to_time_array(
+                [ d + ' ' + t for (d, t) in zip(dates, times) ]).tolist()
+            tmins = ts[:len(rows)]
+            tmaxs = list(tmins)
+            for j, irow in enumerate(itmaxs):
+                tmaxs[irow] = ts[len(rows)+j]
+
+            for irow, row in enumerate(rows):
+                tmin, tmax = tmins[irow], tmaxs[irow]
                 if row[0] == 'event:':
-                    marker = EventMarker.from_attributes(row)
+                    marker = EventMarker.from_attributes(row, tmin, tmax)
                 elif row[0] == 'phase:':
-                    marker = PhaseMarker.from_attributes(row)
+                    marker = PhaseMarker.from_attributes(row, tmin, tmax)
                 else:
-                    marker = Marker.from_attributes(row)
+                    marker = Marker.from_attributes(row, tmin, tmax)
                  
                 markers.append(marker)
         else:
+            f.close()
             logger.warn('Unsupported Markers File Version')
         
         return markers
 
+    @staticmethod
+    def _save_markers_binary(markers, fn):
+        n = len(markers)
+        mtypes = num.zeros(n, dtype=num.int8)
+        tmins = num.zeros(n)
+        tmaxs = num.zeros(n)
+        kinds = num.zeros(n, dtype=num.int32)
+        floats = num.zeros((n,4))
+        floats.fill(num.nan)
+        automatic = num.zeros(n, dtype=num.bool)
+        strs = dict([ (k, []) for k in _binary_markers_str_columns ])
+
+        for i, marker in enumerate(markers):
+            tmins[i] = marker.tmin
+            tmaxs[i] = marker.tmax
+            kinds[i] = marker.kind
+            strs['nslc_ids'].append(
+                ','.join([ '.'.join(nslc_id) for nslc_id in marker.nslc_ids ]))
+
+            event_hash, phasename, polarity = None, None, None
+            catalog, name, region = None, None, None
+            if isinstance(marker, EventMarker):
+                mtypes[i] = 1
+                e = marker._event
+                event_hash = marker.get_event_hash()
+                for j, x in enumerate((e.lat, e.lon, e.depth, e.magnitude)):
+                    if x is not None:
+                        floats[i,j] = x
+
+                catalog, name, region = e.catalog, e.name, e.region
+
+            elif isinstance(marker, PhaseMarker):
+                mtypes[i] = 2
+                event_hash = marker._event_hash
+                if marker._event:
+                    event_hash = marker._event.get_hash()
+
+                phasename, polarity = marker._phasename, marker._polarity
+                automatic[i] = bool(marker._automatic)
+
+            for k, x in zip(('event_hash', 'phasename', 'polarity', 'catalog',
+                             'name', 'region'),
+                            (event_hash, phasename, polarity, catalog,
+                             name, region)):
+
+                strs[k].append(x or '')
+
+        arrays = dict([ (k, num.array(v, dtype=str)) for (k,v) in strs.iteritems() ])
+        f = open(fn, 'wb')
+        num.savez_compressed(f, mtypes=mtypes, tmins=tmins, tmaxs=tmaxs,
+                             kinds=kinds, floats=floats, automatic=automatic,
+                             **arrays)
+        f.close()
+
+    @staticmethod
+    def _load_markers_binary(f):
+        data = num.load(f)
+        mtypes = data['mtypes'].tolist()
+        tmins = data['tmins'].tolist()
+        tmaxs = data['tmaxs'].tolist()
+        kinds = data['kinds'].tolist()
+        automatic = data['automatic'].tolist()
+        floats = data['floats']
+        floats = num.where(num.isnan(floats), None, floats).tolist()
+        strs = dict([ (k, [ x or None for x in data[k].tolist() ]) 
+                       for k in _binary_markers_str_columns ])
+
+        markers = []
+        nslc_ids_cache = {}
+        for i, mtype in enumerate(mtypes):
+            snslc_ids = strs['nslc_ids'][i]
+            if snslc_ids not in nslc_ids_cache:
+                if snslc_ids:
+                    nslc_ids_cache[snslc_ids] = tuple([ 
+                        tuple(x.split('.')) for x in snslc_ids.split(',') ])
+                else:
+                    nslc_ids_cache[snslc_ids] = ()
+
+            nslc_ids = nslc_ids_cache[snslc_ids]
+
+            if mtype == 1:
+                lat, lon, depth, magnitude = floats[i]
+                e = pyrocko.model.Event(lat, lon, tmins[i], strs['name'][i],
+                        depth, magnitude, strs['region'][i], 
+                        catalog=strs['catalog'][i])
+
+                marker = EventMarker(e, kinds[i],
+                        event_hash=strs['event_hash'][i])
+
+            elif mtype == 2:
+                marker = PhaseMarker(nslc_ids, tmins[i], tmaxs[i], kinds[i],
+                        event=None, event_hash=strs['event_hash'][i],
+                        phasename=strs['phasename'][i],
+                        polarity=strs['polarity'][i],
+                        automatic=automatic[i])
+            else:
+                marker = Marker(nslc_ids, tmins[i], tmaxs[i], kinds[i])
+
+            markers.append(marker)
+
+        return markers
+
+    color_a = map(pyrocko.plot.color, ('aluminium4', 'aluminium5', 'aluminium6'))
+    color_b = map(pyrocko.plot.color, ('scarletred1', 'scarletred2', 'scarletred3',
+                                       'chameleon1', 'chameleon2', 'chameleon3',
+                                       'skyblue1', 'skyblue2', 'skyblue3',
+                                       'orange1', 'orange2', 'orange3',
+                                       'plum1', 'plum2', 'plum3',
+                                       'chocolate1', 'chocolate2', 'chocolate3'))
+
     def __init__(self, nslc_ids, tmin, tmax, kind=0):
         self.set(nslc_ids, tmin, tmax)
-        c = pyrocko.plot.color
-        self.color_a = [ c(x) for x in ('aluminium4', 'aluminium5', 'aluminium6') ]
-        self.color_b = [ c(x) for x in ('scarletred1', 'scarletred2', 'scarletred3',
-                                        'chameleon1', 'chameleon2', 'chameleon3',
-                                        'skyblue1', 'skyblue2', 'skyblue3',
-                                        'orange1', 'orange2', 'orange3',
-                                        'plum1', 'plum2', 'plum3',
-                                        'chocolate1', 'chocolate2', 'chocolate3') ]
         self.alerted = False
         self.selected = False
         self.kind = kind
@@ -481,12 +646,25 @@ class Marker(object):
         return ws
 
     @staticmethod
-    def parse_attributes(vals):
-        tmin = pyrocko.util.str_to_time( vals[0] + ' ' + vals[1] )
+    def _has_tmax(vals):
+        # the kind column follows directly after tmin, unless tmax is given
+        try:
+            int(vals[2])
+            return False
+        except ValueError:
+            return True
+
+    @staticmethod
+    def parse_attributes(vals, tmin=None, tmax=None):
+        has_tmax = Marker._has_tmax(vals)
+        if tmin is None:
+            tmin = pyrocko.util.str_to_time( vals[0] + ' ' + vals[1] )
+            tmax = tmin
+            if has_tmax:
+                tmax = pyrocko.util.str_to_time( vals[2] + ' ' + vals[3] )
+
         i = 2
-        tmax = tmin
-        if len(vals) == 7:
-            tmax = pyrocko.util.str_to_time( vals[2] + ' ' + vals[3] )
+        if has_tmax:
             i = 5
 
         kind = int(vals[i])
@@ -499,8 +677,8 @@ class Marker(object):
         return nslc_ids, tmin, tmax, kind
 
     @staticmethod
-    def from_attributes(vals):
-        return Marker(*Marker.parse_attributes(vals))
+    def from_attributes(vals, tmin=None, tmax=None):
+        return Marker(*Marker.parse_attributes(vals, tmin, tmax))
 
     def select_color(self, colorlist):
         cl = lambda x: colorlist[(self.kind*3+x)%len(colorlist)]
@@ -661,7 +839,7 @@ class EventMarker(Marker):
         if self._event_hash is not None:
             return self._event_hash
         else:
-            self._event.get_hash()
+            return self._event.get_hash()
 
     def set_active(self, active):
         self._active = active
@@ -702,7 +880,7 @@ class EventMarker(Marker):
         attributes.extend(Marker.get_attributes(self))
         del attributes[-1]
         e = self._event
-        attributes.extend([e.get_hash(), e.lat, e.lon, e.depth, e.magnitude, e.catalog, e.name, e.region ])
+        attributes.extend([self.get_event_hash(), e.lat, e.lon, e.depth, e.magnitude, e.catalog, e.name, e.region ])
         return attributes
 
     def get_attribute_widths(self):
@@ -713,9 +891,9 @@ class EventMarker(Marker):
         return ws
 
     @staticmethod
-    def from_attributes(vals):
+    def from_attributes(vals, tmin=None, tmax=None):
 
-        nslc_ids, tmin, tmax, kind = Marker.parse_attributes(vals[1:] + [ 'None' ])
+        nslc_ids, tmin, tmax, kind = Marker.parse_attributes(vals[1:] + [ 'None' ], tmin, tmax)
         lat, lon, depth, magnitude = [ str_to_float_or_none( x ) for x in vals[5:9] ]
         catalog, name, region = [ str_to_str_or_none(x) for x in vals[9:] ]
         e = pyrocko.model.Event(lat, lon, tmin, name, depth, magnitude, region, catalog=catalog)
@@ -778,7 +956,7 @@ class PhaseMarker(Marker):
     def get_attributes(self):
         attributes = [ 'phase:' ]
         attributes.extend(Marker.get_attributes(self))
-        h = None
+        h = self._event_hash
         et = None, None
         if self._event:
             h = self._event.get_hash()
@@ -794,8 +972,8 @@ class PhaseMarker(Marker):
         return ws
 
     @staticmethod
-    def from_attributes(vals):
-        nslc_ids, tmin, tmax, kind = Marker.parse_attributes(vals[1:])
+    def from_attributes(vals, tmin=None, tmax=None):
+        nslc_ids, tmin, tmax, kind = Marker.parse_attributes(vals[1:], tmin, tmax)
        
         i = 8
         if len(vals) == 14:
@@ -1,5 +1,5 @@
 import pile, io, util
-import os, logging
+import os, time, logging, threading, Queue
 import trace as tracemod
 
 logger = logging.getLogger('pyrocko.hamster_pile')
@@ -107,15 +107,261 @@ class Grower(Processor):
         else:
             return []
 
+class BackgroundWriter(threading.Thread):
+    '''Thread writing traces to files, so that the caller does not block.
+
+    Write requests are queued with :py:meth:`put`. Whenever the thread gets
+    to work, it takes all queued requests at once and merges contiguous
+    traces of the same NSLC before saving them, so that a writer which falls
+    behind produces fewer and larger files. Results of completed writes can
+    be collected with :py:meth:`get_done` as tuples ``(keys, traces,
+    filenames)``, where ``keys`` are those of the merged requests and
+    ``filenames`` is ``None`` if the write failed.
+
+    :param max_queued_bytes: if not ``None``, :py:meth:`put` blocks while
+        more than this amount of sample data is queued or being written
+        (back-pressure)
+    '''
+
+    def __init__(self, max_queued_bytes=None):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self._max_queued_bytes = max_queued_bytes
+        self._cond = threading.Condition()
+        self._todo = []
+        self._queued_bytes = 0
+        self._nwriting = 0
+        self._closing = False
+        self._done = Queue.Queue()
+        self._stats = dict(
+            queued_bytes_max=0,
+            nblocked=0,
+            tblocked=0.0,
+            nrequests=0,
+            nwrites=0,
+            nfiles=0,
+            nfailed=0)
+
+    def put(self, key, traces, path, format):
+        nbytes = sum([ tr.ydata.nbytes for tr in traces ])
+        self._cond.acquire()
+        try:
+            tblock = None
+            while self._max_queued_bytes is not None and \
+                    self._queued_bytes > 0 and \
+                    self._queued_bytes + nbytes > self._max_queued_bytes:
+
+                if tblock is None:
+                    tblock = time.time()
+                    self._stats['nblocked'] += 1
+
+                self._cond.wait()
+
+            if tblock is not None:
+                self._stats['tblocked'] += time.time() - tblock
+
+            self._todo.append((key, traces, path, format, nbytes))
+            self._queued_bytes += nbytes
+            self._stats['nrequests'] += 1
+            self._stats['queued_bytes_max'] = max(
+                self._stats['queued_bytes_max'], self._queued_bytes)
+
+            self._cond.notifyAll()
+
+        finally:
+            self._cond.release()
+
+    def run(self):
+        while True:
+            self._cond.acquire()
+            try:
+                while not self._todo and not self._closing:
+                    self._cond.wait()
+
+                if not self._todo:
+                    break
+
+                batch = self._todo
+                self._todo = []
+                self._nwriting += len(batch)
+
+            finally:
+                self._cond.release()
+
+            nfiles, nfailed = 0, 0
+            try:
+                try:
+                    writes = coalesce_writes(batch)
+                except Exception, e:
+                    logger.error('Merging write requests failed: %s' % e)
+                    writes = None
+
+                if writes is None:
+                    for key, traces, path, format, nbytes in batch:
+                        self._done.put(([ key ], traces, None))
+                        nfailed += 1
+
+                else:
+                    for keys, traces, path, format in writes:
+                        try:
+                            fns = io.save(traces, path, format=format)
+                            nfiles += len(fns)
+                        except Exception, e:
+                            logger.error('Writing traces failed: %s' % e)
+                            fns = None
+                            nfailed += 1
+
+                        self._done.put((keys, traces, fns))
+
+            finally:
+                # always release the batch, flush() and put() wait for it
+                self._cond.acquire()
+                try:
+                    self._nwriting -= len(batch)
+                    self._queued_bytes -= sum([ item[-1] for item in batch ])
+                    self._stats['nwrites'] += 1
+                    self._stats['nfiles'] += nfiles
+                    self._stats['nfailed'] += nfailed
+                    self._cond.notifyAll()
+
+                finally:
+                    self._cond.release()
+
+    def get_done(self):
+        done = []
+        while True:
+            try:
+                done.append(self._done.get_nowait())
+            except Queue.Empty:
+                return done
+
+    def get_stats(self):
+        '''Get back-pressure and throughput metrics.
+
+        Returns a dict with the number of bytes currently queued
+        (``queued_bytes``) and its maximum so far (``queued_bytes_max``), how
+        often and how long :py:meth:`put` had to wait (``nblocked``,
+        ``tblocked``), and the numbers of write requests, write batches,
+        files written and failed writes (``nrequests``, ``nwrites``,
+        ``nfiles``, ``nfailed``).
+        '''
+
+        self._cond.acquire()
+        try:
+            stats = dict(self._stats)
+            stats['queued_bytes'] = self._queued_bytes
+            return stats
+
+        finally:
+            self._cond.release()
+
+    def flush(self):
+        '''Wait until all queued writes are completed.'''
+
+        self._cond.acquire()
+        try:
+            while self._todo or self._nwriting:
+                self._cond.wait()
+
+        finally:
+            self._cond.release()
+
+    def close(self):
+        '''Write all queued data and stop the thread.'''
+
+        self._cond.acquire()
+        try:
+            self._closing = True
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+        self.join()
+
+def coalesce_writes(requests):
+    '''Merge write requests of contiguous traces with the same NSLC.
+
+    :param requests: list of tuples ``(key, traces, path, format, ...)``
+    :returns: list of tuples ``(keys, traces, path, format)``
+
+    Traces are merged when they go to the same path template and format,
+    have equal sampling rate and sample type and continue each other without
+    gap. Merged traces are copies, the input traces are not modified.
+    '''
+
+    groups = {}
+    order = []
+    for request in requests:
+        key, traces, path, format = request[:4]
+        for tr in traces:
+            k = (path, format, tr.nslc_id)
+            if k not in groups:
+                groups[k] = []
+                order.append(k)
+
+            groups[k].append((tr.tmin, key, tr))
+
+    merged = []
+    for k in order:
+        path, format, _ = k
+        items = groups[k]
+        items.sort(key=lambda item: item[0])
+        keys, ctr, copied = None, None, False
+        for _, key, tr in items:
+            if ctr is not None:
+                if ctr.deltat == tr.deltat and \
+                        ctr.ydata.dtype == tr.ydata.dtype and \
+                        abs(ctr.tmax + ctr.deltat - tr.tmin) < 0.1*ctr.deltat:
+
+                    if not copied:
+                        ctr = ctr.copy()
+                        copied = True
+
+                    ctr.append(tr.ydata)
+                    if key not in keys:
+                        keys.append(key)
+
+                    continue
+
+                merged.append((keys, [ ctr ], path, format))
+
+            keys, ctr, copied = [ key ], tr, False
+
+        merged.append((keys, [ ctr ], path, format))
+
+    return merged
+
 class HamsterPile(pile.Pile):
     
-    def __init__(self, fixation_length=None, path=None, format='from_extension', forget_fixed=False, processors=None):
+    def __init__(self, fixation_length=None, path=None, format='from_extension', forget_fixed=False, processors=None,
+            cache=None, background_writes=False, max_queued_bytes=None):
+        '''Pile collecting traces from an acquisition process.
+
+        Incoming traces are appended to in-memory buffer traces, which are
+        written to files ("fixated") when they exceed ``fixation_length``.
+        The written files replace the buffers in the pile, with trace headers
+        taken from memory, so files are not read back. If a
+        :py:class:`pile.TracesFileCache` is given as ``cache``, their
+        entries are put into it. With ``background_writes``, files are
+        written by a :py:class:`BackgroundWriter` thread and buffers are
+        replaced once their files are complete. ``max_queued_bytes`` limits
+        the memory used by data waiting to be written, see
+        :py:class:`BackgroundWriter`.
+        '''
+
         pile.Pile.__init__(self)
         self._buffers = {}          # keys: nslc,  values: MemTracesFile
         self._fixation_length = fixation_length
         self._format = format
         self._path = path
         self._forget_fixed = forget_fixed
+        self._cache = cache
+        self._writer = None
+        self._writing = set()       # MemTracesFiles waiting to be written
+        if background_writes:
+            self._writer = BackgroundWriter(max_queued_bytes=max_queued_bytes)
+            self._writer.start()
+
         if processors is None:
             self._processors = [ Processor() ]
         else:
@@ -148,6 +394,7 @@ class HamsterPile(pile.Pile):
                 self._insert_trace(tr)
 
     def _insert_trace(self, trace):
+        self._collect_written()
         buf = self._append_to_buffer(trace)
         nslc = trace.nslc_id
         
@@ -193,15 +440,57 @@ class HamsterPile(pile.Pile):
             self._fixate(buf)
             
         self._buffers = {}
+        if self._writer is not None:
+            self._writer.flush()
+            self._collect_written()
+
+        if self._cache is not None:
+            self._cache.dump_modified()
 
     def _fixate(self, buf):
         if self._path:
             trbuf = buf.get_traces()[0]
-            fns = io.save([trbuf], self._path, format=self._format)
-            
-            self.remove_file(buf)
-            if not self._forget_fixed:
-                self.load_files(fns, show_progress=False, fileformat=self._format)
+            if self._writer is not None:
+                self._writing.add(buf)
+                self._writer.put(buf, [trbuf], self._path, self._format)
+            else:
+                fns = io.save([trbuf], self._path, format=self._format)
+                self._replace_fixated([buf], [trbuf], fns)
+
+    def _collect_written(self):
+        if self._writer is None:
+            return
+
+        for bufs, traces, fns in self._writer.get_done():
+            for buf in bufs:
+                self._writing.discard(buf)
+
+            if fns is not None:
+                self._replace_fixated(bufs, traces, fns)
+
+    def _replace_fixated(self, bufs, traces, fns):
+        for buf in bufs:
+            subpile = buf.get_parent()
+            if subpile is not None:
+                subpile.remove_file(buf)
+
+        if not self._forget_fixed:
+            for fn in fns:
+                if len(fns) == 1:
+                    fn_traces = traces
+                else:
+                    fn_traces = [ tr for tr in traces
+                                  if tr.fill_template(self._path) == fn ]
+
+                abspath = os.path.abspath(fn)
+                file = pile.TracesFile(None, abspath, self._format,
+                                       traces=fn_traces)
+
+                self.dispatch(file).add_file(file)
+                if self._cache is not None:
+                    self._cache.put(abspath, file)
+
+        self.notify_listeners('update')
         
     def drop_older(self, tmax, delete_disk_files=False):
         self.drop(
@@ -212,17 +501,37 @@ class HamsterPile(pile.Pile):
         candidates = []
         buffers = self._buffers.values()
         for file in self.iter_files():
-            if condition(file) and file not in buffers:
+            if condition(file) and file not in buffers and \
+                    file not in self._writing:
                 candidates.append(file)
         
         self.remove_files(candidates)
         if delete_disk_files:
             for file in candidates:
-                if file.abspath and os.path.exists(file.abspath):
-                    os.unlink(file.abspath)
+                abspath = getattr(file, 'abspath', None)
+                if abspath and os.path.exists(abspath):
+                    os.unlink(abspath)
 
                 
-    def __del__(self):
+    def get_writer_stats(self):
+        '''Get metrics of the background writer, see
+        :py:meth:`BackgroundWriter.get_stats`, or ``None``.'''
+
+        if self._writer is None:
+            return None
+
+        return self._writer.get_stats()
+
+    def close(self):
+        '''Fixate all buffers, wait for pending writes and stop the writer.'''
+
         self.fixate_all()
+        if self._writer is not None:
+            self._writer.close()
+            self._collect_written()
+            self._writer = None
+
+    def __del__(self):
+        self.close()
         
         
@@ -0,0 +1,6 @@
+# This module is automatically created from setup.py
+git_sha1 = None
+local_modifications = None
+version = '0.2'
+long_version = 'pyrocko-0.2-2026-10-19_09:01:21'
+installed_date = '2026-10-19_09:01:21'
@@ -133,7 +133,8 @@ def iload(filename, format='mseed', getdata=True, substitutions=None ):
         except (OSError, MSeedError), e:
             raise FileLoadError(e)
     
-def save(traces, filename_template, format='mseed', additional={}, stations=None):
+def save(traces, filename_template, format='mseed', additional={}, stations=None,
+         record_length=4096, encoding=None):
     '''Save traces to file(s).
     
     :param traces: a trace or an iterable of traces to store
@@ -143,9 +144,13 @@ def save(traces, filename_template, format='mseed', additional={}, stations=None
             ``channel``, ``tmin`` (time of first sample), ``tmax`` (time of last
             sample), ``tmin_ms``, ``tmax_ms``, ``tmin_us``, ``tmax_us``. The
             versions with '_ms' include milliseconds, the versions with '_us'
-            include microseconds.
+            include microseconds. ``tmin_year``, ``tmin_jday``, ``tmax_year``,
+            and ``tmax_jday`` give year and day of year.
     :param format: ``mseed``, ``sac``, ``text``, or ``yaff``.
     :param additional: dict with custom template placeholder fillins.
+    :param record_length: record length in bytes, for ``mseed`` format
+    :param encoding: data encoding for ``mseed`` format, see
+            :py:func:`pyrocko.mseed.save`
     :returns: list of generated filenames
 
     .. note:: 
@@ -159,7 +164,8 @@ def save(traces, filename_template, format='mseed', additional={}, stations=None
         format = os.path.splitext(filename_template)[1][1:]
 
     if format == 'mseed':
-        return mseed.save(traces, filename_template, additional)
+        return mseed.save(traces, filename_template, additional,
+                          record_length=record_length, encoding=encoding)
     
     elif format == 'sac':
         fns = []
@@ -194,6 +200,162 @@ def save(traces, filename_template, format='mseed', additional={}, stations=None
     else:
         raise UnknownFormat(format)
 
+class Writer(object):
+    '''Incrementally save traces to file(s).
+
+    Traces can be given in several calls to :py:meth:`write`, e.g. window by
+    window while traversing a pile. Traces going to the same file are
+    appended to it. At most ``max_open_files`` files are kept open at a time;
+    when more are needed, the least recently used file is closed, to be
+    reopened in append mode when needed again. Files which already exist are
+    overwritten when first touched by the writer, unless ``append`` is
+    ``True``.
+
+    If the filename template contains any of the day dependent placeholders
+    ``tmin_year``, ``tmin_jday``, ``tmax_year`` or ``tmax_jday``, traces are
+    split at day boundaries (UTC), so that each file gets only the samples of
+    its day.
+
+    :param filename_template: filename template, as in :py:func:`save`
+    :param format: ``mseed``, ``sac``, ``text``, or ``yaff``. SAC files hold
+            a single trace, so traces with the same filename replace each
+            other.
+    :param additional: dict with custom template placeholder fillins.
+    :param max_open_files: maximum number of simultaneously open files
+    :param append: append to existing files instead of overwriting them
+    :param record_length: record length in bytes, for ``mseed`` format
+    :param encoding: data encoding for ``mseed`` format, see
+            :py:func:`pyrocko.mseed.save`
+    :param stations: stations, as in :py:func:`save`
+
+    Call :py:meth:`close` when done, to flush and close all files.
+    '''
+
+    def __init__(self, filename_template, format='mseed', additional={},
+                 max_open_files=10, append=False, record_length=4096,
+                 encoding=None, stations=None):
+
+        if format == 'from_extension':
+            format = os.path.splitext(filename_template)[1][1:]
+
+        if format not in ('mseed', 'sac', 'text', 'yaff'):
+            raise UnknownFormat(format)
+
+        self.filename_template = filename_template
+        self.format = format
+        self.additional = additional
+        self.max_open_files = max(1, max_open_files)
+        self.append = append
+        self.record_length = record_length
+        self.encoding = encoding
+        self.stations = stations
+
+        self._split_days = any(('(%s)' % k) in filename_template for k in
+                               ('tmin_year', 'tmin_jday', 'tmax_year',
+                                'tmax_jday'))
+
+        self._open_files = {}       # keys: filenames, values: open files
+        self._last_used = {}        # keys: filenames, values: use counter
+        self._counter = 0
+        self._filenames = []
+        self._touched = set()
+
+    def _get_file(self, fn):
+        if fn in self._open_files:
+            f = self._open_files[fn]
+
+        else:
+            if len(self._open_files) >= self.max_open_files:
+                lru = min(self._open_files, key=self._last_used.__getitem__)
+                self._open_files.pop(lru).close()
+                del self._last_used[lru]
+
+            if fn not in self._touched:
+                util.ensuredirs(fn)
+                self._filenames.append(fn)
+                self._touched.add(fn)
+                mode = 'wa'[self.append]
+            else:
+                mode = 'a'
+
+            f = open(fn, mode + 'b')
+            self._open_files[fn] = f
+
+        self._counter += 1
+        self._last_used[fn] = self._counter
+        return f
+
+    def _split(self, tr):
+        if not self._split_days or \
+                util.day_start(tr.tmin) == util.day_start(tr.tmax):
+            return [ tr ]
+
+        pieces = []
+        for dmin, dmax in util.iter_days(tr.tmin, tr.tmax + tr.deltat):
+            try:
+                pieces.append(tr.chop(dmin, dmax, inplace=False))
+            except trace.NoData:
+                pass
+
+        return pieces
+
+    def write(self, traces):
+        '''Write a trace or an iterable of traces.'''
+
+        if isinstance(traces, trace.Trace):
+            traces = [ traces ]
+
+        for x in traces:
+            for tr in self._split(x):
+                self._write_trace(tr)
+
+    def _write_trace(self, tr):
+        fn = tr.fill_template(self.filename_template, **self.additional)
+        if self.format == 'sac':
+            save(tr, fn, format='sac', stations=self.stations)
+            if fn not in self._touched:
+                self._filenames.append(fn)
+                self._touched.add(fn)
+
+            return
+
+        f = self._get_file(fn)
+        if self.format == 'mseed':
+            f.write(mseed.to_bytes([ tr ],
+                                   record_length=self.record_length,
+                                   encoding=self.encoding))
+
+        elif self.format == 'text':
+            num.savetxt(f, num.transpose((tr.get_xdata(), tr.get_ydata())))
+
+        elif self.format == 'yaff':
+            tf = yaff.TracesFileIO(f)
+            tf.save([ tr ])
+            tf.close()
+
+    def flush(self):
+        '''Flush all open files.'''
+
+        for f in self._open_files.values():
+            f.flush()
+
+    def close(self):
+        '''Close all open files.
+
+        :returns: list of filenames written since creation of the writer
+        '''
+
+        while self._open_files:
+            self._open_files.popitem()[1].close()
+
+        self._last_used.clear()
+        return list(self._filenames)
+
+    def get_filenames(self):
+        '''Get list of filenames written so far.'''
+
+        return list(self._filenames)
+
 class FileLoadError(Exception):
     '''Raised when a problem occurred while loading of a file.'''
     pass
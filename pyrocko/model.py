@@ -124,8 +124,15 @@ class Event:
             file.write('duration = %g\n' % self.duration)
 
     @staticmethod
-    def unique(events, deltat=10., group_cmp=(lambda a,b: cmp(a.catalog, b.catalog))):
-        groups = Event.grouped(events, deltat)
+    def unique(events, deltat=10., group_cmp=(lambda a,b: cmp(a.catalog, b.catalog)), distance=None, magnitude=None):
+        '''Remove duplicate events, e.g. after merging several catalogs.
+
+        From each group of events as found by :py:meth:`grouped`, the last
+        event after sorting the group with ``group_cmp`` is kept.
+        '''
+
+        groups = Event.grouped(events, deltat, distance=distance,
+                               magnitude=magnitude)
         
         events = []
         for group in groups:
@@ -136,22 +143,84 @@ class Event:
         return events
 
     @staticmethod
-    def grouped(events, deltat=10.):
+    def grouped(events, deltat=10., distance=None, magnitude=None):
+        '''Group events which are close in time and optionally in space.
+
+        :param events: list of :py:class:`Event` objects
+        :param deltat: events differing in time by less than ``deltat`` [s]
+            are considered to be the same
+        :param distance: if not ``None``, events must also be closer than
+            ``distance`` [m]
+        :param magnitude: if not ``None``, magnitudes must also differ by
+            less than ``magnitude``, events without magnitude match any
+            magnitude
+        :returns: list of groups (lists of events)
+
+        Each event is assigned to the first preceding event in ``events`` it
+        matches, or to itself if there is none. Events assigned to the same
+        event form a group and groups are ordered by that event. Matching
+        pairs are searched in time sorted order, so that run time grows with
+        ``n log n`` for catalogs where only few events fall into a time
+        window.
+        '''
+
         events = list(events)
-        groups = []
-        for ia,a in enumerate(events):
-            groups.append([])
-            haveit = False
-            for ib,b in enumerate(events[:ia]):
-                if abs(b.time - a.time) < deltat:
-                    groups[ib].append(a)
-                    haveit = True
-                    break
+        n = len(events)
+        if n == 0:
+            return []
+
+        times = num.array([ ev.time for ev in events ], dtype=num.float)
+        order = num.argsort(times, kind='mergesort')
+        times = times[order]
+
+        if distance is not None:
+            lats = num.array([ ev.lat for ev in events ], dtype=num.float)[order]
+            lons = num.array([ ev.lon for ev in events ], dtype=num.float)[order]
 
-            if not haveit:
-                groups[ia].append(a)
+        if magnitude is not None:
+            mags = num.array([ (ev.magnitude, num.nan)[ev.magnitude is None]
+                               for ev in events ], dtype=num.float)[order]
 
-        return [ g for g in groups if g ]
+        # index of the group founding event, for each event in input order
+        ifounder = num.arange(n)
+
+        # compare each event with its k-th successor in time, as long as
+        # there are pairs within deltat
+        active = num.arange(n)
+        k = 1
+        while True:
+            active = active[active + k < n]
+            ia, ib = active, active + k
+            within = num.abs(times[ib] - times[ia]) < deltat
+            active = active[within]
+            if active.size == 0:
+                break
+
+            ia, ib = ia[within], ib[within]
+            match = num.ones(ia.size, dtype=num.bool)
+            if distance is not None:
+                match &= orthodrome.distance_accurate50m_numpy(
+                    lats[ia], lons[ia], lats[ib], lons[ib]) < distance
+
+            if magnitude is not None:
+                # missing magnitudes are NaN, the comparison is then False
+                olderr = num.seterr(invalid='ignore')
+                try:
+                    match &= ~(num.abs(mags[ib] - mags[ia]) >= magnitude)
+                finally:
+                    num.seterr(**olderr)
+
+            oa, ob = order[ia[match]], order[ib[match]]
+            early, late = num.minimum(oa, ob), num.maximum(oa, ob)
+            num.minimum.at(ifounder, late, early)
+            k += 1
+
+        iorder = num.argsort(ifounder, kind='mergesort')
+        bounds = num.concatenate((
+            [0], num.nonzero(num.diff(ifounder[iorder]))[0] + 1, [n]))
+
+        return [ [ events[i] for i in iorder[bounds[j]:bounds[j+1]] ]
+                 for j in xrange(bounds.size-1) ]
 
     @staticmethod
     def dump_catalog(events, filename):
@@ -254,6 +323,337 @@ class Event:
         return util.base36encode(abs(hash((util.time_to_str(e.time), str(e.lat), str(e.lon), str(e.depth), str(e.magnitude), e.catalog, e.name, e.region)))).lower()
 
 
+class EventCatalog:
+    '''Column oriented container for large numbers of events.
+
+    Event attributes are held in numpy arrays, one per column, so that
+    selection, sorting and spatial queries can be done without touching
+    individual :py:class:`Event` objects. Missing values of ``depth``,
+    ``magnitude``, ``duration`` and of the moment tensor components are
+    stored as NaN. Strings (``name``, ``region`` and ``catalog``) are kept
+    in a table of unique strings, the columns hold indices into it, with -1
+    for ``None``.
+
+    Use :py:meth:`from_events` and :py:meth:`get_events` to convert from and
+    to lists of :py:class:`Event` objects and :py:meth:`dump` and
+    :py:meth:`load` for the binary on-disk format.
+    '''
+
+    float_columns = ('time', 'lat', 'lon', 'depth', 'magnitude', 'duration',
+                     'mnn', 'mee', 'mdd', 'mne', 'mnd', 'med')
+    string_columns = ('name', 'region', 'catalog')
+    optional_columns = ('depth', 'magnitude', 'duration')
+    mt_columns = ('mnn', 'mee', 'mdd', 'mne', 'mnd', 'med')
+
+    def __init__(self, strings=(), **columns):
+        '''Create catalog from columns.
+
+        :param strings: list of strings referenced by the string columns
+        :param columns: numpy arrays for the columns listed in
+            :py:attr:`float_columns` and :py:attr:`string_columns`, missing
+            columns are set to NaN or -1, respectively
+        '''
+
+        n = None
+        for k, v in columns.iteritems():
+            if k not in self.float_columns and k not in self.string_columns:
+                raise TypeError('invalid column name: %s' % k)
+
+            if n is None:
+                n = len(v)
+            elif len(v) != n:
+                raise ValueError('all columns must have the same length')
+
+        if n is None:
+            n = 0
+
+        for k in self.float_columns:
+            if k in columns:
+                v = num.asarray(columns[k], dtype=num.float)
+            else:
+                v = num.empty(n, dtype=num.float)
+                v.fill(num.nan)
+
+            setattr(self, k, v)
+
+        for k in self.string_columns:
+            if k in columns:
+                v = num.asarray(columns[k], dtype=num.int32)
+            else:
+                v = num.empty(n, dtype=num.int32)
+                v.fill(-1)
+
+            setattr(self, k, v)
+
+        self.strings = list(strings)
+
+    def __len__(self):
+        return self.time.size
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.get_event(i)
+
+    def __getitem__(self, index):
+        '''Get single event by integer index, or sub-catalog by slice, index
+        array or boolean mask.'''
+
+        if isinstance(index, (int, long, num.integer)):
+            return self.get_event(index)
+        else:
+            return self._subset(index)
+
+    def _subset(self, index):
+        columns = {}
+        for k in self.float_columns + self.string_columns:
+            columns[k] = getattr(self, k)[index]
+
+        return EventCatalog(strings=self.strings, **columns)
+
+    @staticmethod
+    def from_events(events):
+        '''Create catalog from list of :py:class:`Event` objects.'''
+
+        events = list(events)
+        n = len(events)
+        columns = {}
+        for k in EventCatalog.float_columns:
+            columns[k] = num.empty(n, dtype=num.float)
+            columns[k].fill(num.nan)
+
+        for k in EventCatalog.string_columns:
+            columns[k] = num.empty(n, dtype=num.int32)
+
+        strings = []
+        string_index = {}
+        def intern(s):
+            if s is None:
+                return -1
+
+            if s not in string_index:
+                string_index[s] = len(strings)
+                strings.append(s)
+
+            return string_index[s]
+
+        for i, ev in enumerate(events):
+            columns['time'][i] = ev.time
+            columns['lat'][i] = ev.lat
+            columns['lon'][i] = ev.lon
+            for k in EventCatalog.optional_columns:
+                v = getattr(ev, k)
+                if v is not None:
+                    columns[k][i] = v
+
+            if ev.moment_tensor is not None:
+                m = ev.moment_tensor.m()
+                for k, v in zip(EventCatalog.mt_columns,
+                        (m[0,0], m[1,1], m[2,2], m[0,1], m[0,2], m[1,2])):
+                    columns[k][i] = v
+
+            for k in EventCatalog.string_columns:
+                columns[k][i] = intern(getattr(ev, k))
+
+        return EventCatalog(strings=strings, **columns)
+
+    def get_event(self, i):
+        '''Get event at index ``i`` as :py:class:`Event` object.'''
+
+        def optional(v):
+            v = float(v)
+            if num.isnan(v):
+                return None
+            return v
+
+        def string(j):
+            if j < 0:
+                return None
+            return self.strings[j]
+
+        mt = None
+        m6 = [ float(getattr(self, k)[i]) for k in self.mt_columns ]
+        if not num.any(num.isnan(m6)):
+            mt = moment_tensor.MomentTensor(m=moment_tensor.symmat6(*m6))
+
+        return Event(
+            lat=float(self.lat[i]),
+            lon=float(self.lon[i]),
+            time=float(self.time[i]),
+            name=string(self.name[i]) or '',
+            depth=optional(self.depth[i]),
+            magnitude=optional(self.magnitude[i]),
+            region=string(self.region[i]),
+            catalog=string(self.catalog[i]),
+            moment_tensor=mt,
+            duration=optional(self.duration[i]))
+
+    def get_events(self):
+        '''Get list of :py:class:`Event` objects.'''
+
+        return [ self.get_event(i) for i in xrange(len(self)) ]
+
+    def get_strings(self, column):
+        '''Get list of strings of a string column, ``None`` where unset.'''
+
+        strings = self.strings + [ None ]
+        return [ strings[j] for j in getattr(self, column) ]
+
+    def select(self, tmin=None, tmax=None, magmin=None, magmax=None,
+               depthmin=None, depthmax=None, latmin=None, latmax=None,
+               lonmin=None, lonmax=None, lat=None, lon=None, distmax=None,
+               catalog=None, mask=None):
+        '''Get sub-catalog of events matching given criteria.
+
+        :param tmin,tmax: time range, ``tmin <= time < tmax``
+        :param magmin,magmax: magnitude range, inclusive
+        :param depthmin,depthmax: depth range [m], inclusive
+        :param latmin,latmax: latitude range, inclusive
+        :param lonmin,lonmax: longitude range, inclusive, crossing the
+            dateline if ``lonmin > lonmax``
+        :param lat,lon,distmax: select events closer than ``distmax`` [m] to
+            the point at ``(lat, lon)``
+        :param catalog: name of the catalog the events come from
+        :param mask: additional boolean array to combine with the criteria
+
+        Events with missing magnitude or depth are excluded if the
+        respective range is restricted.
+        '''
+
+        sel = num.ones(len(self), dtype=num.bool)
+        if mask is not None:
+            sel &= mask
+
+        if tmin is not None:
+            sel &= self.time >= tmin
+        if tmax is not None:
+            sel &= self.time < tmax
+
+        # missing values are NaN, the comparisons are then False
+        olderr = num.seterr(invalid='ignore')
+        try:
+            if magmin is not None:
+                sel &= self.magnitude >= magmin
+            if magmax is not None:
+                sel &= self.magnitude <= magmax
+            if depthmin is not None:
+                sel &= self.depth >= depthmin
+            if depthmax is not None:
+                sel &= self.depth <= depthmax
+        finally:
+            num.seterr(**olderr)
+
+        if latmin is not None:
+            sel &= self.lat >= latmin
+        if latmax is not None:
+            sel &= self.lat <= latmax
+
+        if lonmin is not None or lonmax is not None:
+            lmin, lmax = -180., 180.
+            if lonmin is not None:
+                lmin = lonmin
+            if lonmax is not None:
+                lmax = lonmax
+
+            lons = wrap(self.lon, -180., 180.)
+            if lmin <= lmax:
+                # lons are in [-180, 180), check 180 too
+                sel &= ((lmin <= lons) & (lons <= lmax)) | \
+                       ((lmin <= lons + 360.) & (lons + 360. <= lmax))
+            else:
+                sel &= (lmin <= lons) | (lons <= lmax)
+
+        if distmax is not None:
+            sel &= self.distances_to(lat, lon) < distmax
+
+        if catalog is not None:
+            if catalog in self.strings:
+                sel &= self.catalog == self.strings.index(catalog)
+            else:
+                sel[:] = False
+
+        return self._subset(sel)
+
+    def sorted(self, key='time', reverse=False):
+        '''Get copy of the catalog, sorted by the given float column.'''
+
+        order = num.argsort(getattr(self, key), kind='mergesort')
+        if reverse:
+            order = order[::-1]
+
+        return self._subset(order)
+
+    def distances_to(self, lat, lon):
+        '''Get distances [m] of all events to the point at ``(lat, lon)``.'''
+
+        return orthodrome.distance_accurate50m_numpy(
+            self.lat, self.lon, lat, lon)
+
+    def dump(self, filename):
+        '''Save catalog in binary format.
+
+        The file is a numpy ``.npz`` archive with one array per column and
+        the string table. Only strings in use are written. Unicode strings are
+        stored UTF-8 encoded and are decoded again by :py:meth:`load`.
+        '''
+
+        used = num.unique(num.concatenate(
+            [ getattr(self, k) for k in self.string_columns ] + [[-1]]))
+        used = used[used >= 0]
+        remap = num.empty(len(self.strings)+1, dtype=num.int32)
+        remap[-1] = -1
+        remap[used] = num.arange(used.size, dtype=num.int32)
+        strings = [ self.strings[j] for j in used ]
+
+        arrays = {}
+        for k in self.float_columns:
+            arrays[k] = getattr(self, k)
+
+        for k in self.string_columns:
+            arrays[k] = remap[getattr(self, k)]
+
+        is_unicode = []
+        for j, s in enumerate(strings):
+            is_unicode.append(isinstance(s, unicode))
+            if is_unicode[-1]:
+                strings[j] = s.encode('utf-8')
+
+        arrays['strings'] = num.array(strings, dtype=num.str)
+        arrays['strings_unicode'] = num.array(is_unicode, dtype=num.bool)
+        arrays['version'] = num.array([ 1 ], dtype=num.int32)
+
+        f = open(filename, 'wb')
+        try:
+            num.savez(f, **arrays)
+        finally:
+            f.close()
+
+    @staticmethod
+    def load(filename):
+        '''Load catalog from file written by :py:meth:`dump`.'''
+
+        f = open(filename, 'rb')
+        try:
+            try:
+                data = num.load(f)
+                columns = {}
+                for k in EventCatalog.float_columns + \
+                         EventCatalog.string_columns:
+                    columns[k] = data[k]
+
+                strings = data['strings'].tolist()
+                if 'strings_unicode' in data.files:
+                    for j in num.nonzero(data['strings_unicode'])[0]:
+                        strings[j] = strings[j].decode('utf-8')
+
+            except (KeyError, IOError, ValueError), e:
+                raise FileParseError(e)
+
+        finally:
+            f.close()
+
+        return EventCatalog(strings=strings, **columns)
+
+
 class Station:
     def __init__(self, network='', station='', location='', lat=0.0, lon=0.0, elevation=0.0, depth=None, name='', channels=None):
         self.network = network
@@ -379,6 +779,90 @@ class Station:
         s = '%-15s  %14g %14g %14g %14g %s' % (nsl, sta.lat, sta.lon, elevation, depth, sta.name)
         return s
 
+_relative_data_cache = {}
+_relative_data_cache_order = []     # keys, least recently used first
+_relative_data_cache_size = 16
+
+def _latlons(objects):
+    latlons = num.zeros((len(objects), 2), dtype=num.float)
+    for i, obj in enumerate(objects):
+        latlons[i] = obj.lat, obj.lon
+
+    return latlons
+
+def event_station_matrices(events, stations, accurate=True):
+    '''Get distances and azimuths between all events and all stations.
+
+    :param events: list of objects with ``lat`` and ``lon`` attributes, e.g.
+        :py:class:`Event` objects
+    :param stations: list of objects with ``lat`` and ``lon`` attributes,
+        e.g. :py:class:`Station` objects
+    :param accurate: if ``True``, distances are computed on the spheroid with
+        :py:func:`orthodrome.distance_accurate50m_numpy`, otherwise on the
+        sphere
+    :returns: tuple ``(dist_m, dist_deg, azimuth, backazimuth)`` of read-only
+        numpy arrays of shape ``(len(events), len(stations))``
+
+    The values match those set by :py:meth:`Station.set_event_relative_data`
+    for each pair. Results are cached for the most recently used
+    combinations of event and station coordinates, the least recently used
+    entry is evicted when the cache is full.
+    '''
+
+    a = _latlons(events)
+    b = _latlons(stations)
+    key = (bool(accurate), a.shape, a.tostring(), b.shape, b.tostring())
+    if key in _relative_data_cache:
+        _relative_data_cache_order.remove(key)
+        _relative_data_cache_order.append(key)
+        return _relative_data_cache[key]
+
+    a_lats, a_lons = a[:,0,num.newaxis], a[:,1,num.newaxis]
+    b_lats, b_lons = b[num.newaxis,:,0], b[num.newaxis,:,1]
+
+    if accurate:
+        dist_m = orthodrome.distance_accurate50m_numpy(
+            a_lats, a_lons, b_lats, b_lons)
+        dist_deg = dist_m / orthodrome.earthradius_equator * orthodrome.r2d
+    else:
+        cosdelta = orthodrome.cosdelta_numpy(a_lats, a_lons, b_lats, b_lons)
+        dist_deg = orthodrome.r2d * num.arccos(num.clip(cosdelta, -1., 1.))
+        dist_m = dist_deg * orthodrome.d2m
+
+    azimuth = orthodrome.azimuth_numpy(a_lats, a_lons, b_lats, b_lons)
+    backazimuth = orthodrome.azimuth_numpy(b_lats, b_lons, a_lats, a_lons)
+
+    result = dist_m, dist_deg, azimuth, backazimuth
+    for x in result:
+        x.flags.writeable = False
+
+    if len(_relative_data_cache) >= _relative_data_cache_size:
+        del _relative_data_cache[_relative_data_cache_order.pop(0)]
+
+    _relative_data_cache[key] = result
+    _relative_data_cache_order.append(key)
+    return result
+
+def set_stations_event_relative_data(stations, event, accurate=True):
+    '''Set distance and azimuth attributes of many stations at once.
+
+    Vectorized equivalent to calling :py:meth:`Station.set_event_relative_data`
+    on each station in ``stations``.
+    '''
+
+    stations = list(stations)
+    if not stations:
+        return
+
+    dist_m, dist_deg, azimuth, backazimuth = event_station_matrices(
+        [ event ], stations, accurate=accurate)
+
+    for i, sta in enumerate(stations):
+        sta.dist_m = float(dist_m[0,i])
+        sta.dist_deg = float(dist_deg[0,i])
+        sta.azimuth = float(azimuth[0,i])
+        sta.backazimuth = float(backazimuth[0,i])
+
 def dump_stations(stations, filename):
     f = open(filename, 'w')
     for sta in stations:
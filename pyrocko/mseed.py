@@ -2,26 +2,40 @@ import mseed_ext
 from mseed_ext import HPTMODULUS, MSeedError
 import trace
 import os
+import numpy as num
 from util import reuse, ensuredirs
 
-def load(filename, getdata=True):
-
-    mtime = os.stat(filename)[8]
+def _tuples_to_traces(trtups, mtime=None, source='buffer'):
     traces = []
-    for tr in mseed_ext.get_traces( filename, getdata ):
+    for tr in trtups:
         network, station, location, channel = tr[1:5]
         tmin = float(tr[5])/float(HPTMODULUS)
         tmax = float(tr[6])/float(HPTMODULUS)
         try:
             deltat = reuse(float(1.0)/float(tr[7]))
         except ZeroDivisionError, e:
-            raise MSeedError('Trace in file %s has a sampling rate of zero.' % filename)
+            raise MSeedError('Trace in %s has a sampling rate of zero.' % source)
         ydata = tr[8]
         
         traces.append(trace.Trace(network, station, location, channel, tmin, tmax, deltat, ydata, mtime=mtime))
     
     return traces
-    
+
+def load(filename, getdata=True):
+
+    mtime = os.stat(filename)[8]
+    return _tuples_to_traces(mseed_ext.get_traces( filename, getdata ),
+                             mtime=mtime, source='file %s' % filename)
+
+def from_bytes(data, getdata=True):
+    '''Decode traces from a string or buffer of miniSEED records.
+
+    Records which belong together are merged into one trace, as when loading
+    from a file. No temporary files are involved.
+    '''
+
+    return _tuples_to_traces(mseed_ext.get_traces_from_buffer( data, getdata ))
+
 def as_tuple(tr):
     itmin = int(round(tr.tmin*HPTMODULUS))
     itmax = int(round(tr.tmax*HPTMODULUS))
@@ -29,7 +43,86 @@ def as_tuple(tr):
     return (tr.network, tr.station, tr.location, tr.channel, 
             itmin, itmax, srate, tr.get_ydata())
 
-def save(traces, filename_template, additional={}):
+# libmseed data encoding codes
+encodings = {
+    'ASCII': 0,
+    'INT32': 3,
+    'FLOAT32': 4,
+    'FLOAT64': 5,
+    'STEIM1': 10,
+    'STEIM2': 11 }
+
+_encoding_dtypes = {
+    'ASCII': num.int8,
+    'INT32': num.int32,
+    'FLOAT32': num.float32,
+    'FLOAT64': num.float64,
+    'STEIM1': num.int32,
+    'STEIM2': num.int32 }
+
+def _check_convertible(tr, dtype):
+    '''Raise :py:exc:`MSeedError` if data would be altered by conversion to
+    integer type *dtype*.'''
+
+    y = tr.ydata
+    if y.size == 0:
+        return
+
+    if not num.issubdtype(y.dtype, num.integer):
+        if not num.all(num.floor(y) == y):
+            raise MSeedError(
+                'Cannot store non-integer data of trace %s with integer '
+                'encoding' % '.'.join(tr.nslc_id))
+
+    info = num.iinfo(dtype)
+    if y.min() < info.min or y.max() > info.max:
+        raise MSeedError(
+            'Data of trace %s out of range for %s encoding' % (
+                '.'.join(tr.nslc_id), num.dtype(dtype).name))
+
+def _prepare(traces, encoding):
+    '''Get libmseed encoding code and traces with data of matching type.'''
+
+    if encoding is None:
+        return traces, -1
+
+    if encoding not in encodings:
+        raise MSeedError('Unsupported miniSEED encoding: %s' % encoding)
+
+    dtype = _encoding_dtypes[encoding]
+    prepared = []
+    for tr in traces:
+        if tr.ydata is not None and tr.ydata.dtype != dtype:
+            if num.issubdtype(dtype, num.integer):
+                _check_convertible(tr, dtype)
+
+            tr = tr.copy(data=False)
+            tr.ydata = tr.ydata.astype(dtype)
+
+        prepared.append(tr)
+
+    return prepared, encodings[encoding]
+
+def save(traces, filename_template, additional={}, record_length=4096,
+         encoding=None):
+    '''Save traces to miniSEED file(s).
+
+    :param traces: iterable of traces to store
+    :param filename_template: filename template, see :py:func:`pyrocko.io.save`
+    :param additional: dict with custom template placeholder fillins
+    :param record_length: length of the miniSEED records in bytes, a power of
+        two, e.g. 512 or 4096
+    :param encoding: one of ``'STEIM1'``, ``'STEIM2'``, ``'INT32'``,
+        ``'FLOAT32'``, ``'FLOAT64'`` or ``'ASCII'``. Data is converted to the
+        type required by the encoding, if necessary. :py:exc:`MSeedError` is
+        raised if an integer encoding is requested for data which is not
+        integral or out of range of the integer type. If ``None``, the encoding
+        is chosen by data type: Steim2 for integer data (Steim1 if the sample
+        differences are too large for Steim2) and FLOAT32 or FLOAT64 for
+        floating point data.
+    :returns: list of generated filenames
+    '''
+
     fn_tr = {}
     for tr in traces:
         fn = tr.fill_template(filename_template, **additional)
@@ -39,17 +132,21 @@ def save(traces, filename_template, additional={}):
         fn_tr[fn].append(tr)
         
     for fn, traces_thisfile in fn_tr.items():
-        trtups = []
-        traces_thisfile.sort(lambda a,b: cmp(a.full_id, b.full_id))
-        for tr in traces_thisfile:
-            trtups.append(as_tuple(tr))
-        
+        traces_thisfile.sort(key=lambda tr: tr.full_id)
+        traces_thisfile, code = _prepare(traces_thisfile, encoding)
         ensuredirs(fn)
         try:
-            mseed_ext.store_traces(trtups, fn)
+            mseed_ext.store_traces(traces_thisfile, fn, record_length, code)
         except MSeedError, e:
             raise MSeedError( str(e) + ' (while storing traces to file \'%s\')' % fn)
             
     return fn_tr.keys()
-    
-    
+
+def to_bytes(traces, record_length=4096, encoding=None):
+    '''Encode traces to a string of miniSEED records.
+
+    See :py:func:`save` for the meaning of the arguments.
+    '''
+
+    traces, code = _prepare(list(traces), encoding)
+    return mseed_ext.store_traces_to_buffer(traces, record_length, code)
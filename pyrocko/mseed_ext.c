@@ -18,46 +18,18 @@ static PyObject *MSeedError;
 
 
 static PyObject*
-mseed_get_traces (PyObject *dummy, PyObject *args)
+traces_to_list (MSTraceGroup *mstg, int unpackdata)
 {
-    char          *filename;
-    MSTraceGroup  *mstg = NULL;
     MSTrace       *mst = NULL;
-    int           retcode;
     npy_intp      array_dims[1] = {0};
     PyObject      *array = NULL;
     PyObject      *out_traces = NULL;
     PyObject      *out_trace = NULL;
     int           numpytype;
     char          strbuf[BUFSIZE];
-    PyObject      *unpackdata = NULL;
-
-    if (!PyArg_ParseTuple(args, "sO", &filename, &unpackdata)) {
-        PyErr_SetString(MSeedError, "usage get_traces(filename, dataflag)" );
-        return NULL;
-    }
-
-    if (!PyBool_Check(unpackdata)) {
-        PyErr_SetString(MSeedError, "Second argument must be a boolean" );
-        return NULL;
-    }
-  
-    /* get data from mseed file */
-    retcode = ms_readtraces (&mstg, filename, 0, -1.0, -1.0, 0, 1, (unpackdata == Py_True), 0);
-    if ( retcode < 0 ) {
-        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, ms_errorstr(retcode));
-        PyErr_SetString(MSeedError, strbuf);
-        return NULL;
-    }
-
-    if ( ! mstg ) {
-        snprintf (strbuf, BUFSIZE, "Error reading file");
-        PyErr_SetString(MSeedError, strbuf);
-        return NULL;
-    }
 
     /* check that there is data in the traces */
-    if (unpackdata == Py_True) {
+    if (unpackdata) {
         mst = mstg->traces;
         while (mst) {
             if (mst->datasamples == NULL) {
@@ -77,7 +49,7 @@ mseed_get_traces (PyObject *dummy, PyObject *args)
 
     while (mst) {
         
-        if (unpackdata == Py_True) {
+        if (unpackdata) {
             array_dims[0] = mst->numsamples;
             switch (mst->sampletype) {
                 case 'i':
@@ -126,96 +98,318 @@ mseed_get_traces (PyObject *dummy, PyObject *args)
         mst = mst->next;
     }
 
+    return out_traces;
+}
+
+static PyObject*
+mseed_get_traces (PyObject *dummy, PyObject *args)
+{
+    char          *filename;
+    MSTraceGroup  *mstg = NULL;
+    int           retcode;
+    PyObject      *out_traces = NULL;
+    char          strbuf[BUFSIZE];
+    PyObject      *unpackdata = NULL;
+
+    if (!PyArg_ParseTuple(args, "sO", &filename, &unpackdata)) {
+        PyErr_SetString(MSeedError, "usage get_traces(filename, dataflag)" );
+        return NULL;
+    }
+
+    if (!PyBool_Check(unpackdata)) {
+        PyErr_SetString(MSeedError, "Second argument must be a boolean" );
+        return NULL;
+    }
+  
+    /* get data from mseed file */
+    retcode = ms_readtraces (&mstg, filename, 0, -1.0, -1.0, 0, 1, (unpackdata == Py_True), 0);
+    if ( retcode < 0 ) {
+        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, ms_errorstr(retcode));
+        PyErr_SetString(MSeedError, strbuf);
+        return NULL;
+    }
+
+    if ( ! mstg ) {
+        snprintf (strbuf, BUFSIZE, "Error reading file");
+        PyErr_SetString(MSeedError, strbuf);
+        return NULL;
+    }
+
+    out_traces = traces_to_list(mstg, (unpackdata == Py_True));
     mst_freegroup (&mstg);
 
     return out_traces;
 }
 
-static void record_handler (char *record, int reclen, void *outfile) {    
-    if ( fwrite(record, reclen, 1, outfile) != 1 ) {
-      fprintf(stderr, "Error writing mseed record to output file\n");
+/* Get length of record at start of buffer. Like ms_find_reclen, but without
+ * a 1000 blockette, the length is found by looking for the next record
+ * header in the buffer itself. */
+static int
+find_reclen (char *recbuf, int recbuflen)
+{
+    int           reclen;
+
+    reclen = ms_find_reclen (recbuf, recbuflen, NULL);
+    if (reclen != 0) return reclen;
+
+    for (reclen = MINRECLEN; reclen <= MAXRECLEN && reclen <= recbuflen; reclen *= 2) {
+        if (reclen == recbuflen ||
+                (reclen + 48 <= recbuflen && MS_ISVALIDHEADER(recbuf + reclen))) {
+            return reclen;
+        }
     }
+    return -1;
 }
 
 static PyObject*
-mseed_store_traces (PyObject *dummy, PyObject *args)
+mseed_get_traces_from_buffer (PyObject *dummy, PyObject *args)
 {
-    char          *filename;
-    MSTrace       *mst = NULL;
-    PyObject      *array = NULL;
-    PyObject      *in_traces = NULL;
-    PyObject      *in_trace = NULL;
-    PyArrayObject *contiguous_array = NULL;
-    int           i;
-    char          *network, *station, *location, *channel;
-    char          mstype;
-    int           msdetype;
-    int           psamples, precords;
-    int           numpytype;
-    int           length;
-    FILE          *outfile;
+    char          *buffer;
+    int           buflen;
+    int           offset = 0;
+    int           reclen;
+    MSTraceGroup  *mstg = NULL;
+    MSRecord      *msr = NULL;
+    int           retcode;
+    PyObject      *out_traces = NULL;
+    char          strbuf[BUFSIZE];
+    PyObject      *unpackdata = NULL;
 
-    if (!PyArg_ParseTuple(args, "Os", &in_traces, &filename)) {
-        PyErr_SetString(MSeedError, "usage store_traces(traces, filename)" );
-        return NULL;
-    }
-    if (!PySequence_Check( in_traces )) {
-        PyErr_SetString(MSeedError, "Traces is not of sequence type." );
+    if (!PyArg_ParseTuple(args, "s#O", &buffer, &buflen, &unpackdata)) {
+        PyErr_SetString(MSeedError, "usage get_traces_from_buffer(buffer, dataflag)" );
         return NULL;
     }
 
-    outfile = fopen(filename, "w" );
-    if (outfile == NULL) {
-        PyErr_SetString(MSeedError, "Error opening file.");
+    if (!PyBool_Check(unpackdata)) {
+        PyErr_SetString(MSeedError, "Second argument must be a boolean" );
         return NULL;
     }
 
-    for (i=0; i<PySequence_Length(in_traces); i++) {
-        
-        in_trace = PySequence_GetItem(in_traces, i);
-        if (!PyTuple_Check(in_trace)) {
-            PyErr_SetString(MSeedError, "Trace record must be a tuple of (network, station, location, channel, starttime, endtime, samprate, data)." );
-            Py_DECREF(in_trace);
+    mstg = mst_initgroup (NULL);
+
+    while (buflen - offset >= 48) {
+        if (!MS_ISVALIDHEADER(buffer + offset)) {
+            /* skip non-data chunks, as ms_readtraces does */
+            offset += MINRECLEN;
+            continue;
+        }
+
+        reclen = find_reclen (buffer + offset, buflen - offset);
+        if (reclen < 0 || reclen > buflen - offset) {
+            snprintf (strbuf, BUFSIZE, "Cannot determine length of record at byte offset %i", offset);
+            PyErr_SetString(MSeedError, strbuf);
+            mst_freegroup (&mstg);
             return NULL;
         }
-        mst = mst_init (NULL);
-        
+
+        retcode = msr_unpack (buffer + offset, reclen, &msr, (unpackdata == Py_True), 0);
+        if ( retcode != MS_NOERROR ) {
+            snprintf (strbuf, BUFSIZE, "Cannot unpack record at byte offset %i: %s", offset, ms_errorstr(retcode));
+            PyErr_SetString(MSeedError, strbuf);
+            msr_free (&msr);
+            mst_freegroup (&mstg);
+            return NULL;
+        }
+
+        mst_addmsrtogroup (mstg, msr, 0, -1.0, -1.0);
+        offset += reclen;
+    }
+
+    msr_free (&msr);
+
+    out_traces = traces_to_list(mstg, (unpackdata == Py_True));
+    mst_freegroup (&mstg);
+
+    return out_traces;
+}
+
+typedef struct {
+    char   *data;
+    size_t len;
+    size_t allocated;
+    int    failed;
+} membuffer_t;
+
+static void record_handler (char *record, int reclen, void *outfile) {    
+    if ( fwrite(record, reclen, 1, outfile) != 1 ) {
+      fprintf(stderr, "Error writing mseed record to output file\n");
+    }
+}
+
+static void record_handler_membuffer (char *record, int reclen, void *handlerdata) {
+    membuffer_t *buf = (membuffer_t*)handlerdata;
+    char        *data;
+    size_t      allocated;
+
+    if (buf->failed) return;
+
+    if (buf->len + reclen > buf->allocated) {
+        allocated = buf->allocated * 2;
+        if (allocated < buf->len + reclen) allocated = buf->len + reclen;
+        data = realloc(buf->data, allocated);
+        if (data == NULL) {
+            buf->failed = 1;
+            return;
+        }
+        buf->data = data;
+        buf->allocated = allocated;
+    }
+    memcpy(buf->data + buf->len, record, reclen);
+    buf->len += reclen;
+}
+
+#define TRACE_USAGE "Trace must be a tuple of (network, station, location, channel, starttime, endtime, samprate, data) or an object with attributes network, station, location, channel, tmin, deltat and ydata."
+
+static const char *trace_attributes[] = {
+    "network", "station", "location", "channel", "tmin", "deltat", "ydata" };
+
+static void
+set_codes (MSRecord *msr, char *network, char *station, char *location, char *channel)
+{
+    strncpy( msr->network, network, 10);
+    strncpy( msr->station, station, 10);
+    strncpy( msr->location, location, 10);
+    strncpy( msr->channel, channel, 10);
+    msr->network[10] = '\0';
+    msr->station[10] = '\0';
+    msr->location[10] ='\0';
+    msr->channel[10] = '\0';
+}
+
+/* Fill codes, start time and sampling rate of `msr` from a trace tuple or
+ * from a trace object. Returns new reference to the data array or NULL with
+ * exception set. */
+static PyObject*
+get_trace_header (PyObject *in_trace, MSRecord *msr)
+{
+    char          *network, *station, *location, *channel;
+    hptime_t      endtime;
+    double        tmin, deltat;
+    PyObject      *array = NULL;
+    PyObject      *attributes = NULL;
+    PyObject      *attribute = NULL;
+    int           i;
+
+    if (PyTuple_Check(in_trace)) {
         if (!PyArg_ParseTuple(in_trace, "ssssLLdO",
                                     &network,
                                     &station,
                                     &location,
                                     &channel,
-                                    &(mst->starttime),
-                                    &(mst->endtime),
-                                    &(mst->samprate),
+                                    &(msr->starttime),
+                                    &endtime,
+                                    &(msr->samprate),
                                     &array )) {
-            PyErr_SetString(MSeedError, "Trace record must be a tuple of (network, station, location, channel, starttime, endtime, samprate, data)." );
-            mst_free( &mst );  
-            Py_DECREF(in_trace);
+            PyErr_SetString(MSeedError, TRACE_USAGE);
             return NULL;
         }
+        set_codes(msr, network, station, location, channel);
+        Py_INCREF(array);
+        return array;
+    }
 
-        strncpy( mst->network, network, 10);
-        strncpy( mst->station, station, 10);
-        strncpy( mst->location, location, 10);
-        strncpy( mst->channel, channel, 10);
-        mst->network[10] = '\0';
-        mst->station[10] = '\0';
-        mst->location[10] ='\0';
-        mst->channel[10] = '\0';
+    /* read attributes of trace object, avoiding the conversion to tuples
+     * in python */
+    attributes = PyTuple_New(7);
+    for (i=0; i<7; i++) {
+        attribute = PyObject_GetAttrString(in_trace, trace_attributes[i]);
+        if (attribute == NULL) {
+            PyErr_SetString(MSeedError, TRACE_USAGE);
+            Py_DECREF(attributes);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(attributes, i, attribute);
+    }
+
+    if (!PyArg_ParseTuple(attributes, "ssssddO",
+                                &network,
+                                &station,
+                                &location,
+                                &channel,
+                                &tmin,
+                                &deltat,
+                                &array ) || deltat <= 0.0) {
+        PyErr_SetString(MSeedError, TRACE_USAGE);
+        Py_DECREF(attributes);
+        return NULL;
+    }
+
+    set_codes(msr, network, station, location, channel);
+    msr->starttime = (hptime_t)(tmin*HPTMODULUS + (tmin >= 0.0 ? 0.5 : -0.5));
+    msr->samprate = 1.0/deltat;
+    Py_INCREF(array);
+    Py_DECREF(attributes);
+    return array;
+}
+
+/* Check if differences between subsequent samples fit into the 30 bits
+ * available in Steim2 compression. */
+static int
+steim2_usable (int32_t *samples, npy_intp n)
+{
+    npy_intp      i;
+    int64_t       diff;
+
+    for (i=1; i<n; i++) {
+        diff = (int64_t)samples[i] - (int64_t)samples[i-1];
+        if (diff < -536870912 || diff > 536870911) return 0;
+    }
+    return 1;
+}
+
+/* Pack all traces in sequence `in_traces` and pass the records to
+ * `handler`. If `encoding` is -1, it is chosen according to the type of the
+ * data: Steim2 (or Steim1 if not possible) for int32, ASCII for int8, and
+ * FLOAT32 and FLOAT64 for float data. Returns 0 on success, -1 with
+ * exception set otherwise. */
+static int
+pack_traces (PyObject *in_traces, void (*handler) (char *, int, void *), void *handlerdata, int reclen, int encoding)
+{
+    MSRecord      *msr = NULL;
+    PyObject      *array = NULL;
+    PyObject      *in_trace = NULL;
+    PyArrayObject *contiguous_array = NULL;
+    int           i;
+    char          mstype;
+    int           msdetype;
+    int           psamples, precords;
+    int           numpytype;
+    npy_intp      length;
+    char          strbuf[BUFSIZE];
+
+    if (reclen < 256 || reclen > 65536 || (reclen & (reclen - 1)) != 0) {
+        PyErr_SetString(MSeedError, "Record length must be a power of two between 256 and 65536.");
+        return -1;
+    }
+
+    for (i=0; i<PySequence_Length(in_traces); i++) {
         
+        in_trace = PySequence_GetItem(in_traces, i);
+        msr = msr_init (NULL);
+        array = get_trace_header(in_trace, msr);
+        Py_DECREF(in_trace);
+        if (array == NULL) {
+            msr_free( &msr );
+            return -1;
+        }
+
         if (!PyArray_Check(array)) {
             PyErr_SetString(MSeedError, "Data must be given as NumPy array." );
-            mst_free( &mst );  
-            Py_DECREF(in_trace);
-            return NULL;
+            Py_DECREF(array);
+            msr_free( &msr );  
+            return -1;
         }
-        numpytype = PyArray_TYPE(array);
+
+        contiguous_array = PyArray_GETCONTIGUOUS((PyArrayObject*)array);
+        Py_DECREF(array);
+        length = PyArray_SIZE(contiguous_array);
+
+        numpytype = PyArray_TYPE(contiguous_array);
         switch (numpytype) {
                 case NPY_INT32:
                     assert( ms_samplesize('i') == 4 );
                     mstype = 'i';
-                    msdetype = DE_STEIM1;
+                    msdetype = steim2_usable((int32_t*)PyArray_DATA(contiguous_array), length) ? DE_STEIM2 : DE_STEIM1;
                     break;
                 case NPY_INT8:
                     assert( ms_samplesize('a') == 1 );
@@ -234,33 +428,123 @@ mseed_store_traces (PyObject *dummy, PyObject *args)
                     break;
                 default:
                     PyErr_SetString(MSeedError, "Data must be of type float64, float32, int32 or int8.");
-                    mst_free( &mst );  
-                    Py_DECREF(in_trace);
-                    return NULL;
+                    Py_DECREF(contiguous_array);
+                    msr_free( &msr );  
+                    return -1;
             }
-        mst->sampletype = mstype;
-
-        contiguous_array = PyArray_GETCONTIGUOUS((PyArrayObject*)array);
 
-        length = PyArray_SIZE(contiguous_array);
-        mst->numsamples = length;
-        mst->samplecnt = length;
+        if (encoding != -1) {
+            if (!((encoding == DE_ASCII && mstype == 'a') ||
+                  ((encoding == DE_INT32 || encoding == DE_STEIM1 || encoding == DE_STEIM2) && mstype == 'i') ||
+                  (encoding == DE_FLOAT32 && mstype == 'f') ||
+                  (encoding == DE_FLOAT64 && mstype == 'd'))) {
+                snprintf (strbuf, BUFSIZE, "Encoding %i cannot be used for data of type %s.",
+                          encoding, (mstype == 'i' ? "int32" : mstype == 'a' ? "int8" : mstype == 'f' ? "float32" : "float64"));
+                PyErr_SetString(MSeedError, strbuf);
+                Py_DECREF(contiguous_array);
+                msr_free( &msr );  
+                return -1;
+            }
+            msdetype = encoding;
+        }
 
-        mst->datasamples = calloc(length,ms_samplesize(mstype));
-        memcpy(mst->datasamples, PyArray_DATA(contiguous_array), length*ms_samplesize(mstype));
+        /* pack directly from the numpy array; msr_pack does not modify the
+         * samples */
+        msr->dataquality = 'D';
+        msr->reclen = reclen;
+        msr->encoding = msdetype;
+        msr->byteorder = 1;
+        msr->sampletype = mstype;
+        msr->numsamples = length;
+        msr->datasamples = PyArray_DATA(contiguous_array);
+
+        Py_BEGIN_ALLOW_THREADS
+        precords = msr_pack (msr, handler, handlerdata, &psamples, 1, 0);
+        Py_END_ALLOW_THREADS
+
+        msr->datasamples = NULL;
         Py_DECREF(contiguous_array);
 
-        precords = mst_pack (mst, &record_handler, outfile, 4096, msdetype,
-                                     1, &psamples, 1, 0, NULL);
-        mst_free( &mst );
-        Py_DECREF(in_trace);
+        if (precords < 0) {
+            snprintf (strbuf, BUFSIZE, "Packing of trace %s.%s.%s.%s failed.",
+                      msr->network, msr->station, msr->location, msr->channel);
+            PyErr_SetString(MSeedError, strbuf);
+            msr_free( &msr );
+            return -1;
+        }
+        msr_free( &msr );
+    }
+
+    return 0;
+}
+
+static PyObject*
+mseed_store_traces (PyObject *dummy, PyObject *args)
+{
+    char          *filename;
+    PyObject      *in_traces = NULL;
+    FILE          *outfile;
+    int           retcode;
+    int           reclen = 4096;
+    int           encoding = -1;
+
+    if (!PyArg_ParseTuple(args, "Os|ii", &in_traces, &filename, &reclen, &encoding)) {
+        PyErr_SetString(MSeedError, "usage store_traces(traces, filename, reclen=4096, encoding=-1)" );
+        return NULL;
+    }
+    if (!PySequence_Check( in_traces )) {
+        PyErr_SetString(MSeedError, "Traces is not of sequence type." );
+        return NULL;
+    }
+
+    outfile = fopen(filename, "w" );
+    if (outfile == NULL) {
+        PyErr_SetString(MSeedError, "Error opening file.");
+        return NULL;
     }
+
+    retcode = pack_traces(in_traces, &record_handler, outfile, reclen, encoding);
     fclose( outfile );
+    if (retcode != 0) return NULL;
 
     Py_INCREF(Py_None);
     return Py_None;
 }
 
+static PyObject*
+mseed_store_traces_to_buffer (PyObject *dummy, PyObject *args)
+{
+    PyObject      *in_traces = NULL;
+    PyObject      *out_buffer = NULL;
+    membuffer_t   buf = { NULL, 0, 0, 0 };
+    int           reclen = 4096;
+    int           encoding = -1;
+
+    if (!PyArg_ParseTuple(args, "O|ii", &in_traces, &reclen, &encoding)) {
+        PyErr_SetString(MSeedError, "usage store_traces_to_buffer(traces, reclen=4096, encoding=-1)" );
+        return NULL;
+    }
+    if (!PySequence_Check( in_traces )) {
+        PyErr_SetString(MSeedError, "Traces is not of sequence type." );
+        return NULL;
+    }
+
+    if (pack_traces(in_traces, &record_handler_membuffer, &buf, reclen, encoding) != 0) {
+        free(buf.data);
+        return NULL;
+    }
+
+    if (buf.failed) {
+        PyErr_SetString(MSeedError, "Cannot allocate memory for packed records.");
+        free(buf.data);
+        return NULL;
+    }
+
+    out_buffer = PyString_FromStringAndSize(buf.data, buf.len);
+    free(buf.data);
+    return out_buffer;
+}
+
 
 static PyMethodDef MSEEDMethods[] = {
     {"get_traces",  mseed_get_traces, METH_VARARGS, 
@@ -274,8 +558,25 @@ static PyMethodDef MSEEDMethods[] = {
     "in libmseed. If dataflag is True, `data` is a numpy array containing the\n"
     "data. If dataflag is False, the data is not unpacked and `data` is None.\n" },
 
+    {"get_traces_from_buffer",  mseed_get_traces_from_buffer, METH_VARARGS, 
+    "get_traces_from_buffer(buffer, dataflag)\n"
+    "Get all traces stored in a string or buffer of mseed records.\n\n"
+    "Works like get_traces, but decodes the records in memory.\n" },
+
     {"store_traces",  mseed_store_traces, METH_VARARGS, 
-    "store_traces(traces, filename)\n" },
+    "store_traces(traces, filename, reclen=4096, encoding=-1)\n"
+    "Store traces to an mseed file.\n\n"
+    "Traces can be given as tuples\n\n"
+    "  (network, station, location, channel, starttime, endtime, samprate, data)\n\n"
+    "or as objects with attributes network, station, location, channel, tmin,\n"
+    "deltat and ydata. The data is packed into records of length `reclen`\n"
+    "using libmseed encoding `encoding`. With encoding -1 it is chosen by data\n"
+    "type: Steim2 (Steim1 if differences are too large) for int32, ASCII for\n"
+    "int8, FLOAT32 and FLOAT64 for float32 and float64.\n" },
+
+    {"store_traces_to_buffer",  mseed_store_traces_to_buffer, METH_VARARGS, 
+    "store_traces_to_buffer(traces, reclen=4096, encoding=-1)\n"
+    "Like store_traces, but return the mseed records as a string.\n" },
 
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
@@ -32,7 +32,7 @@ def azimuth(a, b):
                            math.sin(d2r*b.lat) - math.sin(d2r*a.lat) * cosdelta(a,b) )
                            
 def azimuth_numpy(a_lats, a_lons, b_lats, b_lons, _cosdelta=None):
-    if _cosdelta == None:
+    if _cosdelta is None:
         _cosdelta = cosdelta_numpy(a_lats,a_lons,b_lats,b_lons)
         
     return r2d*num.arctan2( num.cos(a_lats*d2r) * num.cos(b_lats*d2r) * 
@@ -90,13 +90,20 @@ def distance_accurate50m_numpy( a_lats, a_lons, b_lats, b_lons ):
     c = num.cos(g)**2 * num.cos(l)**2 + num.sin(f)**2 * num.sin(l)**2
 
     w = num.arctan( num.sqrt( s/c ) )
+    
+    # avoid division by zero for coincident points, distance is zero there
+    zero = w == 0.0
+    w = num.where(zero, 1.0, w)
+    s = num.where(zero, 1.0, s)
+    
     r = num.sqrt(s*c)/w
     d = 2.*w*earthradius_equator
     h1 = (3.*r-1.)/(2.*c)
     h2 = (3.*r+1.)/(2.*s)
 
-    return d * (1.+ earth_oblateness * h1 * num.sin(f)**2 * num.cos(g)**2 - 
-                    earth_oblateness * h2 * num.cos(f)**2 * num.sin(g)**2)
+    return num.where(zero, 0.0, 
+                d * (1.+ earth_oblateness * h1 * num.sin(f)**2 * num.cos(g)**2 - 
+                    earth_oblateness * h2 * num.cos(f)**2 * num.sin(g)**2))
 
 def ne_to_latlon( lat0, lon0, north_m, east_m ):
     '''Transform local carthesian coordinates to latitude and longitude.
@@ -1,9 +1,9 @@
 '''A pile contains subpiles which contain tracesfiles which contain traces.'''
 
-import trace, io, util, config
+import trace, io, util, config, orthodrome
 
 import numpy as num
-import os, pickle, logging, time, weakref, copy, re, sys
+import os, heapq, pickle, logging, time, weakref, copy, re, sys, calendar
 import cPickle as pickle
 pjoin = os.path.join
 logger = logging.getLogger('pyrocko.pile')
@@ -201,6 +201,217 @@ def loader(filenames, fileformat, cache, filename_attributes, show_progress=True
     if cache:
         cache.dump_modified()
 
+# file name patterns of waveform archive layouts
+archive_layouts = {
+    # YEAR/NET/STA/CHAN.TYPE/NET.STA.LOC.CHAN.TYPE.YEAR.DAY
+    'sds': re.compile(r'^(?P<network>[^.]*)\.(?P<station>[^.]*)\.'
+                      r'(?P<location>[^.]*)\.(?P<channel>[^.]*)\.[A-Z]\.'
+                      r'(?P<year>\d{4})\.(?P<jday>\d{3})$'),
+
+    # NET/STA/STA.NET.LOC.CHAN.YEAR.DAY
+    'bud': re.compile(r'^(?P<station>[^.]*)\.(?P<network>[^.]*)\.'
+                      r'(?P<location>[^.]*)\.(?P<channel>[^.]*)\.'
+                      r'(?P<year>\d{4})\.(?P<jday>\d{3})$') }
+
+def parse_archive_path(path, layout='sds'):
+    '''Get codes and day of a file in a waveform archive from its path.
+
+    :param path: path of the file
+    :param layout: archive layout, ``'sds'`` or ``'bud'``
+    :returns: tuple ``((network, station, location, channel), tmin, tmax)``
+        where *tmin* and *tmax* are the beginning and end of the day covered
+        by the file, or ``None`` if the filename does not follow the layout.
+    '''
+
+    m = archive_layouts[layout].match(os.path.basename(path))
+    if not m:
+        return None
+
+    d = m.groupdict()
+    nslc = tuple(d[k] for k in ('network', 'station', 'location', 'channel'))
+    tmin = calendar.timegm((int(d['year']), 1, 1, 0, 0, 0)) + \
+            (int(d['jday'])-1) * 24*3600.
+
+    return nslc, tmin, tmin + 24*3600.
+
+def iter_archive_files(path, layout='sds', tmin=None, tmax=None):
+    '''Find files of a waveform archive, without accessing the files.
+
+    :param path: root directory of the archive
+    :param layout: archive layout, ``'sds'`` or ``'bud'``
+    :param tmin: if given, skip days ending before this time
+    :param tmax: if given, skip days beginning after this time
+    :returns: iterator yielding ``(abspath, nslc, tmin, tmax)`` as in
+        :py:func:`parse_archive_path`
+    '''
+
+    if layout not in archive_layouts:
+        raise ValueError('unknown archive layout: %s' % layout)
+
+    root = os.path.abspath(path)
+    for dirpath, dirnames, filenames in os.walk(root):
+        if layout == 'sds' and dirpath == root and \
+                (tmin is not None or tmax is not None):
+            # prune year directories outside of the time span
+            dirnames[:] = [
+                d for d in dirnames if not (
+                    d.isdigit() and len(d) == 4 and (
+                        (tmin is not None and int(d) < time.gmtime(tmin)[0]) or
+                        (tmax is not None and int(d) > time.gmtime(tmax)[0])))
+            ]
+
+        dirnames.sort()
+        for fn in sorted(filenames):
+            info = parse_archive_path(fn, layout)
+            if info is None:
+                continue
+
+            nslc, ftmin, ftmax = info
+            if (tmin is not None and ftmax < tmin) or \
+                    (tmax is not None and tmax < ftmin):
+                continue
+
+            yield (pjoin(dirpath, fn),) + info
+
+def phase_windows(event, stations, table, phases_begin, phases_end,
+                  offset_begin=0., offset_end=0.):
+    '''Get time windows delimited by phase arrivals for stations of an event.
+
+    :param event: :py:class:`pyrocko.model.Event` object
+    :param stations: list of :py:class:`pyrocko.model.Station` objects
+    :param table: :py:class:`pyrocko.cake.TravelTimeTable` object containing
+        all the given phases, e.g. as returned by 
+        :py:func:`pyrocko.cake.get_traveltime_table`
+    :param phases_begin: :py:class:`pyrocko.cake.PhaseDef` object or list of
+        such, the first arrival of which defines the start of the windows
+    :param phases_end: :py:class:`pyrocko.cake.PhaseDef` object or list of
+        such, the first arrival of which defines the end of the windows
+    :param offset_begin: time added to the start times [s]
+    :param offset_end: time added to the end times [s]
+    :returns: tuple of arrays ``(tmins, tmaxs)`` with window start and end
+        times for each station, ``nan`` where a phase has no arrival in
+        the table
+
+    For a window from 10 s before the P arrival to 60 s after the S arrival,
+    use ``offset_begin=-10.`` and ``offset_end=60.``.
+    '''
+
+    lats = num.array([ s.lat for s in stations ], dtype=num.float)
+    lons = num.array([ s.lon for s in stations ], dtype=num.float)
+    distances = orthodrome.distance_accurate50m_numpy(
+        event.lat, event.lon, lats, lons) / orthodrome.earthradius_equator * orthodrome.r2d
+
+    depth = event.depth or 0.
+    tmins = event.time + offset_begin + \
+            table.interpolate(distances, depth, phases=phases_begin)
+    tmaxs = event.time + offset_end + \
+            table.interpolate(distances, depth, phases=phases_end)
+
+    return tmins, tmaxs
+
+class MinMaxTracker(object):
+
+    '''Multiset of values with fast lookup of its minimum and maximum.
+
+    Insertion and removal are O(log n). Removed values are dropped lazily
+    from the heaps, when they show up at the top.
+    '''
+
+    def __init__(self):
+        self._counts = {}
+        self._minheap = []
+        self._maxheap = []
+
+    def add(self, x):
+        if x is None:
+            return
+
+        n = self._counts.get(x, 0)
+        self._counts[x] = n + 1
+        if n == 0:
+            heapq.heappush(self._minheap, x)
+            heapq.heappush(self._maxheap, -x)
+
+    def remove(self, x):
+        if x is None:
+            return
+
+        n = self._counts[x]
+        if n == 1:
+            del self._counts[x]
+            if len(self._minheap) > 2*len(self._counts) + 32:
+                self._minheap = self._counts.keys()
+                self._maxheap = [ -v for v in self._minheap ]
+                heapq.heapify(self._minheap)
+                heapq.heapify(self._maxheap)
+        else:
+            self._counts[x] = n - 1
+
+    def min(self):
+        h = self._minheap
+        while h and h[0] not in self._counts:
+            heapq.heappop(h)
+
+        if h:
+            return h[0]
+        else:
+            return None
+
+    def max(self):
+        h = self._maxheap
+        while h and -h[0] not in self._counts:
+            heapq.heappop(h)
+
+        if h:
+            return -h[0]
+        else:
+            return None
+
+class OrderedSet(object):
+
+    '''Set which iterates over its elements in insertion order.
+
+    Insertion, removal and membership tests are O(1). Removed elements leave
+    holes in the ordered list, which is compacted when they dominate.
+    '''
+
+    def __init__(self):
+        self._index = {}
+        self._elements = []
+
+    def add(self, x):
+        if x not in self._index:
+            self._index[x] = len(self._elements)
+            self._elements.append(x)
+
+    def remove(self, x):
+        self._elements[self._index.pop(x)] = _hole
+        if len(self._elements) > 2*len(self._index) + 32:
+            self._elements = list(iter(self))
+            for i, y in enumerate(self._elements):
+                self._index[y] = i
+
+    def __contains__(self, x):
+        return x in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        for x in self._elements:
+            if x is not _hole:
+                yield x
+
+_hole = object()
+
+_code_attributes = ('networks', 'stations', 'locations', 'channels', 'nslc_ids')
+
+def _codesets(c):
+    if isinstance(c, trace.Trace):
+        return (c.network,), (c.station,), (c.location,), (c.channel,), (c.nslc_id,)
+    else:
+        return c.networks, c.stations, c.locations, c.channels, c.nslc_ids
+
 class TracesGroup(object):
     
     '''Trace container base class.
@@ -209,8 +420,15 @@ class TracesGroup(object):
     a collection of several traces. A TracesGroup object maintains lookup sets
     of some of the traces meta-information, as well as a combined time-range
     of its contents.
+
+    Groups with ``counting`` set (SubPile and Pile) additionally keep
+    reference counts of the codes and a :py:class:`MinMaxTracker` of the
+    time ranges of their contents. Contents can then be added and removed
+    with :py:meth:`add` and :py:meth:`remove` in time independent of the size
+    of the group, and changes are passed on to the parent incrementally.
     '''
     
+    counting = False
     
     def __init__(self, parent):
         self.parent = parent
@@ -227,8 +445,23 @@ class TracesGroup(object):
         self.networks, self.stations, self.locations, self.channels, self.nslc_ids = [ set() for x in range(5) ]
         self.tmin, self.tmax = None, None
         self.have_tuples = False
+        if self.counting:
+            self._counts = [ {} for x in _code_attributes ]
+            self._tmins = MinMaxTracker()
+            self._tmaxs = MinMaxTracker()
     
     def update(self, content, empty=True):
+        if self.counting:
+            if empty:
+                snapshot = self._snapshot()
+                self.empty()
+                self._count(content, 1, propagate=False)
+                self._propagate_diff(snapshot)
+            else:
+                self.add(content)
+
+            return
+
         if empty:
             self.empty()
         else:
@@ -265,6 +498,122 @@ class TracesGroup(object):
             self._convert_small_sets_to_tuples()
         
         self.nupdates += 1
+
+    def add(self, content):
+        '''Add traces or groups to a counting group.'''
+
+        self._count(content, 1)
+
+    def remove(self, content):
+        '''Remove traces or groups previously added to a counting group.'''
+
+        self._count(content, -1)
+
+    def update_in_parent(self, content, empty=True):
+        '''Update this group and pass the changes on to a counting parent.
+
+        To be used instead of :py:meth:`update` when the group is already
+        contained in its parent.
+        '''
+
+        snapshot = self._snapshot()
+        self.update(content, empty)
+        self._propagate_diff(snapshot)
+
+    def _count(self, content, sign, propagate=True):
+        deltas = [ {} for x in _code_attributes ]
+        tmins, tmaxs = [], []
+        for c in content:
+            for d, codes in zip(deltas, _codesets(c)):
+                for code in codes:
+                    d[code] = d.get(code, 0) + sign
+
+            tmins.append(c.tmin)
+            tmaxs.append(c.tmax)
+
+        if sign > 0:
+            self._apply_counts(deltas, tmins, tmaxs, (), (), propagate)
+        else:
+            self._apply_counts(deltas, (), (), tmins, tmaxs, propagate)
+
+    def _apply_counts(self, deltas, add_tmins, add_tmaxs, remove_tmins,
+                      remove_tmaxs, propagate=True):
+
+        snapshot_range = self.tmin, self.tmax
+        changes = [ {} for x in _code_attributes ]
+        for k, counts, d, changed in zip(
+                _code_attributes, self._counts, deltas, changes):
+
+            codes = getattr(self, k)
+            for code, dn in d.iteritems():
+                if dn == 0:
+                    continue
+
+                n0 = counts.get(code, 0)
+                n = n0 + dn
+                assert n >= 0, 'removing unknown content from group'
+                if n == 0:
+                    del counts[code]
+                    codes.discard(code)
+                    changed[code] = -1
+                else:
+                    counts[code] = n
+                    if n0 == 0:
+                        codes.add(code)
+                        changed[code] = 1
+
+        for x in remove_tmins:
+            self._tmins.remove(x)
+        for x in remove_tmaxs:
+            self._tmaxs.remove(x)
+        for x in add_tmins:
+            self._tmins.add(x)
+        for x in add_tmaxs:
+            self._tmaxs.add(x)
+
+        self.tmin, self.tmax = self._tmins.min(), self._tmaxs.max()
+        self.nupdates += 1
+
+        if propagate:
+            self._propagate(changes, snapshot_range)
+
+    def _snapshot(self):
+        return [ set(getattr(self, k)) for k in _code_attributes ], \
+                self.tmin, self.tmax
+
+    def _propagate_diff(self, snapshot):
+        if self.parent is None or not self.parent.counting:
+            return
+
+        old_sets, old_tmin, old_tmax = snapshot
+        changes = []
+        for k, old in zip(_code_attributes, old_sets):
+            new = getattr(self, k)
+            changed = {}
+            for code in new:
+                if code not in old:
+                    changed[code] = 1
+
+            for code in old:
+                if code not in new:
+                    changed[code] = -1
+
+            changes.append(changed)
+
+        self._propagate(changes, (old_tmin, old_tmax))
+
+    def _propagate(self, changes, old_range):
+        parent = self.parent
+        if parent is None or not parent.counting:
+            return
+
+        # always pass on, so that update counts increase up to the pile
+        old_tmin, old_tmax = old_range
+        if (old_tmin, old_tmax) != (self.tmin, self.tmax):
+            parent._apply_counts(changes, (self.tmin,), (self.tmax,),
+                                 (old_tmin,), (old_tmax,))
+        else:
+            parent._apply_counts(changes, (), (), (), ())
     
     def notify_listeners(self, what):
         pass
@@ -272,13 +621,13 @@ class TracesGroup(object):
     def recursive_grow_update(self, content=None):
         
         if content is not None:
-            self.update(content, empty=False)
+            self.update_in_parent(content, empty=False)
         
-        if self.parent is not None:
-            self.parent.recursive_grow_update((self,))
-            
-        self.notify_listeners('update')
-    
+        group = self
+        while group is not None:
+            group.notify_listeners('update')
+            group = group.parent
+
     def recursive_full_update(self):
         assert False, 'should be implemented in derived class'
         
@@ -421,7 +770,14 @@ class MemTracesFile(TracesGroup):
         return s
 
 class TracesFile(TracesGroup):
-    def __init__(self, parent, abspath, format, substitutions=None, mtime=None):
+    def __init__(self, parent, abspath, format, substitutions=None, mtime=None, traces=None):
+        '''Create file entry, reading the trace headers from the file.
+
+        If ``traces`` is given, the headers are taken from these traces
+        instead of reading the file. This is meant for files which have
+        just been written from the given traces.
+        '''
+
         TracesGroup.__init__(self, parent)
         self.abspath = abspath
         self.format = format
@@ -429,9 +785,14 @@ class TracesFile(TracesGroup):
         self.data_loaded = False
         self.data_use_count = 0
         self.substitutions = substitutions
-        self.load_headers(mtime=mtime)
+        if traces is None:
+            self.load_headers(mtime=mtime)
+        else:
+            self.set_headers(traces, mtime=mtime)
+
         self.update(self.traces)
-        self.mtime = mtime
+        if mtime is not None:
+            self.mtime = mtime
         
     def recursive_full_update(self):
         self.update(self.traces)
@@ -453,6 +814,19 @@ class TracesFile(TracesGroup):
         self.data_loaded = False
         self.data_use_count = 0
         
+    def set_headers(self, traces, mtime=None):
+        if mtime is None:
+            self.mtime = os.stat(self.abspath)[8]
+
+        self.traces = []
+        for tr in traces:
+            tr = tr.copy(data=False)
+            tr.drop_data()
+            self.traces.append(tr)
+
+        self.data_loaded = False
+        self.data_use_count = 0
+
     def load_data(self, force=False):
         if not self.data_loaded or force:
             logger.debug('loading data from file: %s' % self.abspath)
@@ -489,7 +863,7 @@ class TracesFile(TracesGroup):
             else:
                 self.load_headers()
             
-            self.update(self.traces)
+            self.update_in_parent(self.traces)
             
             return True
             
@@ -558,14 +932,179 @@ class TracesFile(TracesGroup):
         return s
 
 
+
+class ArchiveTracesFile(TracesFile):
+    '''File of a waveform archive, registered without opening it.
+
+    Codes and time span are initially derived from the path of the file (see
+    :py:func:`parse_archive_path`), widened by ``margin`` seconds on both
+    sides, because records may extend over day boundaries. The trace headers
+    are only read when the file is first accessed, e.g. by a
+    :py:meth:`chop` touching its time span. The group information is then
+    replaced with the actual file contents, also in the parents of the file.
+
+    Until then, the file reports the widened time span as its ``tmin`` and
+    ``tmax`` and contributes no sampling intervals to :py:meth:`get_deltats`,
+    so that such queries on a pile do not open any archive files. Both are
+    corrected once the headers have been loaded.
+
+    If ``cache`` is given, headers are taken from it and stored into it as
+    with the normal loader.
+    '''
+
+    def __init__(self, parent, abspath, format, nslc, tmin, tmax,
+                 margin=3600., cache=None):
+
+        TracesGroup.__init__(self, parent)
+        self.abspath = abspath
+        self.format = format
+        self.traces = []
+        self.data_loaded = False
+        self.data_use_count = 0
+        self.substitutions = None
+        self.mtime = None
+        self.cache = cache
+        self.headers_loaded = False
+        network, station, location, channel = nslc
+        self._stub = trace.Trace(network, station, location, channel,
+                                 tmin=tmin-margin, tmax=tmax+margin, mtime=0.)
+        self.update([ self._stub ])
+
+    def _ensure_headers(self, load_data=False):
+        '''Read headers (and data if ``load_data`` is ``True``) when the
+        file is first accessed.
+
+        Returns ``False`` if the file cannot be read. It is then removed from
+        its parent.
+        '''
+
+        if self.headers_loaded:
+            return True
+
+        try:
+            mtime = os.stat(self.abspath)[8]
+            cached = None
+            if self.cache is not None:
+                cached = self.cache.get(self.abspath)
+                if cached is not None and cached.mtime != mtime:
+                    cached = None
+
+            if load_data:
+                TracesFile.load_data(self)
+            elif cached is not None:
+                self.set_headers(cached.traces, mtime=mtime)
+            else:
+                self.load_headers(mtime=mtime)
+
+        except (io.FileLoadError, OSError), e:
+            logger.warn('%s (file will be ignored)' % e)
+            self.traces = []
+
+        self.headers_loaded = True
+        if not self.traces:
+            if self.parent is not None:
+                self.parent.remove_file(self)
+
+            return False
+
+        self.mtime = mtime
+        if self.cache is not None and cached is None:
+            self.cache.put(self.abspath, TracesFile(
+                None, self.abspath, self.format, mtime=mtime,
+                traces=self.traces))
+
+        self.update_in_parent(self.traces)
+        return True
+
+    def _contents(self):
+        if self.headers_loaded:
+            return self.traces
+        else:
+            return [ self._stub ]
+
+    def recursive_full_update(self):
+        self.update(self._contents())
+
+        if self.parent is not None:
+            self.parent.recursive_full_update()
+
+        self.notify_listeners('fullupdate')
+
+    def load_data(self, force=False):
+        if not self.headers_loaded:
+            self._ensure_headers(load_data=True)
+        else:
+            TracesFile.load_data(self, force)
+
+    def reload_if_modified(self):
+        if not self.headers_loaded:
+            return False
+
+        return TracesFile.reload_if_modified(self)
+
+    def get_newest_mtime(self, tmin, tmax, trace_selector=None):
+        if not self._ensure_headers():
+            return None
+
+        return TracesFile.get_newest_mtime(self, tmin, tmax, trace_selector)
+
+    def chop(self, tmin, tmax, trace_selector=None, snap=(round,round), load_data=True):
+        if not self.headers_loaded:
+            if not self._ensure_headers(load_data=load_data):
+                return [], False
+
+            if not self.overlaps(tmin, tmax):
+                self._drop_unused_data()
+                return [], False
+
+        chopped, used = TracesFile.chop(self, tmin, tmax, trace_selector,
+                                        snap, load_data)
+        if not used:
+            self._drop_unused_data()
+
+        return chopped, used
+
+    def _drop_unused_data(self):
+        # data read together with the headers on first access, but not needed
+        if self.data_loaded and self.data_use_count == 0:
+            for tr in self.traces:
+                tr.drop_data()
+
+            self.data_loaded = False
+
+    def get_deltats(self):
+        if not self.headers_loaded:
+            return set()
+
+        return TracesFile.get_deltats(self)
+
+    def iter_traces(self):
+        if not self._ensure_headers():
+            return iter(())
+
+        return TracesFile.iter_traces(self)
+
+    def gather_keys(self, gather, selector=None):
+        '''Gather keys, using the codes and day from the path if the file
+        has not been accessed yet.'''
+
+        keys = set()
+        for trace in self._contents():
+            if selector is None or selector(trace):
+                keys.add(gather(trace))
+
+        return keys
+
     
 class FilenameAttributeError(Exception):
     pass
 
 class SubPile(TracesGroup):
+    counting = True
+
     def __init__(self, parent):
         TracesGroup.__init__(self, parent)
-        self.files = []
+        self.files = OrderedSet()
         self.empty()
         
     def recursive_full_update(self):
@@ -577,20 +1116,24 @@ class SubPile(TracesGroup):
         self.notify_listeners('fullupdate')
     
     def add_file(self, file):
-        self.files.append(file)
+        self.files.add(file)
         file.set_parent(self)
-        self.update((file,), empty=False)
+        self.add((file,))
         
     def remove_file(self, file):
-        self.files.remove(file)
-        file.set_parent(None)
-        self.update(self.files)
+        self.remove_files((file,))
     
     def remove_files(self, files):
+        files = set(files)
+        for file in files:
+            if file not in self.files:
+                raise ValueError('SubPile.remove_files: file not in subpile')
+
         for file in files:
             self.files.remove(file)
             file.set_parent(None)
-        self.update(self.files)
+
+        self.remove(files)
     
     def get_newest_mtime(self, tmin, tmax, group_selector=None, trace_selector=None):
         mtime = None
@@ -659,9 +1202,6 @@ class SubPile(TracesGroup):
         for file in self.files:
             modified |= file.reload_if_modified()
         
-        if modified:
-            self.update(self.files)
-            
         return modified
         
     def __str__(self):
@@ -680,12 +1220,15 @@ class SubPile(TracesGroup):
 
              
 class Pile(TracesGroup):
+    counting = True
+
     def __init__(self):
         TracesGroup.__init__(self, None)
         self.subpiles = {}
         self.update(self.subpiles.values())
         self.open_files = {}
         self.listeners = []
+        self._archive_caches = set()
         
     def recursive_full_update(self):
         self.update(self.subpiles.values())
@@ -704,26 +1247,49 @@ class Pile(TracesGroup):
         l = loader(filenames, fileformat, cache, filename_attributes, show_progress=show_progress)
         self.add_files(l)
         
+    def load_archive(self, path, layout='sds', fileformat='mseed', cache=None,
+                     tmin=None, tmax=None, margin=3600.):
+        '''Add files of a waveform archive without reading them.
+
+        :param path: root directory of the archive
+        :param layout: archive layout, ``'sds'`` (``YEAR/NET/STA/CHAN.D/
+            NET.STA.LOC.CHAN.D.YEAR.DAY``) or ``'bud'`` (``NET/STA/
+            STA.NET.LOC.CHAN.YEAR.DAY``)
+        :param fileformat: format of the files
+        :param cache: :py:class:`TracesFileCache` for the trace headers
+        :param tmin: if given, skip files of days ending before this time
+        :param tmax: if given, skip files of days beginning after this time
+        :param margin: time span assumed beyond the day boundaries for files
+            which have not been read yet [s]
+
+        Codes and time spans are derived from the file paths. The files are
+        read, when first touched, see :py:class:`ArchiveTracesFile`.
+        '''
+
+        if cache is not None:
+            self._archive_caches.add(cache)
+
+        self.add_files(
+            ArchiveTracesFile(None, abspath, fileformat, nslc, ftmin, ftmax,
+                              margin=margin, cache=cache)
+            for (abspath, nslc, ftmin, ftmax) in iter_archive_files(
+                path, layout, tmin, tmax))
+
     def add_files(self, files):
-        modified_subpiles = set()
         for file in files:
             subpile = self.dispatch(file)
             subpile.add_file(file)
-            modified_subpiles.add(subpile)
         
-        self.update(modified_subpiles, empty=False)
         self.notify_listeners('add')
         
     def add_file(self, file):
         subpile = self.dispatch(file)
         subpile.add_file(file)
-        self.update((file,), empty=False)
         self.notify_listeners('add')
     
     def remove_file(self, file):
         subpile = file.get_parent()
         subpile.remove_file(file)
-        self.update(self.subpiles.values())
         self.notify_listeners('remove')
         
     def remove_files(self, files):
@@ -738,7 +1304,6 @@ class Pile(TracesGroup):
         for subpile, files in subpile_files.iteritems():
             subpile.remove_files(files)
             
-        self.update(self.subpiles.values()) 
         self.notify_listeners('remove')
 
         
@@ -772,6 +1337,10 @@ class Pile(TracesGroup):
                 chopped.extend(_chopped)
                 used_files.update(_used_files)
                 
+        for cache in self._archive_caches:
+            if cache.modified:
+                cache.dump_modified()
+
         return chopped, used_files
 
     def _process_chopped(self, chopped, degap, want_incomplete, wmax, wmin, tpad):
@@ -852,6 +1421,80 @@ class Pile(TracesGroup):
                 file.drop_data()
         
         
+    def chopper_phases(self, event, stations, table, phases_begin, phases_end,
+                       offset_begin=0., offset_end=0., tpad=0., 
+                       group_selector=None, trace_selector=None,
+                       want_incomplete=True, degap=True, 
+                       keep_current_files_open=False, accessor_id=None, 
+                       snap=(round,round), load_data=True):
+
+        '''Iterate over per-station time windows given by phase arrivals.
+
+        :param event: :py:class:`pyrocko.model.Event` object
+        :param stations: list of :py:class:`pyrocko.model.Station` objects
+        :param table: :py:class:`pyrocko.cake.TravelTimeTable` object
+        :param phases_begin: phase definition(s) defining window starts
+        :param phases_end: phase definition(s) defining window ends
+        :param offset_begin: time added to the start times [s]
+        :param offset_end: time added to the end times [s]
+
+        Windows are computed with :py:func:`phase_windows`. For each station
+        with a valid window, a tuple ``(station, traces)`` is yielded, where
+        *traces* are the traces of the station cut to the window. Only
+        files containing the station and overlapping its window are
+        accessed. The remaining arguments have the same meaning as in
+        :py:meth:`chopper`.
+        '''
+
+        tmins, tmaxs = phase_windows(event, stations, table, phases_begin, 
+                                     phases_end, offset_begin, offset_end)
+
+        if accessor_id not in self.open_files:
+            self.open_files[accessor_id] = set()
+                
+        open_files = self.open_files[accessor_id]
+
+        for station, wmin, wmax in zip(stations, tmins, tmaxs):
+            if not (wmin < wmax):
+                continue
+
+            nsl = station.nsl()
+            def tsel(tr):
+                return tr.nslc_id[:3] == nsl and (
+                    trace_selector is None or trace_selector(tr))
+
+            def gsel(gr):
+                return station.station in gr.stations and (
+                    group_selector is None or group_selector(gr))
+
+            if not self.is_relevant(wmin-tpad, wmax+tpad, gsel):
+                continue
+
+            chopped, used_files = self.chop(wmin-tpad, wmax+tpad, gsel, tsel,
+                                            snap, load_data)
+
+            for file in used_files - open_files:
+                # increment datause counter on newly opened files
+                file.use_data()
+                
+            open_files.update(used_files)
+            
+            processed = self._process_chopped(chopped, degap, want_incomplete,
+                                              wmax, wmin, tpad)
+
+            yield station, processed
+
+            unused_files = open_files - used_files
+            while unused_files:
+                file = unused_files.pop()
+                file.drop_data()
+                open_files.remove(file)
+        
+        if not keep_current_files_open:
+            while open_files:
+                file = open_files.pop()
+                file.drop_data()
+
     def all(self, *args, **kwargs):
         alltraces = []
         for traces in self.chopper( *args, **kwargs ):
@@ -917,6 +1560,12 @@ class Pile(TracesGroup):
         return sorted(keys)
     
     def get_deltats(self):
+        '''Get sorted list of the sampling intervals in the pile.
+
+        Files of lazily registered archives (see :py:meth:`load_archive`)
+        only contribute, once their headers have been loaded.
+        '''
+
         deltats = set()
         for subpile in self.subpiles.values():
             deltats.update(subpile.get_deltats())
@@ -940,7 +1589,6 @@ class Pile(TracesGroup):
             modified |= subpile.reload_modified()
         
         if modified:
-            self.update(self.subpiles.values())
             self.notify_listeners('modified')
             
         return modified
@@ -982,7 +1630,8 @@ class Pile(TracesGroup):
 
 def make_pile( paths=None, selector=None, regex=None,
         fileformat = 'mseed',
-        cachedirname='/tmp/pyrocko_cache_%s' % os.environ['USER'], show_progress=True ):
+        cachedirname='/tmp/pyrocko_cache_%s' % os.environ['USER'], show_progress=True,
+        archive_layout=None ):
     
     '''Create pile from given file and directory names.
     
@@ -997,6 +1646,10 @@ def make_pile( paths=None, selector=None, regex=None,
     :param cachedirname: loader cache is stored under this directory. It is
         created as neccessary.
     :param show_progress: show progress bar and other progress information
+    :param archive_layout: if given (``'sds'`` or ``'bud'``), *paths* are
+        root directories of archives with this layout, whose files are
+        registered without reading them, see :py:meth:`Pile.load_archive`.
+        *selector* and *regex* are ignored in this case.
     '''
     if isinstance(paths, str):
         paths = [ paths ]
@@ -1004,6 +1657,15 @@ def make_pile( paths=None, selector=None, regex=None,
     if paths is None:
         paths = sys.argv[1:]
     
+    if archive_layout is not None:
+        cache = get_cache(cachedirname)
+        p = Pile()
+        for path in paths:
+            p.load_archive(path, layout=archive_layout, fileformat=fileformat,
+                           cache=cache)
+
+        return p
+
     fns = util.select_files(paths, selector, regex, show_progress=show_progress)
 
     cache = get_cache(cachedirname)
@@ -754,11 +754,7 @@ def MakePileOverviewClass(base):
             
             self.connect( self.menu, SIGNAL('triggered(QAction*)'), self.update )
 
-            deltats = self.pile.get_deltats()
-            if deltats:
-                self.min_deltat = min(deltats)
-            else:
-                self.min_deltat = 0.01
+            self.update_min_deltat()
                 
             self.time_projection = Projection()
             self.set_time_range(self.pile.get_tmin(), self.pile.get_tmax())
@@ -959,8 +955,8 @@ def MakePileOverviewClass(base):
                 return None
         
         def set_origin(self, location):
-            for station in self.stations.values():
-                station.set_event_relative_data(location)
+            pyrocko.model.set_stations_event_relative_data(
+                self.stations.values(), location)
             self.sortingmode_change()
         
         def toggletest(self, checked):
@@ -1067,6 +1063,15 @@ def MakePileOverviewClass(base):
         
         def pile_changed(self, what):
             self.pile_has_changed = True
+
+        def update_min_deltat(self):
+            # lazily loaded archive files contribute no sampling intervals
+            # until their headers are read, so this is refreshed on changes
+            deltats = self.pile.get_deltats()
+            if deltats:
+                self.min_deltat = min(deltats)
+            else:
+                self.min_deltat = 0.01
            
         def set_gathering(self, gather=None, order=None, color=None):
             
@@ -1149,12 +1154,22 @@ def MakePileOverviewClass(base):
         def write_markers(self):
             fn = QFileDialog.getSaveFileName(self,)
             if fn:
-                Marker.save_markers(self.markers, fn)
+                fn = str(fn)
+                format = 'text'
+                if fn.endswith('.npz'):
+                    format = 'binary'
+
+                Marker.save_markers(self.markers, fn, format=format)
 
         def write_selected_markers(self):
             fn = QFileDialog.getSaveFileName(self,)
             if fn:
-                Marker.save_markers(self.selected_markers(), fn)
+                fn = str(fn)
+                format = 'text'
+                if fn.endswith('.npz'):
+                    format = 'binary'
+
+                Marker.save_markers(self.selected_markers(), fn, format=format)
 
         def read_markers(self):
             fn = QFileDialog.getOpenFileName(self,)
@@ -1836,6 +1851,7 @@ def MakePileOverviewClass(base):
     
             if self.pile_has_changed:
                 if not self.sortingmode_change_delayed():
+                    self.update_min_deltat()
                     self.sortingmode_change()
                     
                     if self.menuitem_showboxes.isChecked():
@@ -1,5 +1,6 @@
-import subprocess, re, calendar, time, os, signal, sys, logging
-import trace
+import subprocess, re, calendar, time, os, signal, sys, logging, socket, struct
+from xml.etree import ElementTree
+import trace, mseed
 import numpy as num
 
 logger = logging.getLogger('pyrocko.slink')
@@ -120,3 +121,315 @@ class SlowSlink:
     def got_trace(self, tr):
         logger.info('Got trace from slinktool: %s' % tr)
         
+
+class SeedLinkError(SlowSlinkError):
+    pass
+
+def _decode_records(records):
+    '''Decode list of raw miniSEED records into traces.'''
+
+    return mseed.from_bytes(''.join(records))
+
+def _text_record_payload(record):
+    '''Get text content of a miniSEED log record, as used for INFO.'''
+
+    nchars, = struct.unpack('>H', record[30:32])
+    offset, = struct.unpack('>H', record[44:46])
+    return record[offset:offset+nchars]
+
+class SeedLink:
+    '''SeedLink client, talking the protocol directly over a socket.
+
+    This is a replacement for :py:class:`SlowSlink`, which does not need
+    the external ``slinktool`` program. Data packets are received as binary
+    miniSEED records and decoded with :py:mod:`pyrocko.mseed_ext`. Streams
+    of several stations are requested in multi-station mode.
+
+    The sequence number of the last packet received from each station is
+    remembered, so that data transfer continues where it stopped when the
+    connection is started again. With ``state_filename``, this state is
+    loaded on creation and saved whenever the acquisition stops.
+    '''
+
+    packet_size = 520
+    record_size = 512
+
+    def __init__(self, host='geofon.gfz-potsdam.de', port=18000, timeout=10.,
+                 state_filename=None):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.running = False
+        self.stream_selectors = []
+        self.state_filename = state_filename
+        self._selectors = {}    # keys: (net, sta), values: list of selectors
+        self._station_order = []
+        self._sequence = {}     # keys: (net, sta), values: last sequence no.
+        self._socket = None
+        self._buf = ''
+        if state_filename is not None and os.path.exists(state_filename):
+            self.load_state(state_filename)
+
+    def _connect(self):
+        try:
+            self._socket = socket.create_connection(
+                (self.host, self.port), self.timeout)
+        except socket.error, e:
+            raise SeedLinkError('Cannot connect to SeedLink server %s:%i: %s'
+                                % (self.host, self.port, e))
+
+        self._buf = ''
+
+    def _close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except socket.error:
+                pass
+
+            self._socket = None
+
+    def _send(self, command):
+        logger.debug('Sending to SeedLink server: %s' % command)
+        try:
+            self._socket.sendall(command + '\r\n')
+        except socket.error, e:
+            raise SeedLinkError('Sending command "%s" failed: %s'
+                                % (command, e))
+
+    def _recv(self):
+        try:
+            data = self._socket.recv(65536)
+        except socket.timeout:
+            return None
+        except socket.error, e:
+            raise SeedLinkError('Receiving from SeedLink server failed: %s' % e)
+
+        if not data:
+            raise SeedLinkError('Connection closed by SeedLink server')
+
+        self._buf += data
+        return data
+
+    def _readline(self):
+        while '\r\n' not in self._buf:
+            if self._recv() is None:
+                raise SeedLinkError('Timeout while waiting for response')
+
+        line, self._buf = self._buf.split('\r\n', 1)
+        return line
+
+    def _command(self, command):
+        self._send(command)
+        response = self._readline()
+        if response != 'OK':
+            raise SeedLinkError('Command "%s" failed, server response: %s'
+                                % (command, response))
+
+    def _hello(self):
+        self._send('HELLO')
+        version = self._readline()
+        organization = self._readline()
+        logger.debug('Connected to %s (%s)' % (version, organization))
+
+    def query_streams(self):
+        '''Get list of ``(network, station, location, channel)`` of the data
+        streams available on the server.'''
+
+        self._connect()
+        try:
+            self._hello()
+            self._send('INFO STREAMS')
+            text = []
+            while True:
+                while len(self._buf) < self.packet_size:
+                    if self._recv() is None:
+                        raise SeedLinkError(
+                            'Timeout while waiting for INFO response')
+
+                packet = self._buf[:self.packet_size]
+                self._buf = self._buf[self.packet_size:]
+                if not packet.startswith('SLINFO'):
+                    raise SeedLinkError('Unexpected packet in INFO response')
+
+                text.append(_text_record_payload(packet[8:]))
+                if packet[7] != '*':
+                    break
+
+        finally:
+            self._close()
+
+        try:
+            root = ElementTree.fromstring(''.join(text))
+        except Exception, e:
+            raise SeedLinkError('Cannot parse INFO response: %s' % e)
+
+        streams = []
+        for station in root.findall('station'):
+            net, sta = station.get('network'), station.get('name')
+            for stream in station.findall('stream'):
+                if stream.get('type', 'D') == 'D':
+                    streams.append((net, sta, stream.get('location', ''),
+                                    stream.get('seedname')))
+
+        return streams
+
+    def _add_selector(self, network, station, selector):
+        k = network, station
+        if k not in self._selectors:
+            self._selectors[k] = []
+            self._station_order.append(k)
+
+        if selector and selector not in self._selectors[k]:
+            self._selectors[k].append(selector)
+
+    def add_stream(self, network, station, location, channel):
+        self.stream_selectors.append(
+            '%s_%s:%s%s.D' % (network, station, location, channel))
+        self._add_selector(network, station, '%s%s.D' % (location, channel))
+
+    def add_raw_stream_selector(self, stream_selector):
+        '''Add stream selector in ``slinktool`` syntax, e.g.
+        ``'GE_APE:BHZ.D BHN.D,GE_WLF'``.'''
+
+        self.stream_selectors.append(stream_selector)
+        for item in stream_selector.split(','):
+            toks = item.strip().split(':', 1)
+            net, sta = toks[0].split('_')
+            selectors = []
+            if len(toks) == 2:
+                selectors = toks[1].split()
+
+            self._add_selector(net, sta, None)
+            for selector in selectors:
+                self._add_selector(net, sta, selector)
+
+    def acquisition_start(self):
+        assert not self.running
+        self._connect()
+        try:
+            self._hello()
+            for (net, sta) in self._station_order:
+                self._command('STATION %s %s' % (sta, net))
+                for selector in self._selectors[net, sta]:
+                    self._command('SELECT %s' % selector)
+
+                if (net, sta) in self._sequence:
+                    self._command('DATA %06X' %
+                                  ((self._sequence[net, sta] + 1) % 0x1000000))
+                else:
+                    self._command('DATA')
+
+            self._send('END')
+
+        except SeedLinkError:
+            self._close()
+            raise
+
+        self.running = True
+
+    def acquisition_stop(self):
+        self.acquisition_request_stop()
+
+    def acquisition_request_stop(self):
+        if not self.running:
+            return
+
+        self.running = False
+        self._close()
+        if self.state_filename is not None:
+            self.save_state(self.state_filename)
+
+    def process(self):
+        '''Receive available data packets and pass the decoded traces on to
+        :py:meth:`got_trace`.
+
+        Returns ``False`` when the server has closed the connection or ended
+        the data transfer, ``True`` otherwise.
+        '''
+
+        if len(self._buf) < self.packet_size and \
+                not self._buf.startswith(('END', 'ERROR')):
+            try:
+                if self._recv() is None:
+                    return True
+
+            except SeedLinkError, e:
+                logger.warn(str(e))
+                return False
+
+        records = []
+        ended = False
+        while True:
+            if self._buf.startswith('END'):
+                ended = True
+                break
+
+            if self._buf.startswith('ERROR'):
+                logger.error('SeedLink server reported an error')
+                ended = True
+                break
+
+            if len(self._buf) < self.packet_size:
+                break
+
+            packet = self._buf[:self.packet_size]
+            self._buf = self._buf[self.packet_size:]
+            if not packet.startswith('SL'):
+                logger.error('Invalid SeedLink packet received')
+                ended = True
+                break
+
+            if packet.startswith('SLINFO'):
+                continue
+
+            record = packet[8:]
+            try:
+                seq = int(packet[2:8], 16)
+            except ValueError:
+                logger.warn('Invalid SeedLink sequence number')
+                continue
+
+            sta = record[8:13].strip()
+            net = record[18:20].strip()
+            self._sequence[net, sta] = seq
+            records.append(record)
+
+        if records:
+            try:
+                traces = _decode_records(records)
+            except mseed.MSeedError, e:
+                logger.error('Decoding miniSEED data failed: %s' % e)
+                traces = []
+
+            for tr in traces:
+                self.got_trace(tr)
+
+        return not ended
+
+    def get_state(self):
+        '''Get dict with the last sequence numbers, by ``(network,
+        station)``.'''
+
+        return dict(self._sequence)
+
+    def save_state(self, filename):
+        f = open(filename, 'w')
+        try:
+            for (net, sta), seq in sorted(self._sequence.items()):
+                f.write('%s %s %06X\n' % (net, sta, seq))
+        finally:
+            f.close()
+
+    def load_state(self, filename):
+        f = open(filename, 'r')
+        try:
+            for line in f:
+                toks = line.split()
+                if len(toks) == 3:
+                    self._sequence[toks[0], toks[1]] = int(toks[2], 16)
+        finally:
+            f.close()
+
+    def got_trace(self, tr):
+        logger.info('Got trace from SeedLink server: %s' % tr)
@@ -1,4 +1,4 @@
-from pyrocko import pile, trace, util, io, iris_ws, model
+from pyrocko import pile, trace, util, io, iris_ws, model, mseed
 from pyrocko.gui_util import EventMarker
 import sys, os, math, time, urllib2, logging
 import numpy as num
@@ -53,8 +53,7 @@ class IrisData(Snuffling):
         networks = set( [ s.network for s in stations ] )
         
         t2s = util.time_to_str
-        dir = self.tempdir()
-        fns = []
+        all_traces = []
         for net in networks:
             nstations = [ s for s in stations if s.network == net ]
             selection = sorted(iris_ws.data_selection( nstations, tmin, tmax ))
@@ -64,24 +63,13 @@ class IrisData(Snuffling):
 
                 try:
                     d = iris_ws.ws_bulkdataselect(selection)
-                    fn = pjoin(dir,'data-%s.mseed' % net) 
-                    f = open(fn, 'w')
-                    f.write(d)
-                    f.close()
-                    fns.append(fn)
+                    all_traces.extend(mseed.from_bytes(d))
 
                 except urllib2.HTTPError:
                     pass
 
-        all_traces = []
-        for fn in fns:
-            try:
-                traces = list(io.load(fn))
-
-                all_traces.extend(traces)
-
-            except io.FileLoadError, e:
-                logger.warning('File load error, %s' % e)
+                except mseed.MSeedError, e:
+                    logger.warning('Cannot decode data of network %s: %s' % (net, e))
         
         if all_traces:
             newstations = []
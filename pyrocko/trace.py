@@ -754,54 +754,52 @@ class Trace(object):
         
         '''
         y = self.ydata
-        above =  num.where(y > threshold, 1, 0)
-        deriv = num.zeros(y.size, dtype=num.int8)
+        n = y.size
+        above = num.where(y > threshold, 1, 0)
+        deriv = num.zeros(n, dtype=num.int8)
         deriv[1:] = above[1:]-above[:-1]
         itrig_positions = num.nonzero(deriv>0)[0]
-        tpeaks = []
-        apeaks = []
+        
+        # search windows [ibeg, iend) and their maxima, for all candidates
+        nsearch = tsearch/self.deltat
+        iends = num.minimum(n, (itrig_positions + nsearch).astype(num.int64))
+        # the maxima are above threshold (or nan, as with num.argmax)
+        candidates = num.nonzero(above | num.isnan(y))[0]
+        ipeaks = _windowed_argmax(y, itrig_positions, iends, candidates)
+        if isinstance(self.tmin, Nano):
+            tpeaks_all = [ self.tmin + i*self.deltat for i in ipeaks.tolist() ]
+        else:
+            tpeaks_all = (self.tmin + ipeaks*self.deltat).tolist()
+        
+        if deadtime:
+            logy = None
+            nblock = nblock_duration_detection
+        
+        # sequential part, on plain lists to keep it cheap
+        accepted = []
         tzeros = []
         tzero = self.tmin
-        
-        for itrig_pos in itrig_positions:
-            ibeg = itrig_pos
-            iend = min(len(self.ydata), itrig_pos + tsearch/self.deltat)
-            ipeak = num.argmax(y[ibeg:iend])
-            tpeak = self.tmin + (ipeak+ibeg)*self.deltat
-            apeak = y[ibeg+ipeak]
-
+        for j, (ibeg, tpeak) in enumerate(zip(itrig_positions.tolist(), 
+                                              tpeaks_all)):
             if tpeak < tzero:
                 continue
 
             if deadtime:
-                ibeg = itrig_pos
-                iblock = 0
-                nblock = nblock_duration_detection
-                totalsum = 0. 
-                while True:
-                    if ibeg+iblock*nblock >= len(y):
-                        tzero = self.tmin + (len(y)-1)* self.deltat
-                        break
-
-                    logy = num.log(y[ibeg+iblock*nblock:ibeg+(iblock+1)*nblock])
-                    logy[0] += totalsum
-                    ysum = num.cumsum(logy)
-                    totalsum = ysum[-1]
-                    below = num.where(ysum <= 0., 1, 0)
-                    deriv = num.zeros(ysum.size, dtype=num.int8)
-                    deriv[1:] = below[1:]-below[:-1]
-                    izero_positions = num.nonzero(deriv>0)[0] + iblock*nblock
-                    if len(izero_positions) > 0:
-                        tzero = self.tmin + (ibeg + izero_positions[0])*self.deltat
-                        break
-                    iblock += 1
+                if logy is None:
+                    olderr = num.seterr(divide='ignore', invalid='ignore')
+                    logy = num.log(y)
+                    num.seterr(**olderr)
+
+                tzero = self.tmin + _deadtime_end(logy, ibeg, nblock)*self.deltat
             else:
                 tzero = ibeg*self.deltat + self.tmin + tsearch
 
-            tpeaks.append(tpeak)
-            apeaks.append(apeak)
+            accepted.append(j)
             tzeros.append(tzero)
-        
+
+        tpeaks = [ tpeaks_all[j] for j in accepted ]
+        apeaks = y[ipeaks[accepted]].tolist()
+
         if deadtime:
             return tpeaks, apeaks, tzeros
         else:
@@ -918,7 +916,9 @@ class Trace(object):
         ``channel``, ``tmin`` (time of first sample), ``tmax`` (time of last
         sample), ``tmin_ms``, ``tmax_ms``, ``tmin_us``, ``tmax_us``. The
         versions with '_ms' include milliseconds, the versions with '_us'
-        include microseconds.
+        include microseconds. ``tmin_year``, ``tmin_jday``, ``tmax_year``,
+        and ``tmax_jday`` give year and day of year, as used e.g. in SDS
+        archives.
         '''
 
         params = dict(zip( ('network', 'station', 'location', 'channel'), self.nslc_id))
@@ -928,6 +928,8 @@ class Trace(object):
         params['tmax_ms'] = util.time_to_str(self.tmax, format='%Y-%m-%d_%H-%M-%S.3FRAC')
         params['tmin_us'] = util.time_to_str(self.tmin, format='%Y-%m-%d_%H-%M-%S.6FRAC')
         params['tmax_us'] = util.time_to_str(self.tmax, format='%Y-%m-%d_%H-%M-%S.6FRAC')
+        params['tmin_year'], params['tmin_jday'] = util.time_to_str(self.tmin, format='%Y %j').split()
+        params['tmax_year'], params['tmax_jday'] = util.time_to_str(self.tmax, format='%Y %j').split()
         params.update(additional)
         return template % params
 
@@ -1888,6 +1890,75 @@ def yulewalker(x, order):
     
     return num.dot(num.linalg.inv(a),-d)
 
+def _windowed_argmax(y, ibegs, iends, candidates, nmax_chunk=1000000):
+    '''Get position of first maximum of *y* in windows [ibeg, iend).
+
+    Only the (sorted) sample indices in *candidates* are considered, which
+    must include the maximum of every window.
+    '''
+
+    ipeaks = ibegs.copy()
+    if ibegs.size == 0 or candidates.size == 0:
+        return ipeaks
+
+    ycand = y[candidates]
+    if ycand.dtype.kind == 'f':
+        fill = -num.inf
+    else:
+        fill = num.iinfo(ycand.dtype).min
+
+    kbegs = candidates.searchsorted(ibegs)
+    kends = candidates.searchsorted(iends)
+    nwin = max(1, int(num.max(kends - kbegs)))
+    nchunk = max(1, nmax_chunk // nwin)
+    offsets = num.arange(nwin)
+    for ichunk in xrange(0, ibegs.size, nchunk):
+        kb = kbegs[ichunk:ichunk+nchunk]
+        ke = kends[ichunk:ichunk+nchunk]
+        ind = kb[:,num.newaxis] + offsets[num.newaxis,:]
+        outside = ind >= ke[:,num.newaxis]
+        vals = ycand[num.minimum(ind, ycand.size-1)]
+        vals[outside] = fill
+        k = kb + num.argmax(vals, axis=1)
+        inside = ke > kb
+        ipeaks[ichunk:ichunk+nchunk][inside] = candidates[k[inside]]
+
+    return ipeaks
+
+def _deadtime_end(logy, ibeg, nblock):
+    '''Find where the running sum of *logy* from *ibeg* on falls to zero.
+
+    Crossings at the start of a block of *nblock* samples are ignored, as in
+    the original blockwise implementation of :py:meth:`Trace.peaks`.
+    '''
+
+    n = logy.size
+    nchunk = nblock*10
+    ipos = ibeg
+    totalsum = 0.
+    last_above = None
+    while ipos < n:
+        chunk = logy[ipos:ipos+nchunk].copy()
+        chunk[0] += totalsum
+        ysum = num.cumsum(chunk)
+        totalsum = ysum[-1]
+        below = ysum <= 0.
+        cross = num.zeros(ysum.size, dtype=num.bool)
+        cross[1:] = below[1:] & ~below[:-1]
+        if last_above is not None:
+            cross[0] = below[0] and last_above
+
+        cross[(num.arange(ipos, ipos+ysum.size) - ibeg) % nblock == 0] = False
+        icross = num.nonzero(cross)[0]
+        if icross.size > 0:
+            return ipos + icross[0]
+
+        last_above = not below[-1]
+        ipos += ysum.size
+        nchunk *= 2
+
+    return n-1
+
 def moving_avg(x,n):
     n = int(n)
     cx = x.cumsum()
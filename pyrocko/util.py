@@ -370,6 +370,10 @@ def str_to_time(s, format='%Y-%m-%d %H:%M:%S.OPTFRAC'):
     number of digits are present in the fractional seconds.
     '''
         
+    s, format, fracsec = _split_fracsec(s, format)
+    return calendar.timegm(time.strptime(s, format)) + fracsec
+
+def _split_fracsec(s, format):
     fracsec = 0.
     fixed_endings = '.FRAC', '.1FRAC', '.2FRAC', '.3FRAC'
     
@@ -394,9 +398,8 @@ def str_to_time(s, format='%Y-%m-%d %H:%M:%S.OPTFRAC'):
         
         if dotpos != -1:
             s = s[:dotpos]
-      
-    return calendar.timegm(time.strptime(s, format)) + fracsec
 
+    return s, format, fracsec
 
 def time_to_str(t, format='%Y-%m-%d %H:%M:%S.3FRAC'):
     '''Get string representation for floating point system time.
@@ -434,6 +437,263 @@ def time_to_str(t, format='%Y-%m-%d %H:%M:%S.3FRAC'):
     
     return time.strftime(format, time.gmtime(ts))
     
+_time_field_widths = { 'Y': 4, 'm': 2, 'd': 2, 'j': 3, 'H': 2, 'M': 2, 'S': 2 }
+
+# value ranges accepted by strptime for zero padded fields
+_time_field_ranges = {
+    'Y': (1, 9999), 'm': (1, 12), 'd': (1, 31), 'j': (1, 366),
+    'H': (0, 23), 'M': (0, 59), 'S': (0, 61) }
+
+_re_time_directive = re.compile(r'(\.[1-9]FRAC)|%(.)')
+
+def _time_format_layout(format):
+    '''Split time format into fixed width fields.
+
+    Returns list of ``(key, width)`` tuples, where key is a time directive
+    letter, ``'FRAC'`` or ``None`` for a literal character given as width.
+    Returns ``None`` if the format contains anything else than the
+    numeric directives and the first ``'.xFRAC'``.
+    '''
+
+    layout = []
+    pos = 0
+    have_frac = False
+    for m in _re_time_directive.finditer(format):
+        sfrac, k = m.groups()
+        if sfrac and have_frac:
+            continue
+
+        layout.extend([ (None, c) for c in format[pos:m.start()] ])
+        if sfrac:
+            layout.append((None, '.'))
+            layout.append(('FRAC', int(sfrac[1])))
+            have_frac = True
+        elif k == '%':
+            layout.append((None, '%'))
+        elif k in _time_field_widths:
+            layout.append((k, _time_field_widths[k]))
+        else:
+            return None
+
+        pos = m.end()
+
+    layout.extend([ (None, c) for c in format[pos:] ])
+    return layout
+
+def _days_from_civil(y, m, d):
+    y = y - (m <= 2)
+    era = y // 400
+    yoe = y - era*400
+    doy = (153*(m + num.where(m > 2, -3, 9)) + 2)//5 + d - 1
+    doe = yoe*365 + yoe//4 - yoe//100 + doy
+    return era*146097 + doe - 719468
+
+def _civil_from_days(z):
+    z = z + 719468
+    era = z // 146097
+    doe = z - era*146097
+    yoe = (doe - doe//1460 + doe//36524 - doe//146096) // 365
+    doy = doe - (365*yoe + yoe//4 - yoe//100)
+    mp = (5*doy + 2)//153
+    d = doy - (153*mp + 2)//5 + 1
+    m = mp + num.where(mp < 10, 3, -9)
+    y = yoe + era*400 + (m <= 2)
+    return y, m, d
+
+def _str_to_time_array_fixed(strings, format):
+    fixed_endings = '.FRAC', '.1FRAC', '.2FRAC', '.3FRAC'
+    iend = _endswith_n(format, fixed_endings)
+    if iend != -1:
+        bformat = format[:-len(fixed_endings[iend])]
+    elif format.endswith('.OPTFRAC'):
+        bformat = format[:-8]
+    else:
+        bformat = format
+
+    layout = _time_format_layout(bformat)
+    if layout is None:
+        return None
+
+    keys = [ k for (k, w) in layout ]
+    if 'FRAC' in keys or ('j' in keys and ('m' in keys or 'd' in keys)):
+        return None
+
+    a = num.asarray(strings)
+    if a.dtype.kind != 'S' or a.ndim != 1 or a.itemsize == 0:
+        return None
+
+    n = a.size
+    b = a.view(num.uint8).reshape((n, a.itemsize))
+    if num.any(b == 0):
+        # strings of unequal length
+        return None
+
+    nbase = sum([ (w, 1)[k is None] for (k, w) in layout ])
+    ndigits = b.shape[1] - nbase - 1
+    if iend != -1 or format.endswith('.OPTFRAC'):
+        if ndigits >= 0:
+            if num.any(b[:,nbase] != ord('.')) or ndigits > 15:
+                return None
+
+        elif iend != -1 or num.any(b == ord('.')):
+            return None
+
+        if iend > 0 and ndigits != iend or iend == 0 and ndigits < 1:
+            return None
+
+    elif ndigits != -1:
+        return None
+
+    digits = b.astype(num.int64) - ord('0')
+    times = num.zeros(n, dtype=num.float)
+    if ndigits > 0:
+        frac = digits[:,nbase+1:]
+        if num.any((frac < 0) | (frac > 9)):
+            return None
+
+        times += num.dot(frac, 10**num.arange(ndigits-1,-1,-1)) / \
+                 float(10**ndigits)
+
+    cols = {}
+    pos = 0
+    for (k, w) in layout:
+        if k is None:
+            if num.any(b[:,pos] != ord(w)):
+                return None
+
+            pos += 1
+            continue
+
+        x = digits[:,pos:pos+w]
+        if num.any((x < 0) | (x > 9)):
+            return None
+
+        v = num.dot(x, 10**num.arange(w-1,-1,-1))
+        vmin, vmax = _time_field_ranges[k]
+        if k in cols or num.any((v < vmin) | (v > vmax)):
+            return None
+
+        cols[k] = v
+        pos += w
+
+    if 'Y' not in cols:
+        return None
+
+    ones = num.ones(n, dtype=num.int64)
+    zeros = ones * 0
+    y = cols['Y']
+    if 'j' in cols:
+        days = _days_from_civil(y, ones, ones) + cols['j'] - 1
+    else:
+        d = cols.get('d', ones)
+        days = _days_from_civil(y, cols.get('m', ones), d)
+        if num.any(_civil_from_days(days)[2] != d):
+            return None
+
+    times += days*(24*60*60) + cols.get('H', zeros)*(60*60) + \
+             cols.get('M', zeros)*60 + cols.get('S', zeros)
+
+    return times
+
+def str_to_time_array(strings, format='%Y-%m-%d %H:%M:%S.OPTFRAC'):
+    '''Convert sequence of strings representing UTC times to system times.
+
+    :param strings: sequence of strings representing UTC time
+    :param format: time string format
+    :returns: numpy array with system time stamps as floating point values
+
+    Gives the same results as calling :py:func:`str_to_time` on each
+    element, including the handling of fractional seconds. If the format is
+    made up of the numeric directives ``%Y``, ``%m``, ``%d``, ``%j``,
+    ``%H``, ``%M`` and ``%S`` and all strings are zero-padded to the same
+    length, the strings are decoded with numpy in one go, which is much
+    faster than calling :py:func:`time.strptime` for every element.
+    Otherwise, elements are converted one by one.
+    '''
+
+    if len(strings) == 0:
+        return num.zeros(0, dtype=num.float)
+
+    times = _str_to_time_array_fixed(strings, format)
+    if times is not None:
+        return times
+
+    return num.array([ str_to_time(s, format) for s in strings ],
+                     dtype=num.float)
+
+def time_to_str_array(times, format='%Y-%m-%d %H:%M:%S.3FRAC'):
+    '''Get string representations for array of floating point system times.
+
+    :param times: sequence or numpy array of floating point system times
+    :param format: time string format
+    :returns: list of strings representing UTC times
+
+    Gives the same results as calling :py:func:`time_to_str` on each
+    element. If the format is made up of the numeric directives ``%Y``,
+    ``%m``, ``%d``, ``%j``, ``%H``, ``%M``, ``%S`` and ``'.xFRAC'`` only,
+    the strings are assembled with numpy in one go. Otherwise, elements are
+    converted one by one.
+    '''
+
+    if isinstance(format, int):
+        format = '%Y-%m-%d %H:%M:%S.'+str(format)+'FRAC'
+
+    t = num.asarray(times, dtype=num.float)
+    layout = _time_format_layout(format)
+    if t.size == 0 or layout is None:
+        return [ time_to_str(x, format) for x in t ]
+
+    ts = num.floor(t)
+    cols = {}
+    for (k, ndigits) in layout:
+        if k == 'FRAC':
+            tfrac = t - ts
+            scaled = tfrac * 10**ndigits
+            ifrac = num.round(scaled).astype(num.int64)
+
+            # where rounding is ambiguous, use the formatting of time_to_str
+            ffmt = '%.' + str(ndigits) + 'f'
+            for i in num.where(num.abs(scaled - num.floor(scaled) - 0.5) < 1e-6)[0]:
+                x = ffmt % tfrac[i]
+                ifrac[i] = int(x[0]) * 10**ndigits + int(x[2:])
+
+            carry = ifrac == 10**ndigits
+            ts[carry] += 1.
+            ifrac[carry] = 0
+            cols['FRAC'] = ifrac
+
+    its = ts.astype(num.int64)
+    days = its // (24*60*60)
+    secs = its - days*(24*60*60)
+    y, mo, d = _civil_from_days(days)
+    if num.any((y < 1900) | (y > 9999)):
+        return [ time_to_str(x, format) for x in t ]
+
+    cols.update({
+        'Y': y,
+        'm': mo,
+        'd': d,
+        'j': days - _days_from_civil(y, mo*0+1, d*0+1) + 1,
+        'H': secs // (60*60),
+        'M': (secs // 60) % 60,
+        'S': secs % 60 })
+
+    nchars = sum([ (w, 1)[k is None] for (k, w) in layout ])
+    b = num.zeros((t.size, nchars), dtype=num.uint8)
+    pos = 0
+    for (k, w) in layout:
+        if k is None:
+            b[:,pos] = ord(w)
+            pos += 1
+        else:
+            v = cols[k]
+            for i in xrange(w):
+                b[:,pos+i] = (v // 10**(w-1-i)) % 10 + ord('0')
+
+            pos += w
+
+    return b.view('S%i' % nchars).ravel().tolist()
+
 def plural_s(n):
     if n == 1:
         return ''
@@ -844,6 +1104,9 @@ class TableWriter:
 
         self._f.write( ' '.join(out).rstrip() + '\n')
 
+_re_table_special = re.compile(r'["\\#]')
+_re_table_token = re.compile(r"(?:[^\s']+|'[^']*')+")
+
 class TableReader:
     
     '''Read table of space separated values from a file.
@@ -867,6 +1130,15 @@ class TableReader:
         if not line:
             self.eof = True
             return []
+
+        if not _re_table_special.search(line) and line.count("'") % 2 == 0:
+            # no escapes or comments and only simple quoting: regex
+            # tokenization is equivalent to shlex but much faster
+            if "'" not in line:
+                return line.split()
+
+            return [ x.replace("'", '') for x in _re_table_token.findall(line) ]
+
         s = shlex.shlex(line, posix=True)
         s.whitespace_split = True
         s.whitespace = ' \t\n\r\f\v' # compatible with re's \s
@@ -0,0 +1,229 @@
+'''Benchmarks for the ray tracing in :py:mod:`pyrocko.cake`.
+
+Run as script to time path discovery, arrival computation, ray path
+subdivision and model building. Each benchmark runs in a forked child
+process, so that its peak memory usage can be reported separately. With
+``--output FILE``, a line per benchmark is appended to a report file,
+tagged with the current git commit, so that timings can be compared across
+commits, e.g. with ``sort -k2 FILE``.
+'''
+
+import os, sys, time, copy, subprocess, traceback
+from optparse import OptionParser
+import numpy as num
+from pyrocko import cake, crust2x2, util
+
+km = 1000.
+
+# number of rays used in zxt_path_subdivided benchmarks
+nrays_subdivided = 20
+
+# coarse whole earth model in TauP's 'named discontinuity' format, in the
+# spirit of ak135
+earth_nd = '''
+   0.00   5.800  3.460  2.720
+  20.00   5.800  3.460  2.720
+  20.00   6.500  3.850  2.920
+  35.00   6.500  3.850  2.920
+mantle
+  35.00   8.040  4.480  3.320
+ 210.00   8.300  4.520  3.430
+ 410.00   9.030  4.870  3.530
+ 410.00   9.360  5.080  3.850
+ 660.00  10.200  5.610  3.990
+ 660.00  10.790  5.960  4.380
+1000.00  11.420  6.350  4.590
+2000.00  12.760  6.970  5.080
+2891.00  13.660  7.280  5.550
+outer-core
+2891.00   8.000  0.000  9.900
+4000.00   9.240  0.000 11.290
+5150.00  10.290  0.000 12.170
+inner-core
+5150.00  11.040  3.500 12.760
+6371.00  11.260  3.670 13.010
+'''
+
+earth_phases = [ cake.PhaseDef(x) for x in (
+    'P', 'p', 'S', 's', 'pP', 'sP', 'PP', 'SS', 'Pv(moho)p', 'Pv(cmb)p',
+    'Sv(cmb)s', 'P(moho)s', 'P<(moho)') ]
+
+crust_phases = [ cake.PhaseDef(x) for x in (
+    'P', 'p', 'S', 's', 'pP', 'Pv(moho)p', 'P(moho)s') ]
+
+# locations for crustal profiles without water layer: continental, shield,
+# orogen, basin and range
+crust_locations = [ (50., 10.), (60., 100.), (30., 90.), (40., -117.) ]
+
+def earth_model():
+    return cake.LayeredModel.from_scanlines(cake.read_nd_model_str(earth_nd))
+
+def crust_model(lat, lon):
+    profile = crust2x2.get_profile(lat, lon)
+    return cake.LayeredModel.from_scanlines(
+        cake.from_crust2x2_profile(profile, depthmantle=100*km))
+
+def timeit(f, setup=None, duration=1.0):
+    '''Get average run time of f(setup()), excluding the time of setup.'''
+
+    def once():
+        args = ()
+        if setup is not None:
+            args = (setup(),)
+
+        b = time.time()
+        f(*args)
+        return time.time() - b
+
+    once()
+    n = 0
+    t = 0.
+    while t < duration:
+        t += once()
+        n += 1
+
+    return t/n
+
+def run_forked(f):
+    '''Run f in a child process, get its result and peak memory usage [kB].'''
+
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        try:
+            os.write(wfd, repr(f()))
+        except:
+            traceback.print_exc()
+
+        os._exit(0)
+
+    os.close(wfd)
+    result = ''
+    while True:
+        s = os.read(rfd, 1024)
+        if not s:
+            break
+        result += s
+
+    os.close(rfd)
+    _, status, rusage = os.wait4(pid, 0)
+    if not result:
+        raise Exception('benchmark failed in child process')
+
+    return float(result), rusage.ru_maxrss
+
+def benchmarks(models, zstart, duration):
+    '''Generate names and functions of the benchmarks.'''
+
+    for name, (mod, phases, distances) in sorted(models.items()):
+        def gather_paths(mod=mod, phases=phases):
+            return timeit(
+                lambda m: m.gather_paths(phases, zstart=zstart),
+                setup=lambda: copy.deepcopy(mod), duration=duration)
+
+        yield '%s.gather_paths' % name, gather_paths
+
+        for refine in (False, True):
+            def arrivals(mod=mod, phases=phases, distances=distances,
+                         refine=refine):
+                mod.gather_paths(phases, zstart=zstart)
+                return timeit(
+                    lambda: mod.arrivals(distances, phases, zstart=zstart,
+                                         refine=refine),
+                    duration=duration)
+
+            yield '%s.arrivals(refine=%s)' % (name, refine), arrivals
+
+        def zxt_path_subdivided(mod=mod, phases=phases, distances=distances):
+            rays = mod.arrivals(distances, phases, zstart=zstart)
+            rays = rays[::max(1, len(rays)//nrays_subdivided)]
+            def f():
+                for ray in rays:
+                    ray.zxt_path_subdivided()
+
+            return timeit(f, duration=duration)
+
+        yield '%s.zxt_path_subdivided' % name, zxt_path_subdivided
+
+    def from_crust2x2_profile():
+        profiles = [ crust2x2.get_profile(lat, lon)
+                     for (lat, lon) in crust_locations ]
+        def f():
+            for profile in profiles:
+                cake.LayeredModel.from_scanlines(
+                    cake.from_crust2x2_profile(profile))
+
+        return timeit(f, duration=duration)
+
+    yield 'crust2x2.from_crust2x2_profile', from_crust2x2_profile
+
+def git_commit():
+    try:
+        p = subprocess.Popen(['git', 'rev-parse', '--short', 'HEAD'],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        out, _ = p.communicate()
+        if p.returncode == 0:
+            return out.strip()
+
+    except OSError:
+        pass
+
+    return 'unknown'
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='python %prog [options]')
+    parser.add_option('--model', dest='model_filenames', action='append',
+                      default=[], metavar='FILE',
+                      help='additionally benchmark with model from .nd file')
+    parser.add_option('--zstart', dest='zstart', type='float', default=10.,
+                      help='source depth [km] (default: %default)')
+    parser.add_option('--ndistances', dest='ndistances', type='int',
+                      default=20,
+                      help='number of distances for arrivals (default: %default)')
+    parser.add_option('--duration', dest='duration', type='float',
+                      default=1.0,
+                      help='minimum time to spend per benchmark [s] (default: %default)')
+    parser.add_option('--filter', dest='filter', default=None,
+                      help='only run benchmarks with names containing this string')
+    parser.add_option('--output', dest='output_filename', metavar='FILE',
+                      help='append results to report file')
+
+    options, args = parser.parse_args()
+
+    num.seterr(all='ignore')
+
+    n = options.ndistances
+    models = {}
+    models['earth'] = earth_model(), earth_phases, num.linspace(1., 150., n)
+    for (lat, lon) in crust_locations:
+        models['crust2x2(%g,%g)' % (lat, lon)] = \
+                crust_model(lat, lon), crust_phases, num.linspace(0.1, 5., n)
+
+    for fn in options.model_filenames:
+        models[os.path.basename(fn)] = \
+                cake.load_model(fn), earth_phases, num.linspace(1., 150., n)
+
+    commit = git_commit()
+    tnow = util.time_to_str(time.time(), format='%Y-%m-%dT%H:%M:%S')
+    lines = []
+    for name, f in benchmarks(models, options.zstart*km, options.duration):
+
+        if options.filter is not None and options.filter not in name:
+            continue
+
+        seconds, maxrss = run_forked(f)
+        line = '%-10s %-45s %12.6f s %10i kB  %s' % (
+            commit, name, seconds, maxrss, tnow)
+
+        print line
+        sys.stdout.flush()
+        lines.append(line)
+
+    if options.output_filename:
+        f = open(options.output_filename, 'a')
+        for line in lines:
+            f.write(line + '\n')
+
+        f.close()
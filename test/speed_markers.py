@@ -0,0 +1,61 @@
+import time, tempfile, shutil, os
+from pyrocko import model, util
+from pyrocko.gui_util import Marker, EventMarker, PhaseMarker
+import numpy as num
+
+from test_gui_util import load_markers_reference
+
+def mkmarkers(n, seed=0):
+    num.random.seed(seed)
+    tmin = util.str_to_time('2012-01-01 00:00:00')
+    times = num.sort(tmin + num.random.uniform(0., 365*24*60*60., size=n))
+    nslc_ids = [ ('GE', sta, '', cha) for sta in ('APE', 'WLF', 'RUE', 'IBBN')
+                 for cha in ('BHZ', 'BHN', 'BHE') ]
+    markers = []
+    events = []
+    for i, t in enumerate(times.tolist()):
+        r = i % 10
+        if r == 0:
+            ev = model.Event(num.random.uniform(-90., 90.),
+                             num.random.uniform(-180., 180.), t,
+                             name='ev%i' % i, depth=10000., magnitude=4.5)
+            events.append(ev)
+            markers.append(EventMarker(ev))
+        elif r < 8:
+            nslc_id = nslc_ids[i % len(nslc_ids)]
+            markers.append(PhaseMarker([nslc_id], t, t, 0, event=events[-1],
+                                       phasename='P', polarity='+'))
+        else:
+            markers.append(Marker([nslc_ids[i % len(nslc_ids)]], t, t+10., 1))
+
+    return markers
+
+def timeit(f, duration=1.0):
+    f()
+    b = time.time()
+    n = 0
+    while (time.time() - b) < duration:
+        f()
+        n += 1
+    return (time.time() - b)/n
+
+if __name__ == '__main__':
+    tempdir = tempfile.mkdtemp()
+    try:
+        for n in (1000, 10000, 100000):
+            markers = mkmarkers(n)
+            fn_text = os.path.join(tempdir, 'markers.txt')
+            fn_binary = os.path.join(tempdir, 'markers.npz')
+            tsave_text = timeit(lambda: Marker.save_markers(markers, fn_text))
+            tsave_binary = timeit(lambda: Marker.save_markers(
+                markers, fn_binary, format='binary'))
+
+            told = timeit(lambda: load_markers_reference(fn_text))
+            ttext = timeit(lambda: Marker.load_markers(fn_text))
+            tbinary = timeit(lambda: Marker.load_markers(fn_binary))
+            print 'markers %7i:  save text %8.3f s  binary %8.3f s  ' \
+                  'load old %8.3f s  text %8.3f s (x%.0f)  binary %8.3f s ' \
+                  '(x%.0f)' % (n, tsave_text, tsave_binary, told, ttext,
+                               told/ttext, tbinary, told/tbinary)
+    finally:
+        shutil.rmtree(tempdir)
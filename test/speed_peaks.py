@@ -0,0 +1,84 @@
+import time
+from pyrocko import trace
+import numpy as num
+
+def peaks_reference(tr, threshold, tsearch, deadtime=False, nblock_duration_detection=100):
+    '''Loop based implementation of :py:meth:`Trace.peaks`, for comparison.'''
+
+    y = tr.ydata
+    above =  num.where(y > threshold, 1, 0)
+    deriv = num.zeros(y.size, dtype=num.int8)
+    deriv[1:] = above[1:]-above[:-1]
+    itrig_positions = num.nonzero(deriv>0)[0]
+    tpeaks = []
+    apeaks = []
+    tzeros = []
+    tzero = tr.tmin
+    
+    for itrig_pos in itrig_positions:
+        ibeg = itrig_pos
+        iend = min(len(tr.ydata), int(itrig_pos + tsearch/tr.deltat))
+        ipeak = num.argmax(y[ibeg:iend])
+        tpeak = tr.tmin + (ipeak+ibeg)*tr.deltat
+        apeak = y[ibeg+ipeak]
+
+        if tpeak < tzero:
+            continue
+
+        if deadtime:
+            ibeg = itrig_pos
+            iblock = 0
+            nblock = nblock_duration_detection
+            totalsum = 0. 
+            while True:
+                if ibeg+iblock*nblock >= len(y):
+                    tzero = tr.tmin + (len(y)-1)* tr.deltat
+                    break
+
+                logy = num.log(y[ibeg+iblock*nblock:ibeg+(iblock+1)*nblock])
+                logy[0] += totalsum
+                ysum = num.cumsum(logy)
+                totalsum = ysum[-1]
+                below = num.where(ysum <= 0., 1, 0)
+                deriv = num.zeros(ysum.size, dtype=num.int8)
+                deriv[1:] = below[1:]-below[:-1]
+                izero_positions = num.nonzero(deriv>0)[0] + iblock*nblock
+                if len(izero_positions) > 0:
+                    tzero = tr.tmin + (ibeg + izero_positions[0])*tr.deltat
+                    break
+                iblock += 1
+        else:
+            tzero = ibeg*tr.deltat + tr.tmin + tsearch
+
+        tpeaks.append(tpeak)
+        apeaks.append(apeak)
+        tzeros.append(tzero)
+    
+    if deadtime:
+        return tpeaks, apeaks, tzeros
+    else:
+        return tpeaks, apeaks
+
+def mktrace(n, seed=0):
+    num.random.seed(seed)
+    # noisy positive characteristic function, as from a STA/LTA filter
+    ydata = num.exp(num.random.normal(scale=0.5, size=n))
+    return trace.Trace(tmin=1234567890., deltat=0.01, ydata=ydata)
+
+def timeit(f, duration=1.0):
+    f()
+    b = time.time()
+    n = 0
+    while (time.time() - b) < duration:
+        f()
+        n += 1
+    return (time.time() - b)/n
+
+if __name__ == '__main__':
+    tr = mktrace(24*60*60*10)
+    for threshold, tsearch, deadtime in [(1.5, 1., False), (3., 5., False), (1.5, 1., True), (3., 5., True)]:
+        ncross = num.sum(num.diff((tr.ydata > threshold).astype(num.int8)) > 0)
+        told = timeit(lambda: peaks_reference(tr, threshold, tsearch, deadtime))
+        tnew = timeit(lambda: tr.peaks(threshold, tsearch, deadtime))
+        print 'threshold %4.1f  tsearch %4.1f  deadtime %-5s  crossings %7i:  %8.3f s -> %8.3f s  (x%.0f)' % (
+            threshold, tsearch, deadtime, ncross, told, tnew, told/tnew)
@@ -7,6 +7,10 @@ from test_moment_tensor import MomentTensorTestCase
 from test_trace import TraceTestCase
 from test_model import ModelTestCase
 from test_util import UtilTestCase
+from test_autopick import AutopickTestCase
+from test_cake import CakeTestCase
+from test_crust2x2 import Crust2x2TestCase
+from test_slink import SlinkTestCase
 
 import unittest
 
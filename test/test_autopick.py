@@ -0,0 +1,215 @@
+from pyrocko import autopick, trace, util, io, pile, config
+import unittest, tempfile, shutil
+import numpy as num
+from os.path import join as pjoin
+
+sometime = 1234567890.
+
+class AutopickTestCase(unittest.TestCase):
+
+    def makeTrace(self, n=20000, deltat=0.01):
+        num.random.seed(10)
+        ydata = num.random.normal(size=n)
+        for i in (5000, 12000):
+            ydata[i:i+500] *= 10.
+
+        return trace.Trace(station='STA', tmin=sometime, deltat=deltat,
+                           ydata=ydata)
+
+    def testSTALTAStreaming(self):
+        tr = self.makeTrace()
+
+        for method in ('classic', 'recursive', 'centered'):
+            results = []
+            if method == 'centered':
+                levels = 1.8, 1.1
+            else:
+                levels = 2.5, 1.2
+
+            for tinc in (None, 0.37, 13.3):
+                det = autopick.STALTADetector(0.5, 10., method=method, *levels)
+                if tinc is None:
+                    windows = [ tr ]
+                else:
+                    windows = []
+                    t = tr.tmin
+                    while t <= tr.tmax:
+                        windows.append(tr.chop(t, t+tinc, inplace=False, 
+                                               include_last=False))
+                        t += tinc
+
+                cfs, triggers = det.process_traces(windows)
+                triggers.extend(det.flush())
+                cf = num.concatenate([ x.get_ydata() for x in cfs ])
+                results.append((cfs[0].tmin, cf, triggers))
+
+            tmin, cf, triggers = results[0]
+            assert len(triggers) == 2
+            for tmin2, cf2, triggers2 in results[1:]:
+                assert abs(tmin - tmin2) < 1e-6
+                assert cf.size == cf2.size
+                assert num.all(num.abs(cf - cf2) < 1e-6 * cf.max())
+                assert len(triggers2) == 2
+                for a, b in zip(triggers, triggers2):
+                    assert abs(a.tmin - b.tmin) < 1e-6
+                    assert abs(a.tmax - b.tmax) < 1e-6
+
+            for trig, tonset in zip(triggers, (50., 120.)):
+                assert abs(trig.tmin - sometime - tonset) < 0.5
+
+    def testSTALTACentered(self):
+        tr = self.makeTrace()
+        ref = tr.copy()
+        ref.sta_lta_centered(0.5, 10., scalingmethod=1)
+
+        det = autopick.STALTADetector(0.5, 10., 4., method='centered')
+        cf, triggers = det.process(tr)
+        # first sample is an edge value in moving_avg
+        i = int(round((cf.tmin - ref.tmin) / ref.deltat)) + 1
+        y = ref.get_ydata()[i:i+cf.ydata.size-1] * 1000. / 50.
+        assert num.all(num.abs(cf.get_ydata()[1:] - y) < 1e-6 * y.max())
+
+    def testSTALTAOverlap(self):
+        tr = self.makeTrace()
+        det1 = autopick.STALTADetector(0.5, 10., 4., method='classic')
+        cf1, _ = det1.process(tr)
+
+        det2 = autopick.STALTADetector(0.5, 10., 4., method='classic')
+        cfs = []
+        for tmin in (0., 60., 120.):
+            cf, _ = det2.process(tr.chop(sometime + tmin, sometime + tmin + 80., 
+                                         inplace=False))
+            cfs.append(cf)
+
+        cf2 = num.concatenate([ x.get_ydata() for x in cfs ])
+        assert cf1.ydata.size == cf2.size
+        assert num.all(num.abs(cf1.ydata - cf2) < 1e-6 * cf2.max())
+
+    def testSTALTAGap(self):
+        tr = self.makeTrace()
+        self.assertRaises(autopick.AutopickError, autopick.STALTADetector,
+                          0.5, 10., 1.2, 2.5)
+
+        det = autopick.STALTADetector(0.5, 10., 2.5, 1.2)
+
+        # gap starts while the first trigger is on
+        tr1 = tr.chop(sometime, sometime + 52., inplace=False)
+        tr2 = tr.chop(sometime + 80., tr.tmax, inplace=False)
+        cf1, triggers1 = det.process(tr1)
+        assert triggers1 == []
+
+        cf2, triggers2 = det.process(tr2)
+        assert len(triggers2) == 2
+        trig = triggers2[0]
+        assert trig.truncated
+        assert abs(trig.tmin - sometime - 50.) < 0.5
+        assert trig.tmax <= tr1.tmax
+        assert not triggers2[1].truncated
+        assert abs(triggers2[1].tmin - sometime - 120.) < 0.5
+        assert det.flush() == []
+
+    def testCoincidence(self):
+        def trig(sta, tmin):
+            return autopick.Trigger(('', sta, '', 'Z'), sometime+tmin, 
+                                    sometime+tmin+5., sometime+tmin+1., 3.)
+
+        triggers = [ trig('A', 10.), trig('B', 11.), trig('C', 12.5),
+                     trig('A', 50.), trig('A', 51.), trig('D', 52.), 
+                     trig('B', 100.), trig('C', 110.) ]
+
+        coinc = autopick.CoincidenceTrigger(3., 3.)
+        assert coinc.process(triggers, sometime + 12.) == []
+        dets = coinc.process([], sometime + 200.)
+        assert len(dets) == 1
+        assert len(dets[0].triggers) == 3
+        assert dets[0].tmin == sometime + 10.
+        assert dets[0].tmax == sometime + 17.5
+
+        coinc = autopick.CoincidenceTrigger(3., 3., 
+                                            weights={('', 'D', ''): 2.})
+        coinc.process(triggers)
+        dets = coinc.flush()
+        assert [ det.weight for det in dets ] == [ 3., 3. ]
+        assert len(dets[1].triggers) == 3
+
+    def makeDetectPile(self, datadir, drift=0.):
+        config.show_progress = False
+        num.random.seed(20)
+        deltat = 0.1
+        n = 36000
+        tevents = num.arange(300., n*deltat-300., 400.)
+        traces = []
+        for ista, sta in enumerate(('A', 'B', 'C', 'D')):
+            ydata = num.random.normal(size=n) * 100.
+            for tev in tevents:
+                i = int((tev + ista*2.) / deltat)
+                ydata[i:i+100] *= 10.
+
+            # slow drift, to be removed by filtering
+            ydata += drift * num.sin(num.arange(n) * deltat * 2.*num.pi/1234.)
+            for i in xrange(0, n, 6000):
+                traces.append(trace.Trace('', sta, '', 'Z', 
+                    tmin=sometime+i*deltat, deltat=deltat, 
+                    ydata=ydata[i:i+6000].astype(num.int32)))
+
+        fns = io.save(traces, pjoin(datadir, 
+            '%(station)s-%(tmin)s.mseed'), format='mseed')
+
+        p = pile.Pile()
+        p.load_files(fns, show_progress=False)
+        return p, n, deltat, tevents
+
+    def testDetectPile(self):
+        datadir = tempfile.mkdtemp()
+        try:
+            p, n, deltat, tevents = self.makeDetectPile(datadir)
+
+            stalta = autopick.STALTADetector(2., 30., 4., 1.5)
+            coinc = autopick.CoincidenceTrigger(10., 3.)
+            results = []
+            for tblock, nprocs in ((None, 1), (1000., 1), (1000., 3)):
+                if tblock is None:
+                    tblock = n*deltat
+                    
+                dets = autopick.detect_pile(p, stalta, coinc, tblock=tblock,
+                                            tinc=400., nprocs=nprocs)
+                results.append(dets)
+
+            for dets in results:
+                assert len(dets) == tevents.size
+                for det, tev in zip(dets, tevents):
+                    assert abs(det.tmin - sometime - tev) < 1.
+                    assert len(det.get_nslc_ids()) == 4
+
+        finally:
+            shutil.rmtree(datadir)
+
+    def testDetectPilePreprocess(self):
+        datadir = tempfile.mkdtemp()
+        try:
+            p, n, deltat, tevents = self.makeDetectPile(datadir, drift=5000.)
+
+            def highpass(tr):
+                tr.highpass(4, 0.2)
+
+            stalta = autopick.STALTADetector(2., 30., 4., 1.5)
+            coinc = autopick.CoincidenceTrigger(10., 3.)
+
+            # filter transients at the window starts cause false detections
+            dets = autopick.detect_pile(p, stalta, coinc, tinc=400.,
+                                        preprocess=highpass)
+            assert len(dets) > tevents.size
+
+            dets = autopick.detect_pile(p, stalta, coinc, tinc=400.,
+                                        preprocess=highpass,
+                                        tpad_preprocess=50.)
+            assert len(dets) == tevents.size
+            for det, tev in zip(dets, tevents):
+                assert abs(det.tmin - sometime - tev) < 1.
+
+        finally:
+            shutil.rmtree(datadir)
+
+if __name__ == "__main__":
+    util.setup_logging('test_autopick', 'warning')
+    unittest.main()
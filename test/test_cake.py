@@ -0,0 +1,191 @@
+from pyrocko import cake, util
+import unittest, tempfile, shutil, os
+import numpy as num
+
+km = 1000.
+
+def simple_model():
+    mantle = cake.Material(vp=8.0*km, vs=4.5*km, rho=3300.)
+    return cake.LayeredModel.from_scanlines([
+        (0., cake.Material(vp=5.5*km, vs=3.2*km, rho=2600.), None),
+        (20*km, cake.Material(vp=6.5*km, vs=3.7*km, rho=2800.), None),
+        (35*km, cake.Material(vp=6.9*km, vs=3.9*km, rho=2900.), None),
+        (35*km, mantle, 'moho'),
+        (200*km, cake.Material(vp=8.5*km, vs=4.7*km, rho=3400.), None) ])
+
+class CakeTestCase(unittest.TestCase):
+
+    def testModelHash(self):
+        mod1 = simple_model()
+        mod2 = simple_model()
+        assert mod1.get_hash() == mod2.get_hash()
+        mod3 = mod1.copy_with_elevation(1000.)
+        assert mod1.get_hash() != mod3.get_hash()
+
+    def testInterpNonMonotonic(self):
+        xp = num.array([0., 2., 1.])
+        fp = num.array([10., 30., 50.])
+        fs = cake.interp([0.5, 1.5], xp, fp, 0)
+        expect = [ (0.5, 15.), (1.5, 25.), (1.5, 40.) ]
+        assert len(fs) == len(expect)
+        for (x, f), (xe, fe) in zip(fs, expect):
+            assert x == xe
+            assert abs(f - fe) < 1e-9
+
+    def testArrivalsGrid(self):
+        mod = simple_model()
+        phases = [ cake.PhaseDef(x) for x in ('p', 'P', 's', 'S', 'Pv(moho)p') ]
+        distances = num.linspace(0.05, 5., 40)
+        depths = num.linspace(0., 30*km, 4)
+
+        for refine in (True, False):
+            grid = mod.arrivals_grid(distances, depths, phases=phases, 
+                                     refine=refine)
+
+            assert len(grid) == depths.size
+            for z, rays in zip(depths, grid):
+                rays_ref = mod.arrivals(distances, phases=phases, zstart=z,
+                                        refine=refine)
+
+                assert len(rays) == len(rays_ref)
+                for ray, ray_ref in zip(rays, rays_ref):
+                    assert ray.path is ray_ref.path
+                    assert ray.x == ray_ref.x
+                    assert abs(ray.t - ray_ref.t) < 1e-6
+                    assert abs(ray.p - ray_ref.p) < 1e-6 * ray_ref.p
+
+    def testPathCache(self):
+        phases = [ cake.PhaseDef(x) for x in ('p', 'P', 's', 'S', 'Pv(moho)p') ]
+        distances = num.linspace(0.05, 5., 40)
+
+        mod = simple_model()
+        rays = mod.arrivals(distances, phases=phases, zstart=10*km)
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            fn = mod.pathcache_filename(tempdir)
+            mod.dump_pathcache(fn)
+            assert os.listdir(tempdir) == [ os.path.basename(fn) ]
+
+            mod2 = simple_model()
+            assert mod2.load_pathcache(fn) == len(phases)
+            assert mod2.load_pathcache(fn) == 0
+            mod2.path = None  # no path search should be needed
+            rays2 = mod2.arrivals(distances, phases=phases, zstart=10*km)
+            def summary(rays):
+                return sorted((ray.x, ray.t, ray.given_phase().definition())
+                              for ray in rays)
+
+            assert summary(rays) == summary(rays2)
+
+            mod3 = mod.copy_with_elevation(1000.)
+            assert mod3.load_pathcache(fn) == 0
+
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testGatherPathsParallel(self):
+        phases = [ cake.PhaseDef(x) for x in ('p', 'P', 's', 'S', 'Pv(moho)p') ]
+        distances = num.linspace(0.05, 5., 40)
+        depths = num.linspace(0., 30*km, 4)
+
+        def summary(rays):
+            return sorted((ray.x, ray.t, ray.given_phase().definition())
+                          for ray in rays)
+
+        mod1 = simple_model()
+        mod2 = simple_model()
+        grid1 = mod1.arrivals_grid(distances, depths, phases)
+        grid2 = mod2.arrivals_grid(distances, depths, phases, nprocs=3)
+        for rays1, rays2 in zip(grid1, grid2):
+            assert summary(rays1) == summary(rays2)
+
+        mod3 = simple_model()
+        paths = mod3.gather_paths(phases, zstart=10*km, nprocs=2)
+        assert sorted(str(path) for path in paths) == sorted(
+            str(path) for path in mod1.gather_paths(phases, zstart=10*km))
+
+    def testPathSearchArrays(self):
+        mod = simple_model()
+        phases = [ cake.PhaseDef(x) for x in 
+                   ('p', 'P', 's', 'S', 'Pv(moho)p', 'P<(moho)', 'pP', 
+                    'P(moho)s', 'Sv(moho)p') ]
+
+        def summary(paths):
+            return sorted((sorted(ps), str(path)) 
+                          for (path, ps) in paths.iteritems())
+
+        for zstart in (0., 10*km, 30*km, 100*km):
+            for phase in phases:
+                layer_start = mod.layer(zstart, -phase.direction_start())
+                layer_stop = mod.layer(0., phase.direction_stop())
+                phase = mod.adapt_phase(phase)
+                pmax = 2000.
+                paths1 = mod._find_paths_array(phase, layer_start, 
+                                               layer_stop, pmax)
+                paths2 = mod._find_paths_recursive(phase, layer_start, 
+                                                   layer_stop, pmax)
+                assert summary(paths1) == summary(paths2)
+
+    def testRayPathXTArrays(self):
+        mod = simple_model()
+        phases = [ cake.PhaseDef(x) for x in ('P', 'S', 'pP', 'P(moho)s') ]
+        paths = mod.gather_paths(phases, zstart=10*km)
+        assert len(paths) > 0
+        for path in paths:
+            p = num.linspace(path.pmin(), path.pmax(), 50)
+            endgaps = path.endgaps(10*km, 0.)
+            x1, t1 = path.xt(p, endgaps)
+            limits1 = path.xt_limits(p)
+            assert path._arrays is not None
+            path._arrays = None
+            x2, t2 = path.xt(p, endgaps)
+            limits2 = path.xt_limits(p)
+            assert num.all(x1 == x2) and num.all(t1 == t2)
+            for a, b in zip(limits1, limits2):
+                assert num.all(a == b)
+
+    def testTravelTimeTable(self):
+        mod = simple_model()
+        phases = [ cake.PhaseDef(x) for x in ('p', 'P') ]
+        distances = num.linspace(0.1, 5., 50)
+        depths = num.linspace(0., 30*km, 7)
+
+        table = cake.TravelTimeTable.build(mod, phases, distances, depths)
+
+        num.random.seed(1)
+        xs = num.random.uniform(0.2, 4.9, size=20)
+        zs = num.random.uniform(1*km, 29*km, size=20)
+        times, errors = table.interpolate(xs, zs, want_errors=True)
+        for x, z, t, e in zip(xs, zs, times, errors):
+            tref = min([ ray.t for ray in mod.arrivals([x], phases=phases, 
+                                                       zstart=z) ])
+            assert abs(t - tref) <= e + 1e-3
+
+        assert num.isnan(table.interpolate([10.], [0.])[0])
+        assert num.isnan(table.interpolate([1.], [40*km])[0])
+
+        tp = table.interpolate(xs, zs, phases=phases[1])
+        assert num.all(tp[num.isfinite(tp)] >= times[num.isfinite(tp)])
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            table2 = cake.get_traveltime_table(mod, phases, distances, depths,
+                                               cachedir=tempdir)
+            assert table2.key() == table.key()
+            fns = os.listdir(tempdir)
+            assert len(fns) == 1
+
+            table3 = cake.get_traveltime_table(mod, phases, distances, depths,
+                                               cachedir=tempdir)
+            assert table3.model_hash == mod.get_hash()
+            assert [ p.definition() for p in table3.phases ] == ['p', 'P']
+            assert num.all((table3.times == table.times) | 
+                           num.isnan(table.times))
+
+        finally:
+            shutil.rmtree(tempdir)
+
+if __name__ == "__main__":
+    util.setup_logging('test_cake', 'warning')
+    unittest.main()
@@ -0,0 +1,66 @@
+from pyrocko import crust2x2, util
+
+import unittest
+import numpy as num
+
+class Crust2x2TestCase(unittest.TestCase):
+
+    def testGetProfile(self):
+        crust2 = crust2x2.Crust2.instance()
+        p = crust2x2.get_profile(10., 20.)
+        assert p is crust2.get_profile(9.5, 21.)
+        assert p._ident == 'G2'
+        assert p.elevation() == 529.
+        assert p.crustal_thickness() == 38500.
+        assert p.get_layer(crust2x2.LUPPERCRUST) == (12500., 6200., 3600., 2800.)
+
+        # wrapping and clipping of coordinates
+        assert crust2.get_profile(10., 380.) is p
+        assert crust2.get_profile(10., -340.) is p
+        assert crust2.get_profile(95., 0.) is crust2.get_profile(90., 0.)
+
+        # water layer from elevation
+        p = crust2x2.get_profile(0., -140.)
+        assert p.elevation() < 0.
+        assert p.get_layer(crust2x2.LWATER)[0] == -p.elevation()
+
+    def testGetProfiles(self):
+        crust2 = crust2x2.Crust2.instance()
+        num.random.seed(0)
+        lats = num.concatenate((num.random.uniform(-95., 95., 1000),
+                                num.arange(-90., 91., 2.)))
+        lons = num.concatenate((num.random.uniform(-400., 400., 1000),
+                                num.arange(-180., 181., 2.)))
+
+        profiles = crust2.get_profiles(lats, lons)
+        assert len(profiles) == lats.size
+        for lat, lon, p in zip(lats, lons, profiles):
+            assert crust2.get_profile(lat, lon) is p
+
+    def testArrayQueries(self):
+        crust2 = crust2x2.Crust2.instance()
+        num.random.seed(1)
+        lats = num.random.uniform(-90., 90., 500)
+        lons = num.random.uniform(-180., 180., 500)
+        profiles = crust2.get_profiles(lats, lons)
+
+        elevation = crust2.get_elevation(lats, lons)
+        thickness = crust2.get_crustal_thickness(lats, lons)
+        averages = crust2.get_averages(lats, lons)
+        for i, p in enumerate(profiles):
+            assert elevation[i] == p.elevation()
+            assert thickness[i] == p.crustal_thickness()
+            assert tuple(x[i] for x in averages) == p.averages()
+
+        for ilayer in range(8):
+            layers = crust2.get_layers(ilayer, lats, lons)
+            for i, p in enumerate(profiles):
+                assert tuple(x[i] for x in layers) == p.get_layer(ilayer)
+
+        lats, lons = num.meshgrid(num.linspace(-90., 90., 10), 
+                                  num.linspace(-180., 180., 20))
+        assert crust2.get_crustal_thickness(lats, lons).shape == (20, 10)
+
+if __name__ == "__main__":
+    util.setup_logging('test_crust2x2', 'warning')
+    unittest.main()
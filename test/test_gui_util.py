@@ -0,0 +1,128 @@
+from pyrocko import gui_util, model, util
+from pyrocko.gui_util import Marker, EventMarker, PhaseMarker
+import unittest, tempfile, shutil, os
+from os.path import join as pjoin
+
+legacy_markers = '''# Snuffler Markers File Version 0.2
+2012-01-01 00:00:01.500  0 GE.APE..BHZ
+2012-01-01 00:00:02.000 2012-01-01 00:00:07.250         5.25  3 GE.APE..BHZ,GE.WLF.00.BHN
+2012-01-01 00:00:10.000  5 None
+event: 2012-01-01 00:00:00.000  1 q3ncahknkcg0           10.5       -20.25      12000.0  5.1 gcmt  'Event name with blanks' 'Some Region'
+event: 2012-01-01 00:05:00.000  0 1irdiutriqfvc  None         None         None         None None  None None
+phase: 2012-01-01 00:00:03.125  0 GE.APE..BHZ     q3ncahknkcg0   2012-01-01   00:00:00.000 P        +    False
+phase: 2012-01-01 00:00:04.000 2012-01-01 00:00:04.500          0.5  1 GE.WLF.00.BHN   None           None         None         S        None  True
+phase: 2012-01-01 00:00:05.000  2 GE.WLF.00.BHZ   1irdiutriqfvc  None         None         Pn       -    None
+'''
+
+def load_markers_reference(fn):
+    '''Row by row reader of the Snuffler markers file version 0.2, as used
+    before the batched time conversion was introduced.'''
+
+    markers = []
+    f = open(fn, 'r')
+    f.readline()
+    reader = util.TableReader(f)
+    while not reader.eof:
+        row = reader.readrow()
+        if not row:
+            continue
+        if row[0] == 'event:':
+            marker = EventMarker.from_attributes(row)
+        elif row[0] == 'phase:':
+            marker = PhaseMarker.from_attributes(row)
+        else:
+            marker = Marker.from_attributes(row)
+
+        markers.append(marker)
+
+    f.close()
+    return markers
+
+def make_markers():
+    t0 = util.str_to_time('2012-01-01 00:00:00')
+    ev1 = model.Event(10.5, -20.25, t0, name='Event name with blanks',
+                      depth=12000., magnitude=5.1, region='Some Region',
+                      catalog='gcmt')
+    ev2 = model.Event(None, None, t0+300., name=None)
+
+    return [
+        Marker([('GE', 'APE', '', 'BHZ')], t0+1.5, t0+1.5),
+        Marker([('GE', 'APE', '', 'BHZ'), ('GE', 'WLF', '00', 'BHN')],
+               t0+2., t0+7.25, kind=3),
+        Marker([], t0+10., t0+10., kind=5),
+        EventMarker(ev1, kind=1),
+        EventMarker(ev2),
+        PhaseMarker([('GE', 'APE', '', 'BHZ')], t0+3.125, t0+3.125, 0,
+                    event=ev1, phasename='P', polarity='+', automatic=False),
+        PhaseMarker([('GE', 'WLF', '00', 'BHN')], t0+4., t0+4.5, 1,
+                    phasename='S', automatic=True),
+        PhaseMarker([('GE', 'WLF', '00', 'BHZ')], t0+5., t0+5., 2,
+                    event_hash=ev2.get_hash(), phasename='Pn', polarity='-'),
+    ]
+
+class MarkerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def assertSameMarkers(self, markers1, markers2):
+        assert len(markers1) == len(markers2)
+        for a, b in zip(markers1, markers2):
+            assert type(a) is type(b)
+            assert a.kind == b.kind
+            assert tuple(a.nslc_ids) == tuple(b.nslc_ids)
+            assert abs(a.tmin - b.tmin) < 1e-3
+            assert abs(a.tmax - b.tmax) < 1e-3
+            if isinstance(a, EventMarker):
+                assert a.get_event_hash() == b.get_event_hash()
+                ea, eb = a.get_event(), b.get_event()
+                for k in ('lat', 'lon', 'depth', 'magnitude', 'catalog',
+                          'name', 'region'):
+                    assert getattr(ea, k) == getattr(eb, k), k
+
+            if isinstance(a, PhaseMarker):
+                ha = a._event_hash
+                if a.get_event() is not None:
+                    ha = a.get_event().get_hash()
+
+                assert ha == b._event_hash
+                assert a.get_phasename() == b.get_phasename()
+                assert a._polarity == b._polarity
+                assert bool(a._automatic) == bool(b._automatic)
+
+    def testRoundtripText(self):
+        markers = make_markers()
+        fn = pjoin(self.tempdir, 'markers.txt')
+        Marker.save_markers(markers, fn)
+        self.assertSameMarkers(markers, Marker.load_markers(fn))
+
+    def testRoundtripBinary(self):
+        markers = make_markers()
+        fn = pjoin(self.tempdir, 'markers.npz')
+        Marker.save_markers(markers, fn, format='binary')
+        f = open(fn, 'rb')
+        assert f.read(4) == gui_util._binary_markers_magic
+        f.close()
+        self.assertSameMarkers(markers, Marker.load_markers(fn))
+
+    def testLegacyFile(self):
+        fn = pjoin(self.tempdir, 'legacy.txt')
+        f = open(fn, 'w')
+        f.write(legacy_markers)
+        f.close()
+
+        markers_ref = load_markers_reference(fn)
+        markers = Marker.load_markers(fn)
+        assert len(markers) == 8
+        self.assertSameMarkers(markers_ref, markers)
+
+        fn2 = pjoin(self.tempdir, 'converted.npz')
+        Marker.save_markers(markers, fn2, format='binary')
+        self.assertSameMarkers(markers_ref, Marker.load_markers(fn2))
+
+if __name__ == '__main__':
+    util.setup_logging('test_gui_util', 'warning')
+    unittest.main()
@@ -39,6 +39,175 @@ class IOTestCase( unittest.TestCase ):
             os.remove(fn)
         shutil.rmtree(tempdir)
                 
+    def testBytesRoundtrip(self):
+        tmin = 1234567890.
+        traces1 = [ trace.Trace('NE', 'STA', '', cha, tmin=tmin, deltat=0.01,
+                                ydata=ydata)
+                    for (cha, ydata) in [
+                        ('BHZ', num.arange(5000, dtype=num.int32)),
+                        ('BHN', num.random.random(3000).astype(num.float32)),
+                        ('BHE', num.random.random(100)) ] ]
+
+        data = mseed.to_bytes(traces1)
+        assert len(data) % 4096 == 0
+        traces2 = mseed.from_bytes(data)
+        assert len(traces2) == 3
+        for tr in traces1:
+            assert tr in traces2
+
+        tempdir = tempfile.mkdtemp()
+        fn = mseed.save(traces1, pjoin(tempdir, 'data.mseed'))[0]
+        f = open(fn, 'rb')
+        data_file = f.read()
+        f.close()
+        shutil.rmtree(tempdir)
+
+        traces3 = mseed.from_bytes(buffer(data_file), getdata=False)
+        assert sorted((tr.nslc_id, tr.tmin, tr.tmax) for tr in traces3) == \
+            sorted((tr.nslc_id, tr.tmin, tr.tmax) for tr in traces2)
+        assert all(tr.ydata is None for tr in traces3)
+        assert mseed.from_bytes('') == []
+
+    def testEncodings(self):
+        tmin = 1234567890.
+        ydata = num.cumsum(num.random.randint(-5, 6, size=10000)) \
+                .astype(num.int32)
+        tr = trace.Trace('NE', 'STA', '', 'BHZ', tmin=tmin, deltat=0.01,
+                         ydata=ydata)
+
+        sizes = {}
+        for encoding in (None, 'STEIM1', 'STEIM2', 'INT32', 'FLOAT32',
+                         'FLOAT64'):
+            for record_length in (512, 1024, 4096):
+                data = mseed.to_bytes([tr], record_length=record_length,
+                                      encoding=encoding)
+                assert len(data) % record_length == 0
+                sizes[encoding, record_length] = len(data)
+                tr2, = mseed.from_bytes(data)
+                assert tr2.tmin == tr.tmin and tr2.tmax == tr.tmax
+                assert num.all(tr2.ydata == ydata)
+                if encoding is not None:
+                    assert tr2.ydata.dtype == \
+                        mseed._encoding_dtypes[encoding]
+
+        assert sizes[None, 4096] == sizes['STEIM2', 4096]
+        assert sizes['STEIM2', 4096] < sizes['STEIM1', 4096] < \
+            sizes['INT32', 4096]
+
+        # differences too large for steim2
+        tr.ydata = num.array([0, 2**30, -2**30, 0]*100, dtype=num.int32)
+        tr2, = mseed.from_bytes(mseed.to_bytes([tr]))
+        assert num.all(tr2.ydata == tr.ydata)
+
+        for encoding in ('STEIM3', 'INT16'):
+            try:
+                mseed.to_bytes([tr], encoding=encoding)
+                assert False
+            except mseed.MSeedError:
+                pass
+
+        try:
+            mseed.to_bytes([tr], record_length=1000)
+            assert False
+        except mseed.MSeedError:
+            pass
+
+        # lossy conversions to integer encodings are refused
+        for ydata in (num.array([0.4, 1.7, -2.6, 3e9]),
+                      num.array([1., 2., 3e9]),
+                      num.array([1., num.nan]),
+                      num.array([0, 2**40], dtype=num.int64)):
+            tr.ydata = ydata
+            for encoding in ('INT32', 'STEIM1', 'STEIM2'):
+                try:
+                    mseed.to_bytes([tr], encoding=encoding)
+                    assert False
+                except mseed.MSeedError:
+                    pass
+
+        # exactly representable values are fine
+        for ydata in (num.array([0., 1., -2., 2.**31-1]),
+                      num.array([0, -2**31], dtype=num.int64)):
+            tr.ydata = ydata
+            tr2, = mseed.from_bytes(mseed.to_bytes([tr], encoding='INT32'))
+            assert num.all(tr2.ydata == ydata)
+
+    def testWriter(self):
+        tmin = util.str_to_time('2012-01-01 00:00:00')
+        deltat = 10.
+        ydatas = dict((sta, num.arange(2*8640, dtype=num.int32) + i)
+                      for (i, sta) in enumerate(('STA1', 'STA2')))
+
+        tempdir = tempfile.mkdtemp()
+        template = pjoin(tempdir, '%(tmin_year)s', '%(network)s',
+                         '%(station)s', '%(channel)s.D',
+                         '%(network)s.%(station)s.%(location)s.%(channel)s'
+                         '.D.%(tmin_year)s.%(tmin_jday)s')
+
+        def write_windows(writer):
+            for iwin in xrange(48):
+                for sta in sorted(ydatas):
+                    writer.write(trace.Trace(
+                        'NE', sta, '', 'BHZ', tmin=tmin+iwin*3600.,
+                        deltat=deltat,
+                        ydata=ydatas[sta][iwin*360:(iwin+1)*360]))
+
+            return writer.close()
+
+        fns = write_windows(io.Writer(template, max_open_files=1))
+        assert len(fns) == 4
+        assert fns[0] == pjoin(tempdir, '2012', 'NE', 'STA1', 'BHZ.D',
+                               'NE.STA1..BHZ.D.2012.001')
+
+        def check(fns):
+            for fn in fns:
+                traces = trace.degapper(io.load(fn))
+                assert len(traces) == 1
+                tr = traces[0]
+                iday = int(round((tr.tmin - tmin) / (24*3600.)))
+                assert tr.tmax - tr.tmin == 24*3600. - deltat
+                ydata = ydatas[tr.station][iday*8640:(iday+1)*8640]
+                assert num.all(tr.ydata == ydata)
+
+        check(fns)
+        check(write_windows(io.Writer(template, max_open_files=3)))
+
+        sizes = [ os.stat(fn).st_size for fn in fns ]
+        write_windows(io.Writer(template, append=True))
+        assert [ os.stat(fn).st_size for fn in fns ] == \
+            [ 2*size for size in sizes ]
+
+        # windows crossing midnight are split into the day files
+        shutil.rmtree(tempdir)
+        tempdir = tempfile.mkdtemp()
+        template = pjoin(tempdir, '%(station)s.%(tmin_year)s.%(tmin_jday)s')
+        writer = io.Writer(template)
+        for iwin in xrange(6):
+            for sta in sorted(ydatas):
+                writer.write(trace.Trace(
+                    'NE', sta, '', 'BHZ', tmin=tmin+(iwin*5-2)*3600.,
+                    deltat=deltat,
+                    ydata=ydatas[sta][iwin*1800:(iwin+1)*1800]))
+
+        fns = writer.close()
+        assert sorted(os.path.basename(fn) for fn in fns) == [
+            'STA1.2011.365', 'STA1.2012.001', 'STA1.2012.002',
+            'STA2.2011.365', 'STA2.2012.001', 'STA2.2012.002' ]
+
+        for sta in sorted(ydatas):
+            ydata = []
+            for fn in sorted(fn for fn in fns if sta in fn):
+                traces = trace.degapper(io.load(fn))
+                assert len(traces) == 1
+                tr = traces[0]
+                assert util.day_start(tr.tmin) == util.day_start(tr.tmax)
+                ydata.append(tr.ydata)
+
+            ydata = num.concatenate(ydata)
+            assert num.all(ydata == ydatas[sta][:6*1800])
+
+        shutil.rmtree(tempdir)
+
     def testReadNonexistant(self):
         try:
             trs = mseed.load('/tmp/thisfileshouldnotexist')
@@ -1,4 +1,4 @@
-from pyrocko import model, io, util
+from pyrocko import model, io, util, moment_tensor
 import unittest, math, tempfile, shutil
 import numpy as num
 from os.path import join as pjoin
@@ -56,7 +56,157 @@ class ModelTestCase(unittest.TestCase):
         stations = model.load_stations(fn)
        
         shutil.rmtree(tempdir)
-        
+
+    def testEventStationMatrices(self):
+        events = [ model.Event(lat, lon) for (lat, lon) in
+                   [ (0., 0.), (45., 10.), (-30., 170.), (89., -120.) ] ]
+        stations = [ model.Station('', 'STA%i' % i, '', lat, lon) for
+                     (i, (lat, lon)) in enumerate(
+                         [ (0., 0.), (10., 20.), (-60., -170.), (45., 10.),
+                           (0., 179.) ]) ]
+
+        dist_m, dist_deg, azimuth, backazimuth = \
+                model.event_station_matrices(events, stations)
+
+        assert dist_m.shape == (len(events), len(stations))
+        for iev, ev in enumerate(events):
+            for ista, sta in enumerate(stations):
+                sta.set_event_relative_data(ev)
+                assert abs(dist_m[iev,ista] - sta.dist_m) < 1e-6
+                assert abs(dist_deg[iev,ista] - sta.dist_deg) < 1e-9
+                if sta.dist_m > 0.:
+                    assert abs(azimuth[iev,ista] - sta.azimuth) < 1e-9
+                    assert abs(backazimuth[iev,ista] - sta.backazimuth) < 1e-9
+
+        assert model.event_station_matrices(events, stations)[0] is dist_m
+
+        dist_m_sphere, dist_deg_sphere = model.event_station_matrices(
+            events, stations, accurate=False)[:2]
+        assert num.all(num.abs(dist_m_sphere - dist_m) < 0.01 * dist_m + 1.)
+
+        model.set_stations_event_relative_data(stations, events[1])
+        for ista, sta in enumerate(stations):
+            assert sta.dist_m == dist_m[1,ista]
+            assert sta.azimuth == azimuth[1,ista]
+
+        # least recently used entries are evicted first
+        for i in xrange(model._relative_data_cache_size):
+            model.event_station_matrices(events, stations)
+            model.event_station_matrices([ model.Event(float(i), 0.) ],
+                                         stations)
+
+        assert model.event_station_matrices(events, stations)[0] is dist_m
+        assert len(model._relative_data_cache) == \
+            model._relative_data_cache_size
+
+    def testGroupedUnique(self):
+        def grouped_naive(events, deltat):
+            groups = []
+            for ia, a in enumerate(events):
+                groups.append([])
+                for ib, b in enumerate(events[:ia]):
+                    if abs(b.time - a.time) < deltat:
+                        groups[ib].append(a)
+                        break
+                else:
+                    groups[ia].append(a)
+
+            return [ g for g in groups if g ]
+
+        r = num.random.RandomState(10)
+        for i in xrange(20):
+            events = [ model.Event(time=float(t)) for t in
+                       r.randint(0, 100, size=r.randint(0, 50)) ]
+            for deltat in (0.5, 1., 5.):
+                assert [ map(id, g) for g in grouped_naive(events, deltat) ] \
+                    == [ map(id, g) for g in model.Event.grouped(events, deltat) ]
+
+        events = [
+            model.Event(0., 0., 0., catalog='A', magnitude=5.0),
+            model.Event(0.1, 0., 1., catalog='B', magnitude=5.1),
+            model.Event(50., 0., 2., catalog='B', magnitude=5.0),
+            model.Event(0., 0., 3., catalog='C', magnitude=7.0),
+            model.Event(0., 0.2, 4., catalog='C') ]
+
+        assert len(model.Event.grouped(events)) == 1
+        groups = model.Event.grouped(events, distance=100e3)
+        assert [ len(g) for g in groups ] == [ 4, 1 ]
+        olderr = num.seterr(invalid='raise')
+        try:
+            groups = model.Event.grouped(events, distance=100e3,
+                                         magnitude=0.5)
+        finally:
+            num.seterr(**olderr)
+
+        assert [ len(g) for g in groups ] == [ 3, 1, 1 ]
+        unique = model.Event.unique(events, distance=100e3, magnitude=0.5)
+        assert [ ev.catalog for ev in unique ] == [ 'C', 'B', 'C' ]
+
+    def testEventCatalog(self):
+        mt = moment_tensor.MomentTensor(strike=10., dip=20., rake=30.)
+        events = [
+            model.Event(10., 20., 1000., 'ev1', depth=10e3, magnitude=5.,
+                        region='taka tuka land', catalog='A',
+                        moment_tensor=mt),
+            model.Event(-10., 179., 500., 'ev2', catalog='B'),
+            model.Event(0., -179., 2000., 'ev3', depth=600e3, magnitude=7.,
+                        catalog='A', duration=20.) ]
+
+        cat = model.EventCatalog.from_events(events)
+        assert len(cat) == 3
+        assert cat.get_strings('catalog') == [ 'A', 'B', 'A' ]
+
+        tempdir = tempfile.mkdtemp()
+        fn = pjoin(tempdir, 'events.cat')
+        cat.dump(fn)
+        cat = model.EventCatalog.load(fn)
+        shutil.rmtree(tempdir)
+
+        for a, b in zip(events, cat.get_events()):
+            for k in 'lat lon time name depth magnitude region catalog ' \
+                     'duration'.split():
+                assert getattr(a, k) == getattr(b, k)
+
+            assert (a.moment_tensor is None) == (b.moment_tensor is None)
+
+        assert num.all(cat[0].moment_tensor.m() == mt.m())
+
+        names = lambda c: [ ev.name for ev in c ]
+        assert names(cat.sorted()) == [ 'ev2', 'ev1', 'ev3' ]
+        assert names(cat.select(tmin=1000.)) == [ 'ev1', 'ev3' ]
+        assert names(cat.select(magmin=6.)) == [ 'ev3' ]
+        assert names(cat.select(catalog='A', tmax=2000.)) == [ 'ev1' ]
+        assert names(cat.select(lonmin=170., lonmax=-170.)) == [ 'ev2', 'ev3' ]
+        assert names(cat.select(lat=0., lon=180., distmax=2000e3)) == \
+            [ 'ev2', 'ev3' ]
+        assert names(cat[cat.lat > 0.]) == [ 'ev1' ]
+
+        olderr = num.seterr(invalid='raise')
+        try:
+            assert names(cat.select(magmax=6., depthmin=0.)) == [ 'ev1' ]
+        finally:
+            num.seterr(**olderr)
+
+    def testEventCatalogUnicode(self):
+        events = [
+            model.Event(10., 20., 1000., u'Z\xfcrich', region=u'\u6771\u4eac',
+                        catalog='A'),
+            model.Event(-10., 179., 500., 'plain', region='S\xc3\xa3o Paulo') ]
+
+        cat = model.EventCatalog.from_events(events)
+        tempdir = tempfile.mkdtemp()
+        try:
+            fn = pjoin(tempdir, 'events.cat')
+            cat.dump(fn)
+            cat = model.EventCatalog.load(fn)
+        finally:
+            shutil.rmtree(tempdir)
+
+        for a, b in zip(events, cat.get_events()):
+            for k in ('name', 'region', 'catalog'):
+                assert getattr(a, k) == getattr(b, k)
+                assert type(getattr(a, k)) is type(getattr(b, k))
+
 
 if __name__ == "__main__":
     util.setup_logging('test_trace', 'warning')
@@ -2,7 +2,7 @@ from pyrocko import trace, pile, io, config, util
 
 import unittest
 import numpy as num
-import tempfile, random, os
+import tempfile, random, os, shutil, time
 from random import choice as rc
 from os.path import join as pjoin
     
@@ -85,8 +85,334 @@ class PileTestCase( unittest.TestCase ):
         for tr in p.iter_all():
             print tr.ydata
             #assert( tr.ydata == num.arange(100, dtype=num.float) )
-        
-        
+
+    def testIncrementalUpdate(self):
+        def check(p):
+            groups = [ p ] + p.subpiles.values()
+            for group in groups:
+                if group is p:
+                    traces = list(p.iter_traces())
+                else:
+                    traces = list(group.iter_traces())
+
+                ref = pile.TracesGroup(None)
+                ref.update(traces)
+                for k in ('networks', 'stations', 'locations', 'channels',
+                          'nslc_ids'):
+                    assert set(getattr(group, k)) == set(getattr(ref, k))
+
+                assert (group.tmin, group.tmax) == (ref.tmin, ref.tmax)
+
+        r = random.Random(23)
+        p = pile.Pile()
+        files = []
+        for i in xrange(200):
+            tmin = r.choice((0., 40*24*3600.)) + r.randint(0, 1000)
+            traces = [ trace.Trace(rc('AB'), rc('XYZ'), rc(['', '00']),
+                                   rc('ENZ'), tmin=tmin, deltat=1.0,
+                                   ydata=num.zeros(r.randint(1, 100)))
+                       for j in xrange(r.randint(1, 3)) ]
+            files.append(pile.MemTracesFile(None, traces))
+
+        p.add_files(files[:100])
+        check(p)
+        for file in files[100:]:
+            p.add_file(file)
+
+        check(p)
+        r.shuffle(files)
+        while files:
+            n = r.randint(1, 20)
+            if n == 1:
+                p.remove_file(files[0])
+            else:
+                p.remove_files(files[:n])
+
+            files[:n] = []
+            check(p)
+            if files:
+                file = files[0]
+                tr = file.get_traces()[0].copy()
+                tr.shift(tr.tmax - tr.tmin + 1.)
+                tr.set_codes(station='GROW')
+                file.traces.append(tr)
+                file.recursive_grow_update([tr])
+                check(p)
+
+        assert p.tmin is None and p.tmax is None and not p.nslc_ids
+
+    def testRemoveFileCost(self):
+        def removal_time(nfiles):
+            p = pile.Pile()
+            files = [ pile.MemTracesFile(None, [
+                trace.Trace('', 'STA', '', 'Z', tmin=float(i), deltat=1.0,
+                            ydata=num.zeros(10)) ]) for i in xrange(nfiles) ]
+            p.add_files(files)
+            subpile = p.subpiles.values()[0]
+            assert len(subpile.files) == nfiles
+
+            removed = files[::nfiles/200][:200]
+            t0 = time.time()
+            for file in removed:
+                p.remove_file(file)
+
+            t = time.time() - t0
+
+            removed = set(removed)
+            assert list(p.iter_files()) == [
+                file for file in files if file not in removed ]
+
+            return t
+
+        tsmall = min(removal_time(500) for i in xrange(3))
+        tlarge = min(removal_time(20000) for i in xrange(3))
+        # linear cost would show up as a factor of about 40
+        assert tlarge < 5. * tsmall + 0.01
+
+    def testHamsterFixation(self):
+        from pyrocko import hamster_pile
+
+        for background_writes, max_queued_bytes in (
+                (False, None), (True, None), (True, 1)):
+
+            tempdir = tempfile.mkdtemp()
+            path = pjoin(tempdir,
+                         '%(network)s.%(station)s.%(channel)s_%(tmin)s.mseed')
+
+            cache = pile.get_cache(pjoin(tempdir, 'cache'))
+            p = hamster_pile.HamsterPile(
+                fixation_length=20., path=path, cache=cache,
+                background_writes=background_writes,
+                max_queued_bytes=max_queued_bytes)
+
+            ydata = num.arange(100, dtype=num.int32)
+            for i in xrange(10):
+                for sta in ('A', 'B'):
+                    p.insert_trace(trace.Trace(
+                        '', sta, '', 'Z', tmin=i*10., deltat=1.,
+                        ydata=ydata[i*10:(i+1)*10].copy()))
+
+            p.fixate_all()
+
+            files = list(p.iter_files())
+            assert all(isinstance(f, pile.TracesFile) for f in files)
+            assert len(files) == len(os.listdir(tempdir)) - 1
+            for file in files:
+                reloaded = pile.TracesFile(None, file.abspath, 'mseed')
+                assert [ tr.nslc_id for tr in file.traces ] == \
+                    [ tr.nslc_id for tr in reloaded.traces ]
+                assert [ (tr.tmin, tr.tmax) for tr in file.traces ] == \
+                    [ (tr.tmin, tr.tmax) for tr in reloaded.traces ]
+                assert cache.get(file.abspath) is file
+
+            for sta in ('A', 'B'):
+                traces = p.all(tmax=100.,
+                               trace_selector=lambda tr: tr.station == sta)
+                assert len(traces) == 1
+                assert num.all(traces[0].ydata == ydata)
+
+            assert (p.tmin, p.tmax) == (0., 99.)
+            if background_writes:
+                stats = p.get_writer_stats()
+                assert stats['nrequests'] == 8
+                assert stats['nfailed'] == 0 and stats['queued_bytes'] == 0
+
+            p.close()
+            shutil.rmtree(tempdir)
+
+    def testBackgroundWriterFailure(self):
+        from pyrocko import hamster_pile
+
+        def fail(requests):
+            raise Exception('simulated failure')
+
+        writer = hamster_pile.BackgroundWriter(max_queued_bytes=1)
+        writer.start()
+        coalesce_writes = hamster_pile.coalesce_writes
+        hamster_pile.coalesce_writes = fail
+        try:
+            tr = trace.Trace('', 'A', '', 'Z', tmin=0., deltat=1.,
+                             ydata=num.arange(10, dtype=num.int32))
+            writer.put(1, [ tr ], 'p', 'mseed')
+            writer.put(2, [ tr ], 'p', 'mseed')
+            writer.flush()
+        finally:
+            hamster_pile.coalesce_writes = coalesce_writes
+
+        done = writer.get_done()
+        assert sorted([ keys for (keys, traces, fns) in done ]) == [[1], [2]]
+        assert all(fns is None for (keys, traces, fns) in done)
+        stats = writer.get_stats()
+        assert stats['nfailed'] == 2 and stats['queued_bytes'] == 0
+        writer.close()
+
+    def testCoalesceWrites(self):
+        from pyrocko import hamster_pile
+
+        def tr(sta, tmin, n):
+            return trace.Trace('', sta, '', 'Z', tmin=tmin, deltat=1.,
+                               ydata=num.arange(tmin, tmin+n, dtype=num.int32))
+
+        requests = [
+            (1, [ tr('A', 10., 10) ], 'p', 'mseed'),
+            (2, [ tr('A', 0., 10), tr('B', 0., 10) ], 'p', 'mseed'),
+            (3, [ tr('A', 25., 5), tr('B', 10., 10) ], 'p', 'mseed'),
+            (4, [ tr('A', 30., 5) ], 'q', 'mseed') ]
+
+        merged = hamster_pile.coalesce_writes(requests)
+        summary = [ (keys, traces[0].station, traces[0].tmin, traces[0].tmax,
+                     path) for (keys, traces, path, format) in merged ]
+
+        assert summary == [
+            ([ 2, 1 ], 'A', 0., 19., 'p'),
+            ([ 3 ], 'A', 25., 29., 'p'),
+            ([ 2, 3 ], 'B', 0., 19., 'p'),
+            ([ 4 ], 'A', 30., 34., 'q') ]
+
+        assert num.all(merged[0][1][0].ydata == num.arange(20))
+        assert requests[1][1][0].tmax == 9.
+
+
+    def testArchive(self):
+        tmin = util.str_to_time('2012-12-31 00:00:00')
+        deltat = 10.
+        ydatas = dict((sta, num.arange(3*8640, dtype=num.int32) + i)
+                      for (i, sta) in enumerate(('STA1', 'STA2')))
+
+        layouts = {
+            'sds': pjoin('%(tmin_year)s', '%(network)s', '%(station)s',
+                         '%(channel)s.D', '%(network)s.%(station)s.'
+                         '%(location)s.%(channel)s.D.%(tmin_year)s.'
+                         '%(tmin_jday)s'),
+            'bud': pjoin('%(network)s', '%(station)s', '%(station)s.'
+                         '%(network)s.%(location)s.%(channel)s.'
+                         '%(tmin_year)s.%(tmin_jday)s') }
+
+        for layout, template in sorted(layouts.items()):
+            tempdir = tempfile.mkdtemp()
+            root = pjoin(tempdir, 'archive')
+            writer = io.Writer(pjoin(root, template))
+            for iwin in xrange(3*24):
+                for sta in sorted(ydatas):
+                    writer.write(trace.Trace(
+                        'NE', sta, '', 'BHZ', tmin=tmin+iwin*3600.,
+                        deltat=deltat,
+                        ydata=ydatas[sta][iwin*360:(iwin+1)*360]))
+
+            fns = writer.close()
+            assert len(fns) == 6
+            f = open(pjoin(os.path.dirname(fns[0]), 'README'), 'w')
+            f.write('not a data file')
+            f.close()
+
+            cache = pile.get_cache(pjoin(tempdir, 'cache'))
+            p = pile.Pile()
+            p.load_archive(root, layout, cache=cache)
+            files = list(p.iter_files())
+            assert len(files) == 6
+            assert not any(f.headers_loaded for f in files)
+            assert set(p.stations) == set(ydatas)
+            assert (p.tmin, p.tmax) == (tmin - 3600., tmin + 3*24*3600 + 3600.)
+
+            day1 = tmin + 24*3600.
+            traces, loaded = p.chop(day1 + 100., day1 + 200.)
+            assert len(traces) == 2
+            for tr in traces:
+                assert num.all(tr.ydata == ydatas[tr.station][8650:8660])
+
+            touched = [ f for f in files if f.headers_loaded ]
+            assert len(touched) == 4
+            assert not [ f for f in touched if f.tmin > day1 ]
+            assert all(f in touched for f in loaded)
+            assert all(cache.get(f.abspath) is not None for f in touched)
+            assert p.tmin == tmin
+
+            for traces in p.chopper(tmin=tmin, tmax=tmin+3*24*3600., 
+                                    tinc=24*3600.):
+                for tr in traces:
+                    iday = int(round((tr.tmin - tmin) / (24*3600.)))
+                    assert num.all(tr.ydata == ydatas[tr.station][
+                        iday*8640:(iday+1)*8640])
+
+            assert (p.tmin, p.tmax) == (tmin, tmin + 3*24*3600. - deltat)
+
+            # headers now come from the cache
+            p = pile.Pile()
+            p.load_archive(root, layout, cache=cache, tmin=day1+10.,
+                           tmax=day1+20.)
+            assert len(list(p.iter_files())) == 2
+            assert p.get_deltats() == []
+            p.chop(day1 + 10., day1 + 20.)
+            assert p.get_deltats() == [ deltat ]
+
+            # overview queries must not open any files
+            opened = []
+            load = io.load
+            def counting_load(fn, *args, **kwargs):
+                opened.append(fn)
+                return load(fn, *args, **kwargs)
+
+            io.load = counting_load
+            try:
+                p = pile.make_pile(root, archive_layout=layout,
+                                   cachedirname=pjoin(tempdir, 'cache'))
+                assert p.get_deltats() == []
+                assert p.get_tmin() == tmin - 3600.
+                assert p.get_tmax() == tmin + 3*24*3600. + 3600.
+                assert len(list(p.iter_files())) == 6
+                assert opened == []
+            finally:
+                io.load = load
+
+            shutil.rmtree(tempdir)
+
+    def testChopperPhases(self):
+        from pyrocko import cake, model
+        km = 1000.
+        mod = cake.LayeredModel.from_scanlines([
+            (0., cake.Material(vp=6.0*km, vs=3.5*km), None),
+            (30*km, cake.Material(vp=6.0*km, vs=3.5*km), None),
+            (30*km, cake.Material(vp=8.0*km, vs=4.5*km), 'moho'),
+            (200*km, cake.Material(vp=8.2*km, vs=4.6*km), None) ])
+
+        phase_p, phase_s = cake.PhaseDef('P'), cake.PhaseDef('S')
+        table = cake.TravelTimeTable.build(mod, [ phase_p, phase_s ], 
+                                           num.linspace(0., 5., 26), 
+                                           num.array([0., 20*km]))
+
+        tevent = 1234567890.
+        event = model.Event(lat=10., lon=20., time=tevent, depth=10*km)
+        stations = [ model.Station('XX', 'S%i' % i, '', lat=10.+d, lon=20.)
+                     for (i, d) in enumerate((1., 2.5, 4., 10.)) ]
+
+        p = pile.Pile()
+        for station in stations:
+            traces = [ trace.Trace(station.network, station.station, '', cha, 
+                                   tmin=tevent-100., deltat=0.5, 
+                                   ydata=num.ones(3000))
+                       for cha in ('BHZ', 'BHN') ]
+            p.add_file(pile.MemTracesFile(None, traces))
+
+        tmins, tmaxs = pile.phase_windows(event, stations, table, phase_p,
+                                          phase_s, -10., 60.)
+        assert num.all(num.isfinite(tmins[:3])) and num.isnan(tmins[3])
+        assert num.all(tmaxs[:3] > tmins[:3] + 70.)
+
+        got = []
+        for station, traces in p.chopper_phases(event, stations, table, 
+                                                phase_p, phase_s, 
+                                                offset_begin=-10., 
+                                                offset_end=60.):
+            i = stations.index(station)
+            got.append(i)
+            assert len(traces) == 2
+            for tr in traces:
+                assert tr.station == station.station
+                assert abs(tr.tmin - tmins[i]) <= tr.deltat
+                assert abs(tr.tmax + tr.deltat - tmaxs[i]) <= tr.deltat
+
+        assert got == [0, 1, 2]
+
 if __name__ == "__main__":
     util.setup_logging('test_pile', 'warning')
     unittest.main()
@@ -0,0 +1,230 @@
+from pyrocko import slink, trace, util
+import unittest, socket, struct, threading, tempfile, shutil, time, os
+import numpy as num
+from os.path import join as pjoin
+
+def pack_record(seqno, nslc, tmin, deltat, ydata, encoding=3):
+    '''Make 512 byte miniSEED record with INT32 or ASCII payload.'''
+
+    net, sta, loc, cha = nslc
+    itmin = int(tmin)
+    t = time.gmtime(itmin)
+    frac = int(round((tmin - itmin)*10000))
+    if deltat > 0.:
+        rate_factor, rate_multiplier = int(round(1.0/deltat)), 1
+    else:
+        rate_factor, rate_multiplier = 0, 0
+
+    if encoding == 0:
+        data = ydata
+    else:
+        data = num.asarray(ydata, dtype='>i4').tostring()
+
+    header = struct.pack('>6scc5s2s3s2sHHBBBBHHhhBBBBiHH',
+        '%06i' % seqno, 'D', ' ', sta.ljust(5), loc.ljust(2), cha.ljust(3),
+        net.ljust(2), t.tm_year, t.tm_yday, t.tm_hour, t.tm_min, t.tm_sec, 0,
+        frac, len(ydata), rate_factor, rate_multiplier, 0, 0, 0, 1, 0, 64, 48)
+
+    blockette = struct.pack('>HHBBBB', 1000, 0, encoding, 1, 9, 0)
+    record = header + blockette + '\0'*8 + data
+    assert len(record) <= 512
+    return record + '\0'*(512-len(record))
+
+def make_records(nslcs, tmin, deltat, nrecords, nsamples=100):
+    records = []
+    ydatas = {}
+    for nslc in nslcs:
+        ydata = num.arange(nrecords*nsamples, dtype=num.int32) + \
+                len(ydatas)*1000
+        ydatas[nslc] = ydata
+        for irec in xrange(nrecords):
+            records.append((tmin + irec*nsamples*deltat, nslc,
+                            ydata[irec*nsamples:(irec+1)*nsamples]))
+
+    records.sort()
+    return [ pack_record(i+1, nslc, t, deltat, y)
+             for (i, (t, nslc, y)) in enumerate(records) ], ydatas
+
+class ReplayServer(threading.Thread):
+    '''SeedLink stand-in, replaying 512 byte records from a miniSEED file.'''
+
+    def __init__(self, filename):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        f = open(filename, 'rb')
+        data = f.read()
+        f.close()
+        self.records = [ data[i:i+512] for i in xrange(0, len(data), 512) ]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.commands = []
+
+    def run(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+
+            try:
+                self.serve(conn)
+            finally:
+                conn.close()
+
+    def serve(self, conn):
+        f = conn.makefile('rb')
+        requested = {}
+        station = None
+        while True:
+            line = f.readline()
+            if not line:
+                return
+
+            command = line.strip()
+            self.commands.append(command)
+            toks = command.split()
+            if toks[0] == 'HELLO':
+                conn.sendall('SeedLink v3.1 (replay)\r\ntest\r\n')
+            elif toks[0] == 'INFO':
+                conn.sendall(self.info_packets())
+            elif toks[0] == 'STATION':
+                station = toks[2], toks[1]
+                requested[station] = [ [], 0 ]
+                conn.sendall('OK\r\n')
+            elif toks[0] == 'SELECT':
+                requested[station][0].append(toks[1])
+                conn.sendall('OK\r\n')
+            elif toks[0] == 'DATA':
+                if len(toks) > 1:
+                    requested[station][1] = int(toks[1], 16)
+                conn.sendall('OK\r\n')
+            elif toks[0] == 'END':
+                for i, record in enumerate(self.records):
+                    seq = i + 1
+                    k = record[18:20].strip(), record[8:13].strip()
+                    if k not in requested or seq < requested[k][1]:
+                        continue
+
+                    selectors, _ = requested[k]
+                    locc = record[13:15].strip() + record[15:18].strip()
+                    if selectors and locc + '.D' not in selectors:
+                        continue
+
+                    conn.sendall('SL%06X' % seq + record)
+
+                return
+
+    def info_packets(self):
+        stations = {}
+        for record in self.records:
+            net, sta = record[18:20].strip(), record[8:13].strip()
+            loc, cha = record[13:15].strip(), record[15:18].strip()
+            stations.setdefault((net, sta), set()).add((loc, cha))
+
+        xml = [ '<?xml version="1.0"?><seedlink software="replay">' ]
+        for (net, sta) in sorted(stations):
+            xml.append('<station name="%s" network="%s">' % (sta, net))
+            for loc, cha in sorted(stations[net, sta]):
+                xml.append('<stream location="%s" seedname="%s" type="D"/>'
+                           % (loc, cha))
+            xml.append('</station>')
+
+        xml.append('</seedlink>')
+        text = ''.join(xml)
+        chunks = [ text[i:i+400] for i in xrange(0, len(text), 400) ]
+        packets = []
+        for i, chunk in enumerate(chunks):
+            more = (' ', '*')[i < len(chunks)-1]
+            packets.append('SLINFO %s' % more + pack_record(
+                0, ('', 'INFO', '', 'LOG'), 0., 0., chunk, encoding=0))
+
+        return ''.join(packets)
+
+    def stop(self):
+        self.sock.close()
+
+class CollectingSeedLink(slink.SeedLink):
+    def __init__(self, *args, **kwargs):
+        slink.SeedLink.__init__(self, *args, **kwargs)
+        self.traces = []
+
+    def got_trace(self, tr):
+        self.traces.append(tr)
+
+def acquire(sl):
+    sl.acquisition_start()
+    while sl.process():
+        pass
+
+    sl.acquisition_stop()
+    traces = trace.degapper(sorted(sl.traces, key=lambda tr: tr.full_id))
+    return dict((tr.nslc_id, tr) for tr in traces)
+
+class SlinkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.nslcs = [ ('GE', 'APE', '', 'BHZ'), ('GE', 'APE', '', 'BHN'),
+                       ('GE', 'WLF', '00', 'BHZ') ]
+        self.deltat = 0.01
+        self.tmin = util.str_to_time('2012-01-01 00:00:00')
+        records, self.ydatas = make_records(self.nslcs, self.tmin, self.deltat,
+                                            10)
+        fn = pjoin(self.tempdir, 'replay.mseed')
+        f = open(fn, 'wb')
+        f.write(''.join(records))
+        f.close()
+        self.server = ReplayServer(fn)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tempdir)
+
+    def testQueryStreams(self):
+        sl = slink.SeedLink(host='127.0.0.1', port=self.server.port)
+        assert sorted(sl.query_streams()) == sorted(self.nslcs)
+
+    def testAcquisition(self):
+        sl = CollectingSeedLink(host='127.0.0.1', port=self.server.port)
+        sl.add_stream('GE', 'APE', '', 'BHZ')
+        sl.add_raw_stream_selector('GE_WLF')
+        traces = acquire(sl)
+        assert sorted(traces.keys()) == sorted([ self.nslcs[0], self.nslcs[2] ])
+        for nslc, tr in traces.iteritems():
+            assert tr.tmin == self.tmin
+            assert abs(tr.deltat - self.deltat) < 1e-9
+            assert num.all(tr.ydata == self.ydatas[nslc])
+
+        assert 'SELECT BHZ.D' in self.server.commands
+
+    def testResume(self):
+        statefn = pjoin(self.tempdir, 'state')
+        sl = CollectingSeedLink(host='127.0.0.1', port=self.server.port,
+                                state_filename=statefn)
+        sl.add_stream('GE', 'APE', '', 'BHZ')
+        acquire(sl)
+        state = sl.get_state()
+        assert os.path.exists(statefn)
+
+        # pretend, the last 3 packets of the stream were missed
+        seqs = [ i+1 for i, record in enumerate(self.server.records)
+                 if record[8:18] == 'APE    BHZ' ]
+        f = open(statefn, 'w')
+        f.write('GE APE %06X\n' % seqs[-4])
+        f.close()
+
+        sl = CollectingSeedLink(host='127.0.0.1', port=self.server.port,
+                                state_filename=statefn)
+        sl.add_stream('GE', 'APE', '', 'BHZ')
+        traces = acquire(sl)
+        tr = traces[self.nslcs[0]]
+        assert num.all(tr.ydata == self.ydatas[self.nslcs[0]][-300:])
+        assert sl.get_state() == state
+
+if __name__ == '__main__':
+    util.setup_logging('test_slink', 'warning')
+    unittest.main()
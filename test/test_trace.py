@@ -254,6 +254,22 @@ class TraceTestCase(unittest.TestCase):
         assert numeq( tp, [0.1, 50, 51.1, 99.9], 0.0001)
         assert numeq( ap, [1., 1., 1., 1.], 0.0001)
 
+    def testPeaksReference(self):
+        from speed_peaks import peaks_reference, mktrace
+
+        tr = mktrace(20000)
+        tr.ydata[100:110] = num.nan
+        olderr = num.seterr(divide='ignore', invalid='ignore')
+        for args in [ (1.5, 1., False), (3., 5., False), (1.5, 1., True), 
+                      (3., 5., True), (2., 0.3, True, 7) ]:
+
+            for a, b in zip(peaks_reference(tr, *args), tr.peaks(*args)):
+                a, b = num.array(a), num.array(b)
+                assert a.size == b.size
+                assert num.all((a == b) | num.isnan(a))
+
+        num.seterr(**olderr)
+
     def testCorrelate(self):
         
         for la, lb, mode, res in [
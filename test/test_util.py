@@ -1,5 +1,6 @@
 from pyrocko import mseed, trace, util, io
-import unittest, math, calendar, time
+import unittest, math, calendar, time, shlex
+from cStringIO import StringIO
 from random import random
 
 class UtilTestCase( unittest.TestCase ):
@@ -19,6 +20,40 @@ class UtilTestCase( unittest.TestCase ):
                 t2 = util.str_to_time(s, format=fmt)
                 assert abs( t1 - t2 ) < accu
 
+    def testTimeArray(self):
+
+        ta = util.str_to_time('1960-01-01 10:10:10')
+        tb = util.str_to_time('2020-01-01 10:10:10')
+        times = [ ta + random() * (tb-ta) for i in xrange(1000) ]
+        times.extend([ 0.9995, 0.0005, 1234567890.9999999 ])
+
+        for fmt in [ '%Y-%m-%d %H:%M:%S.3FRAC', '%Y-%m-%d %H:%M:%S.1FRAC', 
+                     '%Y-%m-%d %H:%M:%S', '%Y.%j.%H.%M.%S.6FRAC',
+                     '%d %b %Y %H:%M:%S' ]:
+
+            strings = [ util.time_to_str(t, format=fmt) for t in times ]
+            assert util.time_to_str_array(times, format=fmt) == strings
+            
+            pfmt = fmt.replace('.6FRAC', '.FRAC').replace('.1FRAC', '.OPTFRAC')
+            for pfmt in set([ pfmt, fmt.replace('.6FRAC', '.FRAC') ]):
+
+                t1 = [ util.str_to_time(s, format=pfmt) for s in strings ]
+                t2 = util.str_to_time_array(strings, format=pfmt)
+                assert t1 == t2.tolist()
+
+        strings = [ '2010-01-01 00:00:00', '2010-1-2 3:04:05.5', '2010-01-03 00:00:00.' ]
+        t1 = [ util.str_to_time(s) for s in strings ]
+        assert t1 == util.str_to_time_array(strings).tolist()
+        
+        for s, fmt, exc in [
+                ('2010-02-31 10:00:00', '%Y-%m-%d %H:%M:%S', ValueError),
+                ('2010-01-01 10:00:00', '%Y-%m-%d %H:%M:%S.FRAC', 
+                    util.FractionalSecondsMissing),
+                ('2010-01-01 10:00:00.12', '%Y-%m-%d %H:%M:%S.3FRAC',
+                    util.FractionalSecondsWrongNumberOfDigits) ]:
+
+            self.assertRaises(exc, util.str_to_time_array, [ s ], fmt)
+
     def testIterTimes(self):
 
         tmin = util.str_to_time('1999-03-20 20:10:10')
@@ -35,6 +70,28 @@ class UtilTestCase( unittest.TestCase ):
         assert s1 == '2001-12-01 00:00:00.000'
         assert s2 == '2002-01-01 00:00:00.000'
 
+    def testTableReader(self):
+
+        rows = [ [ 'a', 'b c', "x'y", 'None' ],
+                 [ 'event:', '2010-01-01', 'taka tuka land' ],
+                 [ 'p#q', 'r"s', 't\\u' ] ]
+
+        f = StringIO()
+        writer = util.TableWriter(f)
+        for row in rows:
+            writer.writerow(row)
+
+        for line in f.getvalue().splitlines():
+            s = shlex.shlex(line, posix=True)
+            s.whitespace_split = True
+            try:
+                expect = list(s)
+            except ValueError:
+                continue
+
+            reader = util.TableReader(StringIO(line + '\n'))
+            assert reader.readrow() == expect
+
 if __name__ == "__main__":
     util.setup_logging('test_util', 'warning')
     unittest.main()